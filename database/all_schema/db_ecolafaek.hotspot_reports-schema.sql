@@ -5,6 +5,7 @@ CREATE TABLE `hotspot_reports` (
   `hotspot_id` int(11) NOT NULL,
   `report_id` int(11) NOT NULL,
   PRIMARY KEY (`id`) /*T![clustered_index] CLUSTERED */,
+  UNIQUE KEY `uq_hotspot_reports` (`hotspot_id`,`report_id`),
   KEY `fk_1` (`hotspot_id`),
   KEY `fk_2` (`report_id`),
   CONSTRAINT `fk_1` FOREIGN KEY (`hotspot_id`) REFERENCES `db_ecolafaek`.`hotspots` (`hotspot_id`),
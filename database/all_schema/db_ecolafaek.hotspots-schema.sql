@@ -5,16 +5,21 @@ CREATE TABLE `hotspots` (
   `name` varchar(100) DEFAULT NULL,
   `center_latitude` decimal(10,8) NOT NULL,
   `center_longitude` decimal(11,8) NOT NULL,
+  `geohash` varchar(12) DEFAULT NULL,
   `radius_meters` int(11) DEFAULT NULL,
   `location_id` int(11) DEFAULT NULL,
   `first_reported` date DEFAULT NULL,
   `last_reported` date DEFAULT NULL,
   `total_reports` int(11) DEFAULT '0',
   `average_severity` decimal(5,2) DEFAULT NULL,
+  `severity_sum` decimal(12,2) NOT NULL DEFAULT '0',
+  `severity_count` int(11) NOT NULL DEFAULT '0',
+  `waste_type_counts` json DEFAULT NULL,
   `status` enum('active','monitoring','resolved') DEFAULT 'active',
   `notes` text DEFAULT NULL,
   PRIMARY KEY (`hotspot_id`) /*T![clustered_index] CLUSTERED */,
   KEY `fk_1` (`location_id`),
   KEY `idx_hotspots_location` (`center_latitude`,`center_longitude`),
+  KEY `idx_hotspots_geohash` (`geohash`),
   CONSTRAINT `fk_1` FOREIGN KEY (`location_id`) REFERENCES `db_ecolafaek`.`locations` (`location_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin AUTO_INCREMENT=450001;
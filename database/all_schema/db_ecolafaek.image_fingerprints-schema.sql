@@ -0,0 +1,11 @@
+/*!40014 SET FOREIGN_KEY_CHECKS=0*/;
+/*!40101 SET NAMES binary*/;
+CREATE TABLE `image_fingerprints` (
+  `report_id` int(11) NOT NULL,
+  `sha256` char(64) NOT NULL,
+  `dhash` bigint(20) unsigned DEFAULT NULL,
+  `created_at` datetime DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`report_id`) /*T![clustered_index] CLUSTERED */,
+  KEY `idx_image_fingerprints_sha256` (`sha256`),
+  CONSTRAINT `fk_1` FOREIGN KEY (`report_id`) REFERENCES `db_ecolafaek`.`reports` (`report_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin;
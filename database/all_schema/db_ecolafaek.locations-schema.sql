@@ -9,5 +9,6 @@ CREATE TABLE `locations` (
   `longitude` decimal(11,8) DEFAULT NULL,
   `population_estimate` int(11) DEFAULT NULL,
   `area_sqkm` decimal(10,2) DEFAULT NULL,
-  PRIMARY KEY (`location_id`) /*T![clustered_index] CLUSTERED */
+  PRIMARY KEY (`location_id`) /*T![clustered_index] CLUSTERED */,
+  KEY `idx_locations_location` (`latitude`,`longitude`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin;
@@ -5,6 +5,7 @@ CREATE TABLE `reports` (
   `user_id` int(11) DEFAULT NULL,
   `latitude` decimal(10,8) NOT NULL,
   `longitude` decimal(11,8) NOT NULL,
+  `geohash` varchar(12) DEFAULT NULL,
   `location_id` int(11) DEFAULT NULL,
   `report_date` datetime DEFAULT CURRENT_TIMESTAMP,
   `description` text DEFAULT NULL,
@@ -16,6 +17,7 @@ CREATE TABLE `reports` (
   KEY `fk_1` (`user_id`),
   KEY `fk_2` (`location_id`),
   KEY `idx_reports_location` (`latitude`,`longitude`),
+  KEY `idx_reports_geohash` (`geohash`),
   KEY `idx_reports_status` (`status`),
   KEY `idx_reports_user_id` (`user_id`),
   KEY `idx_reports_status_date` (`status`,`report_date`),
@@ -44,6 +44,7 @@ CREATE TABLE reports (
     user_id INT,
     latitude DECIMAL(10, 8) NOT NULL,
     longitude DECIMAL(11, 8) NOT NULL,
+    geohash VARCHAR(12),
     location_id INT,
     report_date DATETIME DEFAULT CURRENT_TIMESTAMP,
     description TEXT,
@@ -95,12 +96,16 @@ CREATE TABLE hotspots (
     name VARCHAR(100),
     center_latitude DECIMAL(10, 8) NOT NULL,
     center_longitude DECIMAL(11, 8) NOT NULL,
+    geohash VARCHAR(12),
     radius_meters INT,
     location_id INT,
     first_reported DATE,
     last_reported DATE,
     total_reports INT DEFAULT 0,
     average_severity DECIMAL(5, 2),
+    severity_sum DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    severity_count INT NOT NULL DEFAULT 0,
+    waste_type_counts JSON,
     status ENUM('active', 'monitoring', 'resolved') DEFAULT 'active',
     notes TEXT,
     FOREIGN KEY (location_id) REFERENCES locations(location_id)
@@ -111,6 +116,7 @@ CREATE TABLE hotspot_reports (
     id INT AUTO_INCREMENT PRIMARY KEY,
     hotspot_id INT NOT NULL,
     report_id INT NOT NULL,
+    UNIQUE KEY uq_hotspot_reports (hotspot_id, report_id),
     FOREIGN KEY (hotspot_id) REFERENCES hotspots(hotspot_id),
     FOREIGN KEY (report_id) REFERENCES reports(report_id)
 );
@@ -170,6 +176,15 @@ CREATE TABLE image_processing_queue (
     FOREIGN KEY (report_id) REFERENCES reports(report_id)
 );
 
+-- Fingerprints of analyzed photos for reusing the analysis of duplicates
+CREATE TABLE image_fingerprints (
+    report_id INT PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL,
+    dhash BIGINT UNSIGNED,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (report_id) REFERENCES reports(report_id)
+);
+
 CREATE TABLE user_verifications (
     verification_id INT AUTO_INCREMENT PRIMARY KEY,
     user_id INT NOT NULL,
@@ -236,6 +251,9 @@ CREATE INDEX IF NOT EXISTS idx_reports_location ON reports(latitude, longitude);
 CREATE INDEX IF NOT EXISTS idx_reports_status ON reports(status);
 CREATE INDEX IF NOT EXISTS idx_analysis_report ON analysis_results(report_id);
 CREATE INDEX IF NOT EXISTS idx_hotspots_location ON hotspots(center_latitude, center_longitude);
+CREATE INDEX IF NOT EXISTS idx_locations_location ON locations(latitude, longitude);
+CREATE INDEX IF NOT EXISTS idx_reports_geohash ON reports(geohash);
+CREATE INDEX IF NOT EXISTS idx_hotspots_geohash ON hotspots(geohash);
 CREATE INDEX IF NOT EXISTS idx_dashboard_stats_date ON dashboard_statistics(stat_date);
 CREATE INDEX IF NOT EXISTS idx_reports_user_id ON reports(user_id);
 
@@ -243,4 +261,5 @@ CREATE INDEX IF NOT EXISTS idx_admin_users_username ON admin_users(username);
 CREATE INDEX IF NOT EXISTS idx_admin_users_email ON admin_users(email);
 CREATE INDEX IF NOT EXISTS idx_reports_status_date ON reports(status, report_date);
 CREATE INDEX IF NOT EXISTS idx_analysis_results_date ON analysis_results(analyzed_date);
+CREATE INDEX IF NOT EXISTS idx_image_fingerprints_sha256 ON image_fingerprints(sha256);
 CREATE INDEX IF NOT EXISTS idx_system_settings_key ON system_settings(setting_key);
\ No newline at end of file
@@ -310,10 +310,15 @@ class ApiService {
     double radius = 5.0,
     int page = 1,
     int perPage = 10,
+    String? cursor,
   }) async {
     try {
+      // Pass pagination.next_cursor from the previous page to continue scrolling
+      final pageQuery = cursor != null
+          ? 'cursor=${Uri.encodeQueryComponent(cursor)}'
+          : 'page=$page';
       final response = await http.get(
-        Uri.parse('$apiBaseUrl/api/reports/nearby?lat=$latitude&lon=$longitude&radius=$radius&page=$page&per_page=$perPage'),
+        Uri.parse('$apiBaseUrl/api/reports/nearby?lat=$latitude&lon=$longitude&radius=$radius&$pageQuery&per_page=$perPage'),
         headers: _getHeaders(token: token),
       );
       
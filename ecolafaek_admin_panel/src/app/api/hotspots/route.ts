@@ -1,6 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server'
-import { executeQuery } from '@/lib/db'
+import { executeQuery, withTransaction } from '@/lib/db'
 import { verifyToken } from '@/lib/auth'
+import { geohashEncode } from '@/lib/utils'
 
 interface Hotspot {
   hotspot_id: number
@@ -210,12 +211,14 @@ export async function POST(request: NextRequest) {
     
     // Create new hotspot
     const insertQuery = `
-      INSERT INTO hotspots (name, center_latitude, center_longitude, radius_meters, notes, status, total_reports, average_severity, first_reported, last_reported)
-      VALUES (?, ?, ?, ?, ?, 'active', 0, 0, NOW(), NOW())
+      INSERT INTO hotspots (name, center_latitude, center_longitude, geohash, radius_meters, notes, status, total_reports, average_severity, first_reported, last_reported)
+      VALUES (?, ?, ?, ?, ?, ?, 'active', 0, 0, NOW(), NOW())
     `
     
     const result = await executeQuery(insertQuery, [
-      name, center_latitude, center_longitude, radius_meters, description || null
+      name, center_latitude, center_longitude,
+      geohashEncode(Number(center_latitude), Number(center_longitude)),
+      radius_meters, description || null
     ])
     
     // Log the action
@@ -338,11 +341,16 @@ export async function DELETE(request: NextRequest) {
       )
     }
     
-    // Delete associated hotspot_reports first
-    await executeQuery('DELETE FROM hotspot_reports WHERE hotspot_id = ?', [hotspotId])
-    
-    // Delete the hotspot
-    await executeQuery('DELETE FROM hotspots WHERE hotspot_id = ?', [hotspotId])
+    // The whole row goes, aggregates included, so there is nothing to adjust.
+    // If its reports still form a cluster, the mobile backend recreates the
+    // hotspot on the next report there or at the next recluster_hotspots.py --apply
+    await withTransaction(async (conn) => {
+      // Delete associated hotspot_reports first
+      await conn.execute('DELETE FROM hotspot_reports WHERE hotspot_id = ?', [hotspotId])
+
+      // Delete the hotspot
+      await conn.execute('DELETE FROM hotspots WHERE hotspot_id = ?', [hotspotId])
+    })
     
     // Log the action
     try {
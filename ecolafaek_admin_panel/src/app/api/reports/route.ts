@@ -1,6 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server'
-import { executeQuery } from '@/lib/db'
+import { executeQuery, withTransaction } from '@/lib/db'
 import { verifyToken } from '@/lib/auth'
+import type { Connection } from 'mysql2/promise'
 
 interface ReportExport {
   report_id: number
@@ -52,6 +53,78 @@ interface WasteType {
   name: string
 }
 
+interface LatestAnalysis {
+  severity_score: number | null
+  waste_type: string | null
+}
+
+interface LinkedHotspot {
+  hotspot_id: number
+  total_reports: number
+}
+
+// Matches HOTSPOT_MIN_REPORTS in the mobile backend: smaller hotspots are removed
+const HOTSPOT_MIN_REPORTS = parseInt(process.env.HOTSPOT_MIN_REPORTS || '3')
+
+// Takes a report out of its hotspots the way unlink_report() in the mobile
+// backend does, keeping total_reports, the severity sum/count/average and the
+// waste type histogram in step; hotspots left below HOTSPOT_MIN_REPORTS go
+async function unlinkReport(conn: Connection, reportId: string) {
+  const [analyses] = await conn.execute(
+    `SELECT a.severity_score, w.name AS waste_type
+     FROM analysis_results a
+     LEFT JOIN waste_types w ON a.waste_type_id = w.waste_type_id
+     WHERE a.report_id = ?
+     ORDER BY a.analysis_id DESC
+     LIMIT 1`,
+    [reportId]
+  )
+  const analysis = (analyses as LatestAnalysis[])[0]
+  const severity = analysis?.severity_score ?? null
+  const wasteTypePath = analysis?.waste_type ? `$.${JSON.stringify(analysis.waste_type)}` : null
+
+  const [hotspots] = await conn.execute(
+    `SELECT h.hotspot_id, h.total_reports
+     FROM hotspots h
+     JOIN hotspot_reports hr ON h.hotspot_id = hr.hotspot_id
+     WHERE hr.report_id = ?
+     FOR UPDATE`,
+    [reportId]
+  )
+  for (const hotspot of hotspots as LinkedHotspot[]) {
+    const newCount = hotspot.total_reports - 1
+    if (newCount < HOTSPOT_MIN_REPORTS) {
+      await conn.execute('DELETE FROM hotspot_reports WHERE hotspot_id = ?', [hotspot.hotspot_id])
+      await conn.execute('DELETE FROM hotspots WHERE hotspot_id = ?', [hotspot.hotspot_id])
+      continue
+    }
+
+    const assignments = ['total_reports = ?']
+    const params: unknown[] = [newCount]
+    if (severity !== null) {
+      // In this order so each expression still sees the old sum and count
+      assignments.push(
+        'average_severity = CASE WHEN severity_count > 1 THEN (severity_sum - ?) / (severity_count - 1) ' +
+          'WHEN severity_count = 1 THEN NULL ELSE average_severity END',
+        'severity_sum = IF(severity_count > 0, severity_sum - ?, severity_sum)',
+        'severity_count = GREATEST(severity_count - 1, 0)'
+      )
+      params.push(severity, severity)
+    }
+    if (wasteTypePath) {
+      assignments.push(
+        'waste_type_counts = JSON_SET(waste_type_counts, ?, ' +
+          'GREATEST(COALESCE(JSON_EXTRACT(waste_type_counts, ?), 0) - 1, 0))'
+      )
+      params.push(wasteTypePath, wasteTypePath)
+    }
+    await conn.execute(
+      `UPDATE hotspots SET ${assignments.join(', ')} WHERE hotspot_id = ?`,
+      [...params, hotspot.hotspot_id]
+    )
+  }
+}
+
 export async function GET(request: NextRequest) {
   try {
     const authResult = await verifyToken(request)
@@ -302,14 +375,22 @@ export async function DELETE(request: NextRequest) {
       )
     }
     
-    // Delete analysis results first (foreign key constraint)
-    await executeQuery('DELETE FROM analysis_results WHERE report_id = ?', [reportId])
-    
-    // Delete hotspot associations
-    await executeQuery('DELETE FROM hotspot_reports WHERE report_id = ?', [reportId])
-    
-    // Delete the report
-    await executeQuery('DELETE FROM reports WHERE report_id = ?', [reportId])
+    await withTransaction(async (conn) => {
+      // Shrink or remove the hotspots that include this report (needs its analysis)
+      await unlinkReport(conn, reportId)
+
+      // Delete analysis results first (foreign key constraint)
+      await conn.execute('DELETE FROM analysis_results WHERE report_id = ?', [reportId])
+
+      // Delete hotspot associations
+      await conn.execute('DELETE FROM hotspot_reports WHERE report_id = ?', [reportId])
+
+      // Delete the duplicate photo fingerprint (foreign key constraint)
+      await conn.execute('DELETE FROM image_fingerprints WHERE report_id = ?', [reportId])
+
+      // Delete the report
+      await conn.execute('DELETE FROM reports WHERE report_id = ?', [reportId])
+    })
     
     // Log the action
     try {
@@ -38,6 +38,24 @@ export async function executeQuery<T>(query: string, params: unknown[] = []): Pr
   }
 }
 
+// Runs work in a transaction on a connection of its own, so queries other
+// requests send through executeQuery() can't land inside it
+export async function withTransaction<T>(work: (conn: mysql.Connection) => Promise<T>): Promise<T> {
+  const conn = await mysql.createConnection(dbConfig)
+  try {
+    await conn.beginTransaction()
+    const result = await work(conn)
+    await conn.commit()
+    return result
+  } catch (error) {
+    await conn.rollback()
+    console.error('Database transaction error:', error)
+    throw error
+  } finally {
+    await conn.end()
+  }
+}
+
 export async function closeConnection() {
   if (connection) {
     await connection.end()
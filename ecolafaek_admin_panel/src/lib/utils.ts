@@ -17,4 +17,37 @@ export function formatDate(date: string | Date) {
 
 export function formatNumber(num: number) {
   return new Intl.NumberFormat().format(num)
-}
\ No newline at end of file
+}
+
+const GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+// Geohash cell of a point; matches geohash_encode() in the mobile backend so
+// hotspots created here carry the same geohash in its data export
+export function geohashEncode(latitude: number, longitude: number, precision = 9) {
+  const latRange = [-90, 90]
+  const lonRange = [-180, 180]
+  let hash = ""
+  let bits = 0
+  let bitCount = 0
+  let even = true
+
+  while (hash.length < precision) {
+    const value = even ? longitude : latitude
+    const range = even ? lonRange : latRange
+    const mid = (range[0] + range[1]) / 2
+    if (value >= mid) {
+      bits = (bits << 1) | 1
+      range[0] = mid
+    } else {
+      bits = bits << 1
+      range[1] = mid
+    }
+    even = !even
+    if (++bitCount === 5) {
+      hash += GEOHASH_BASE32[bits]
+      bits = 0
+      bitCount = 0
+    }
+  }
+  return hash
+}
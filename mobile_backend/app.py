@@ -7,16 +7,14 @@ import requests
 import re
 import asyncio
 from io import BytesIO
-from typing import List, Dict, Optional, Any, Union
+from typing import List, Dict, Optional, Any, Union, Tuple
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, UploadFile, File, Form, Body, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.routing import Match
 from pydantic import BaseModel, Field, EmailStr
 import boto3
-import mysql.connector
-from mysql.connector import Error
-from dbutils.pooled_db import PooledDB
 import jwt
 import hashlib
 import random
@@ -24,10 +22,9 @@ import string
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from dotenv import load_dotenv
-import numpy as np
 from bedrock_agentcore import BedrockAgentCoreApp
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -119,6 +116,10 @@ def cleanup_s3_charts():
         except Exception as e:
             logger.error(f"Error cleaning up S3 charts: {e}")
 
+# Fork the image preprocessing workers while this is still the only thread
+from image_prep import PreparedImage, image_preprocessor
+image_preprocessor.start()
+
 # Start cleanup task in background thread
 cleanup_thread = threading.Thread(target=cleanup_s3_charts, daemon=True)
 cleanup_thread.start()
@@ -165,41 +166,47 @@ EMAIL_PASS = os.getenv('EMAIL_PASS')
 EMAIL_SERVER = os.getenv('EMAIL_SERVER')
 EMAIL_PORT = int(os.getenv('EMAIL_PORT', '587'))
 
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'database': os.getenv('DB_NAME', 'tl_waste_monitoring'),
-    'user': os.getenv('DB_USER', 'root'),
-    'password': os.getenv('DB_PASSWORD', ''),
-    'port': int(os.getenv('DB_PORT', '3306'))
-}
+# Database access layer (connection pool + awaitable query helpers)
+from db import (
+    db_session, execute_prepared, run_db, run_read_db, fetch_one, fetch_all, execute,
+    measure_round_trips, RoundTripMeter,
+    pool_monitors, checkout_tracker, idle_pinger, statement_cache,
+    query_stats, current_route
+)
+from geo import RadiusFilter, geohash_encode
+from location_index import location_index
+from map_clusters import Viewport, fetch_map_view, grid_cache
+from hotspot_engine import hotspot_engine, unlink_report, update_hotspots
+from export import EXPORT_FORMATS, build_export_query, export_slots, stream_export
+from image_fetch import DownloadedImage, ImageDownloadError, image_downloader
+from blob_cache import image_blobs
+from waste_analysis import AnalysisFailed, analyze_waste
+from image_dedup import image_fingerprints, record_fingerprint
+
+# Keep the nearest-location index for report submission loaded and current
+location_index.start()
+# Build the hotspot clusters in the background, on a read connection of their own
+hotspot_engine.start(lambda: db_session(read_only=True, label='hotspot engine load'))
+
+@app.middleware("http")
+async def attribute_queries_to_route(request: Request, call_next):
+    """Tag SQL issued while serving a request with its route template for query_stats"""
+    route_name = "unmatched"
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            route_name = f"{request.method} {route.path}"
+            break
+    token = current_route.set(route_name)
+    try:
+        return await call_next(request)
+    finally:
+        current_route.reset(token)
 
 # Amazon Titan Embed configuration
 TITAN_EMBED_MODEL = "amazon.titan-embed-image-v1"
 embedding_enabled = True  # Embeddings are enabled with boto3 Bedrock client
 
-# Database connection pool for better performance
-db_pool = PooledDB(
-    creator=mysql.connector,
-    maxconnections=20,  # Maximum connections in pool
-    mincached=2,  # Minimum idle connections
-    maxcached=10,  # Maximum idle connections
-    maxshared=20,  # Maximum shared connections
-    blocking=True,  # Block if no connections available
-    ping=1,  # Ping connection before using
-    **DB_CONFIG
-)
-
-# Get database connection from pool
-def get_db_connection():
-    """Get a database connection from the pool"""
-    try:
-        connection = db_pool.connection()
-        return connection
-    except Error as e:
-        logger.error(f"Database connection error: {e}")
-        return None
-
 # Define Pydantic models for request/response validation
 class UserBase(BaseModel):
     username: str
@@ -308,188 +315,6 @@ def verify_token(token):
     except jwt.InvalidTokenError:
         return None  # Invalid token
 
-def check_and_create_hotspots(cursor, connection, report, report_id, analysis_result):
-    """
-    Check for nearby reports and create/update hotspots if criteria are met.
-    This function works for both waste and non-waste reports.
-    
-    Args:
-        cursor: Database cursor
-        connection: Database connection 
-        report: Report data dictionary
-        report_id: ID of the current report
-        analysis_result: Analysis results dictionary
-    
-    Returns:
-        Dictionary with hotspot creation results
-    """
-    try:
-        # Find nearby reports (within 500 meters)
-        cursor.execute(
-            """
-            SELECT report_id, latitude, longitude
-            FROM reports
-            WHERE (
-                6371 * acos(
-                    cos(radians(%s)) * cos(radians(latitude)) * 
-                    cos(radians(longitude) - radians(%s)) + 
-                    sin(radians(%s)) * sin(radians(latitude))
-                )
-            ) < 0.5  -- Reports within 500 meters
-            AND report_id != %s
-            AND status = 'analyzed'  -- Only include analyzed reports in hotspots
-            """,
-            (report['latitude'], report['longitude'], report['latitude'], report_id)
-        )
-        
-        nearby_reports = cursor.fetchall()
-        nearby_count = len(nearby_reports)
-        
-        logger.info(f"Found {nearby_count} nearby reports for report {report_id}")
-        
-        # If there are nearby reports, create or update a hotspot
-        if nearby_count >= 2:  # Minimum 3 reports to form a hotspot (including this one)
-            # Check if a hotspot already exists in this area
-            cursor.execute(
-                """
-                SELECT hotspot_id
-                FROM hotspots
-                WHERE (
-                    6371 * acos(
-                        cos(radians(%s)) * cos(radians(center_latitude)) * 
-                        cos(radians(center_longitude) - radians(%s)) + 
-                        sin(radians(%s)) * sin(radians(center_latitude))
-                    )
-                ) < 0.5  -- Within 500 meters
-                """,
-                (report['latitude'], report['longitude'], report['latitude'])
-            )
-            
-            hotspot = cursor.fetchone()
-            
-            if hotspot:
-                # Update existing hotspot
-                hotspot_id = hotspot['hotspot_id']
-                cursor.execute(
-                    """
-                    UPDATE hotspots
-                    SET last_reported = %s, total_reports = %s
-                    WHERE hotspot_id = %s
-                    """,
-                    (datetime.now().date(), nearby_count + 1, hotspot_id)
-                )
-                logger.info(f"Updated existing hotspot {hotspot_id}")
-            else:
-                # Create new hotspot
-                cursor.execute(
-                    """
-                    INSERT INTO hotspots (
-                        name, center_latitude, center_longitude, radius_meters,
-                        location_id, first_reported, last_reported, total_reports,
-                        average_severity, status
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """,
-                    (
-                        f"Hotspot near {report.get('address_text', 'Unknown')}",
-                        report['latitude'],
-                        report['longitude'],
-                        500,  # 500 meter radius
-                        report.get('location_id'),
-                        datetime.now().date(),
-                        datetime.now().date(),
-                        nearby_count + 1,  # Include this report
-                        analysis_result.get('severity_score', 1),
-                        'active'
-                    )
-                )
-                
-                hotspot_id = cursor.lastrowid
-                logger.info(f"Created new hotspot {hotspot_id}")
-            
-            # Associate current report with hotspot if not already linked
-            cursor.execute(
-                """
-                SELECT * FROM hotspot_reports 
-                WHERE hotspot_id = %s AND report_id = %s
-                """, 
-                (hotspot_id, report_id)
-            )
-            
-            if not cursor.fetchone():
-                cursor.execute(
-                    """
-                    INSERT INTO hotspot_reports (hotspot_id, report_id)
-                    VALUES (%s, %s)
-                    """,
-                    (hotspot_id, report_id)
-                )
-                logger.info(f"Associated report {report_id} with hotspot {hotspot_id}")
-            
-            # Associate all nearby reports with the hotspot if not already linked
-            for nearby_report in nearby_reports:
-                nearby_id = nearby_report['report_id']
-                
-                cursor.execute(
-                    """
-                    SELECT * FROM hotspot_reports 
-                    WHERE hotspot_id = %s AND report_id = %s
-                    """, 
-                    (hotspot_id, nearby_id)
-                )
-                
-                if not cursor.fetchone():
-                    cursor.execute(
-                        """
-                        INSERT INTO hotspot_reports (hotspot_id, report_id)
-                        VALUES (%s, %s)
-                        """,
-                        (hotspot_id, nearby_id)
-                    )
-            
-            # Update average severity based on all reports in the hotspot
-            cursor.execute(
-                """
-                SELECT AVG(ar.severity_score) as avg_severity
-                FROM hotspot_reports hr
-                JOIN analysis_results ar ON hr.report_id = ar.report_id
-                WHERE hr.hotspot_id = %s
-                """,
-                (hotspot_id,)
-            )
-            
-            avg_result = cursor.fetchone()
-            if avg_result and avg_result['avg_severity'] is not None:
-                cursor.execute(
-                    """
-                    UPDATE hotspots
-                    SET average_severity = %s
-                    WHERE hotspot_id = %s
-                    """,
-                    (avg_result['avg_severity'], hotspot_id)
-                )
-            
-            connection.commit()
-            
-            return {
-                "hotspot_created": hotspot_id,
-                "total_reports": nearby_count + 1,
-                "action": "updated" if hotspot else "created"
-            }
-        else:
-            return {
-                "hotspot_created": None,
-                "total_reports": nearby_count + 1,
-                "action": "insufficient_reports"
-            }
-    
-    except Exception as e:
-        logger.error(f"Error in hotspot detection: {e}")
-        return {
-            "hotspot_created": None,
-            "error": str(e),
-            "action": "error"
-        }
-
 async def get_user_from_token(token: str = Depends(oauth2_scheme)):
     """Extract user ID from token in request"""
     user_id = verify_token(token)
@@ -497,6 +322,15 @@ async def get_user_from_token(token: str = Depends(oauth2_scheme)):
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     return user_id
 
+async def require_api_key(x_api_key: str = Header(None, alias="X-API-Key")):
+    """Allow only requests carrying the server's API key (operational endpoints)"""
+    expected_api_key = os.getenv('API_SECRET_KEY')
+    if not expected_api_key or x_api_key != expected_api_key:
+        raise HTTPException(
+            status_code=401,
+            detail="Unauthorized: Invalid or missing API key"
+        )
+
 def generate_otp():
     """Generate a 6-digit OTP"""
     return ''.join(random.choices(string.digits, k=6))
@@ -558,8 +392,13 @@ def upload_image_to_s3(image_data, filename):
             ExtraArgs={'ContentType': 'image/jpeg'}
         )
         
+        image_url = f"https://{S3_BUCKET}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{s3_path}"
+
+        # Keep the bytes locally so the background analysis doesn't download them again
+        image_blobs.put(image_url, image_binary)
+
         # Return the URL
-        return f"https://{S3_BUCKET}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{s3_path}"
+        return image_url
     
     except Exception as e:
         logger.error(f"S3 upload error: {e}")
@@ -573,248 +412,27 @@ def analyze_waste_image(payload):
     Uses Amazon Bedrock/Nova for image analysis and waste categorization
     """
     try:
-        image_url = payload.get("image_url")
         location = payload.get("location", {})
         description = payload.get("description", "")
         image_base64 = payload.get("image_base64", "")
 
-        # First prompt: Determine if the image contains waste/garbage
-        initial_prompt = f"""
-        Carefully examine this image and determine if it shows improper waste disposal, garbage, trash, or discarded materials in the environment.
-
-        Location: Latitude {location.get('lat')}, Longitude {location.get('lng')}
-        User Description: {description}
-
-        Only classify as waste/garbage if:
-        1. The items are clearly disposed of improperly in an outdoor environment (on streets, in water bodies, forests, etc.)
-        2. The items are trash/waste accumulated in trash cans, landfills, or garbage dumps
-        3. The items are clearly abandoned, broken, or dumped illegally
-
-        Do NOT classify as waste/garbage if:
-        1. The items are in normal use in their intended environment (e.g., electronics on a desk)
-        2. The items appear to be organized, clean, and in use
-        3. The items are products being displayed or used normally
-        4. The image shows an indoor setting with normal household/office items
-        5. The items are properly stored or displayed
-
-        Return your answer as a JSON object with the following structure:
-        {{
-          "contains_waste": true/false,
-          "confidence": 0-100,
-          "reasoning": "brief explanation",
-          "short_description": "concise description (max 8 words)",
-          "full_description": "detailed description of what you see in the image (2-3 sentences)"
-        }}
-        """
-
-        # Call Bedrock Nova for initial waste detection
-        response = bedrock_runtime.invoke_model(
-            modelId=BEDROCK_MODEL_ID,
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps({
-                "inferenceConfig": {
-                    "max_new_tokens": 1000,
-                    "temperature": 0.1,
-                    "top_p": 0.9
-                },
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "text": initial_prompt
-                            },
-                            {
-                                "image": {
-                                    "format": "jpeg",
-                                    "source": {
-                                        "bytes": image_base64
-                                    }
-                                }
-                            }
-                        ]
-                    }
-                ]
-            })
-        )
-
-        # Parse response
-        result = json.loads(response['body'].read())
-
-        # Extract text from Nova Pro response format
-        if 'output' in result and 'message' in result['output']:
-            message = result['output']['message']
-            if 'content' in message and len(message['content']) > 0:
-                initial_response = message['content'][0].get('text', '')
-            else:
-                logger.error("No content found in Bedrock response message")
-                initial_response = None
-        else:
-            logger.error(f"Unexpected Bedrock response format: {result}")
-            initial_response = None
-
-        if not initial_response:
-            return {
-                "success": False,
-                "error": "analysis_failed",
-                "message": "Failed to analyze image"
-            }
-
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', initial_response, re.DOTALL)
-        if json_match:
-            waste_check = json.loads(json_match.group())
-        else:
-            waste_check = {
-                "contains_waste": False,
-                "confidence": 75,
-                "reasoning": "Failed to parse response",
-                "short_description": "Unable to determine content",
-                "full_description": "Unable to generate a detailed description."
-            }
-
-        # Get short and full descriptions
-        short_description = waste_check.get("short_description", "")
-        if len(short_description.split()) > 8:
-            short_description = " ".join(short_description.split()[:8])
-
-        full_description = waste_check.get("full_description", "")
-        if not full_description:
-            full_description = f"{waste_check.get('reasoning', 'No details available.')} {short_description}"
-
-        # If the image doesn't contain waste, return minimal analysis
-        if not waste_check.get("contains_waste", False):
-            return {
-                "success": True,
-                "analysis": {
-                    "waste_type": "Not Garbage",
-                    "severity_score": 1,
-                    "priority_level": "low",
-                    "environmental_impact": "None - not waste material",
-                    "estimated_volume": "0",
-                    "safety_concerns": "None",
-                    "analysis_notes": f"This image does not appear to contain waste material. {waste_check.get('reasoning', '')}",
-                    "waste_detection_confidence": waste_check.get("confidence", 90),
-                    "short_description": short_description or "Not garbage",
-                    "full_description": full_description
-                },
-                "model_used": BEDROCK_MODEL_ID,
-                "processed_at": datetime.now().isoformat()
-            }
-
-        # If image contains waste, proceed with detailed analysis
-        detailed_prompt = """
-        Analyze the waste/garbage in this image.
-
-        Please determine:
-        1. The main type of waste visible (e.g., Plastic, Paper, Glass, Metal, Organic, Electronic, Construction, Mixed)
-        2. Severity assessment (scale 1-10, where 10 is most severe)
-        3. Priority level (low, medium, high, critical)
-        4. Environmental impact assessment
-        5. Estimated volume
-        6. Any safety concerns
-        7. Full description of the waste scenario (2-3 sentences, detailed)
-
-        Consider these factors for severity and priority:
-        - Quantity/volume of waste
-        - Hazard level of materials
-        - Proximity to water sources or sensitive areas
-        - Access to residential areas
-        - Biodegradability and longevity of waste
-
-        Structure your response as a JSON object with the following fields:
-        - waste_type: Main type of waste
-        - severity_score: Numeric score from 1-10
-        - priority_level: "low", "medium", "high", or "critical"
-        - environmental_impact: Brief description of environmental impact
-        - estimated_volume: Estimated volume in cubic meters
-        - safety_concerns: Any safety concerns identified
-        - analysis_notes: Detailed analysis and recommendations
-        - full_description: Detailed description of the waste scenario (2-3 sentences)
-
-        Keep your analysis focused, practical, and action-oriented.
-        """
-
-        # Call Bedrock Nova for detailed analysis
-        response = bedrock_runtime.invoke_model(
-            modelId=BEDROCK_MODEL_ID,
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps({
-                "inferenceConfig": {
-                    "max_new_tokens": 1500,
-                    "temperature": 0.1,
-                    "top_p": 0.9
-                },
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "text": detailed_prompt
-                            },
-                            {
-                                "image": {
-                                    "format": "jpeg",
-                                    "source": {
-                                        "bytes": image_base64
-                                    }
-                                }
-                            }
-                        ]
-                    }
-                ]
-            })
-        )
-
-        # Parse response
-        result = json.loads(response['body'].read())
-
-        # Extract text from Nova Pro response format
-        if 'output' in result and 'message' in result['output']:
-            message = result['output']['message']
-            if 'content' in message and len(message['content']) > 0:
-                detailed_response = message['content'][0].get('text', '')
-            else:
-                detailed_response = None
-        else:
-            detailed_response = None
-
-        if not detailed_response:
+        # Detection + detail analysis in one or two Nova calls (WASTE_ANALYSIS_MODE)
+        try:
+            analysis_result, usage = analyze_waste(
+                bedrock_runtime, BEDROCK_MODEL_ID, image_base64, location, description,
+                mode=payload.get("analysis_mode"), image_format=payload.get("image_format", "jpeg")
+            )
+        except AnalysisFailed as e:
             return {
                 "success": False,
                 "error": "analysis_failed",
-                "message": "Failed to analyze waste details"
-            }
-
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', detailed_response, re.DOTALL)
-        if json_match:
-            analysis_result = json.loads(json_match.group())
-        else:
-            analysis_result = {
-                "waste_type": "Mixed",
-                "severity_score": 5,
-                "priority_level": "medium",
-                "environmental_impact": "Unable to determine from image",
-                "estimated_volume": "Unknown",
-                "safety_concerns": "Unable to determine from image",
-                "analysis_notes": "Analysis completed with limited details",
-                "full_description": full_description
+                "message": str(e)
             }
 
-        # Add the waste detection confidence and short description
-        analysis_result["waste_detection_confidence"] = waste_check.get("confidence", 100)
-        analysis_result["short_description"] = short_description or f"{analysis_result['waste_type']} waste, {analysis_result['priority_level']} priority"
-
-        # Ensure full_description exists in the result
-        if "full_description" not in analysis_result or not analysis_result["full_description"]:
-            analysis_result["full_description"] = full_description
-
         return {
             "success": True,
             "analysis": analysis_result,
+            "usage": usage.to_dict(),
             "model_used": BEDROCK_MODEL_ID,
             "processed_at": datetime.now().isoformat()
         }
@@ -936,45 +554,54 @@ User question: {prompt}"""
             "response": "I encountered an error processing your request. Please try again."
         }
 
+async def load_report_image(image_url: str) -> DownloadedImage:
+    """Image bytes from the local upload cache, or downloaded from S3 on a miss"""
+    # A disk hit reads a spill file
+    cached = await asyncio.to_thread(image_blobs.get, image_url)
+    if cached is not None:
+        logger.info(f"Using cached upload for {image_url} ({len(cached)} bytes)")
+        return DownloadedImage(cached, 'image/jpeg')
+    return await image_downloader.fetch(image_url)
+
+async def prepare_report_image(image: DownloadedImage) -> Tuple[PreparedImage, str, str]:
+    """Downscaled image for the model calls, with base64 for Nova and for the Titan embedding"""
+    prepared = await image_preprocessor.prepare(image.content)
+    logger.info(
+        f"Prepared image: {prepared.width}x{prepared.height} {prepared.format}, "
+        f"{len(image.content)} -> {len(prepared.data)} bytes"
+    )
+    model_base64 = base64.b64encode(prepared.data).decode('utf-8')
+    if prepared.format == 'jpeg':
+        return prepared, model_base64, model_base64
+    return prepared, model_base64, base64.b64encode(prepared.embed_data).decode('utf-8')
+
 async def process_report_with_agent_async(report_id, image_url, latitude, longitude, description):
     """Process report using AgentCore for analysis - truly async"""
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-
-        # Download image and convert to base64 for AgentCore
-        # Run in thread pool to avoid blocking
-        import concurrent.futures
-        loop = asyncio.get_event_loop()
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            response = await loop.run_in_executor(executor, requests.get, image_url)
-        image_base64 = base64.b64encode(response.content).decode('utf-8')
+        # Load image (upload cache, then S3), downscale it and convert to base64 for AgentCore
+        image = await load_report_image(image_url)
+        prepared, image_base64, embed_base64 = await prepare_report_image(image)
 
         # Call AgentCore agent for analysis
         agent_payload = {
             "image_url": image_url,
             "image_base64": image_base64,
+            "image_format": prepared.format,
             "location": {"lat": latitude, "lng": longitude},
             "description": description
         }
 
-        # Use AgentCore for analysis - run in thread pool to avoid blocking
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            analysis_result = await loop.run_in_executor(
-                executor, analyze_waste_image, agent_payload
-            )
+        # Use AgentCore for analysis - run in a worker thread to avoid blocking
+        analysis_result = await asyncio.to_thread(analyze_waste_image, agent_payload)
 
-        cursor.close()
-        connection.close()
-
-        return analysis_result, image_base64
+        return analysis_result, embed_base64
 
     except Exception as e:
         logger.error(f"AgentCore async processing failed for report {report_id}: {e}")
         return None, None
 
 # Core functionality for image analysis with Amazon Nova Pro via AgentCore
-async def analyze_image_with_bedrock(image_url, latitude=0.0, longitude=0.0, description=""):
+async def analyze_image_with_bedrock(image_url, latitude=0.0, longitude=0.0, description="", prepared_image=None):
     """
     Analyze a waste image using Amazon Nova Pro via AgentCore
 
@@ -983,6 +610,7 @@ async def analyze_image_with_bedrock(image_url, latitude=0.0, longitude=0.0, des
         latitude: Latitude coordinate
         longitude: Longitude coordinate
         description: User-provided description
+        prepared_image: prepare_report_image() result if the caller already loaded the image
 
     Returns:
         Tuple of (analysis_result dict, image_data base64 string)
@@ -995,53 +623,48 @@ async def analyze_image_with_bedrock(image_url, latitude=0.0, longitude=0.0, des
             current_attempt += 1
             logger.info(f"Attempt {current_attempt} - Analyzing image with AgentCore from: {image_url}")
 
-            # Download the image
-            import concurrent.futures
-            loop = asyncio.get_event_loop()
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                response = await loop.run_in_executor(executor, requests.get, image_url)
-
-            if response.status_code != 200:
-                logger.error(f"Failed to download image from {image_url}: {response.status_code}")
-                if current_attempt < max_attempts:
-                    time.sleep(2)
-                    continue
-                return None, None
-
-            # Log image details
-            content_type = response.headers.get('Content-Type', 'Unknown')
-            image_size = len(response.content)
-            logger.info(f"Successfully downloaded image: Type={content_type}, Size={image_size} bytes")
-
-            # Convert image to base64
-            image_data = base64.b64encode(response.content).decode('utf-8')
-            logger.info(f"Converted image to base64 format (length: {len(image_data)} chars)")
+            if prepared_image is None:
+                # Load the image (upload cache, then S3 through the shared pooled client)
+                try:
+                    image = await load_report_image(image_url)
+                except ImageDownloadError as e:
+                    logger.error(f"Failed to download image from {image_url}: {e}")
+                    if current_attempt < max_attempts:
+                        await asyncio.sleep(2)
+                        continue
+                    return None, None
+
+                # Log image details
+                logger.info(f"Loaded image: Type={image.content_type}, Size={len(image.content)} bytes")
+
+                # Downscale and re-encode once for every model call, then convert to base64
+                prepared_image = await prepare_report_image(image)
+            prepared, image_base64, image_data = prepared_image
+            logger.info(f"Converted image to base64 format (length: {len(image_base64)} chars)")
 
             # Call AgentCore agent for analysis
             agent_payload = {
                 "image_url": image_url,
-                "image_base64": image_data,
+                "image_base64": image_base64,
+                "image_format": prepared.format,
                 "location": {"lat": latitude, "lng": longitude},
                 "description": description
             }
 
-            # Use AgentCore for analysis - run in thread pool to avoid blocking
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                agent_result = await loop.run_in_executor(
-                    executor, analyze_waste_image, agent_payload
-                )
+            # Use AgentCore for analysis - run in a worker thread to avoid blocking
+            agent_result = await asyncio.to_thread(analyze_waste_image, agent_payload)
 
             if not agent_result or not agent_result.get("success"):
                 logger.error(f"AgentCore analysis failed: {agent_result.get('error', 'Unknown error')}")
                 if current_attempt < max_attempts:
                     logger.info(f"Retrying... ({current_attempt}/{max_attempts})")
-                    time.sleep(2)
+                    await asyncio.sleep(2)
                     continue
                 return None, None
 
             # Extract analysis from AgentCore result
             analysis_result = agent_result.get("analysis", {})
-            logger.info(f"AgentCore analysis complete: {analysis_result}")
+            logger.info(f"AgentCore analysis complete ({agent_result.get('usage')}): {analysis_result}")
 
             return analysis_result, image_data  # Return both analysis and image data for embeddings
 
@@ -1049,7 +672,7 @@ async def analyze_image_with_bedrock(image_url, latitude=0.0, longitude=0.0, des
             logger.error(f"Error in analyze_image_with_bedrock (Attempt {current_attempt}/{max_attempts}): {e}")
             if current_attempt < max_attempts:
                 logger.info(f"Retrying due to exception... ({current_attempt}/{max_attempts})")
-                time.sleep(2)
+                await asyncio.sleep(2)
                 continue
             return None, None
 
@@ -1075,32 +698,16 @@ def extract_volume_number(volume_str):
         logger.warning(f"Failed to extract volume from '{volume_str}': {e}")
         return 0.0
 # Process a waste report
-async def process_report(report_id, background_tasks: BackgroundTasks):
-    """
-    Process a waste report by analyzing its image and updating the database
-    
-    Args:
-        report_id: ID of the report to process
-        background_tasks: FastAPI background tasks for async processing
-    
-    Returns:
-        Dictionary with processing results
-    """
-    try:
-        # Get database connection
-        connection = get_db_connection()
-        if not connection:
-            return {"success": False, "message": "Failed to connect to database"}
-        
-        cursor = connection.cursor(dictionary=True)
-        
+def _start_report_analysis(report_id):
+    """Mark a report as analyzing and return it with the submitter's username"""
+    with db_session() as (connection, cursor):
         # Update report status to analyzing
         cursor.execute(
             "UPDATE reports SET status = 'analyzing' WHERE report_id = %s",
             (report_id,)
         )
         connection.commit()
-        
+            
         # Get report data
         cursor.execute(
             """
@@ -1111,168 +718,122 @@ async def process_report(report_id, background_tasks: BackgroundTasks):
             """,
             (report_id,)
         )
-        
-        report = cursor.fetchone()
-        if not report:
-            cursor.close()
-            connection.close()
-            return {"success": False, "message": f"Report {report_id} not found"}
-        
-        # If no image, we can't analyze - return clear error
-        if not report['image_url']:
-            cursor.execute(
-                "UPDATE reports SET status = 'submitted' WHERE report_id = %s",
-                (report_id,)
-            )
-            connection.commit()
-            cursor.close()
-            connection.close()
-            return {"success": False, "message": "No image available for analysis"}
-        
-        # Log the image URL we're about to analyze
-        logger.info(f"Processing report {report_id} with image URL: {report['image_url']}")
-
-        # Analyze image with Nova Pro via AgentCore
-        analysis_result, image_data = await analyze_image_with_bedrock(
-            report['image_url'],
-            report['latitude'],
-            report['longitude'],
-            report.get('description', '')
-        )
-        
-        if not analysis_result:
-            cursor.execute(
-                "UPDATE reports SET status = 'submitted' WHERE report_id = %s",
-                (report_id,)
-            )
-            connection.commit()
-            cursor.close()
-            connection.close()
-            return {"success": False, "message": "Image analysis failed"}
-        
-        # If the image doesn't contain waste, update status to analyzed with "Not Garbage"
-        if analysis_result['waste_type'] == 'Not Garbage':
-            # Update the report with "Not Garbage" description and set status to analyzed
-            cursor.execute(
-                "UPDATE reports SET description = %s, status = %s WHERE report_id = %s",
-                ("Not garbage.", "analyzed", report_id)
-            )
-            connection.commit()
             
-            # Get or create "Not Garbage" waste type
-            cursor.execute(
-                "SELECT waste_type_id FROM waste_types WHERE name = %s",
-                ("Not Garbage",)
-            )
-            waste_type_result = cursor.fetchone()
+        report = cursor.fetchone()
             
-            waste_type_id = None
-            if waste_type_result:
-                waste_type_id = waste_type_result['waste_type_id']
-            else:
-                # Create "Not Garbage" waste type if it doesn't exist
-                cursor.execute(
-                    """
-                    INSERT INTO waste_types (name, description, hazard_level, recyclable)
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    (
-                        "Not Garbage",
-                        "Images that do not contain waste materials",
-                        'low',
-                        False
-                    )
-                )
-                connection.commit()
-                waste_type_id = cursor.lastrowid
+        return report
+
+def _store_not_garbage_analysis(report, report_id, analysis_result, image_embedding, location_embedding,
+                                fingerprint=None):
+    """Persist the analysis of an image without waste and run hotspot detection in one transaction"""
+    # The report's hotspot cells stay locked until the commit
+    with hotspot_engine.transaction(report), db_session() as (connection, cursor):
+        # Update the report with "Not Garbage" description and set status to analyzed
+        cursor.execute(
+            "UPDATE reports SET description = %s, status = %s WHERE report_id = %s",
+            ("Not garbage.", "analyzed", report_id)
+        )
             
-            # Generate embeddings for non-garbage images (pass image_data for Titan Image Embed)
-            image_embedding = create_image_content_embedding(analysis_result, image_data)
-            location_embedding = create_location_embedding(report['latitude'], report['longitude'])
+        # Get or create "Not Garbage" waste type
+        waste_type_result = execute_prepared(
+            connection,
+            "SELECT waste_type_id FROM waste_types WHERE name = %s",
+            ("Not Garbage",),
+            fetch='one'
+        )
             
-            # Insert analysis results for non-garbage
+        waste_type_id = None
+        if waste_type_result:
+            waste_type_id = waste_type_result['waste_type_id']
+        else:
+            # Create "Not Garbage" waste type if it doesn't exist
             cursor.execute(
                 """
-                INSERT INTO analysis_results (
-                    report_id, analyzed_date, waste_type_id, confidence_score,
-                    estimated_volume, severity_score, priority_level,
-                    analysis_notes, full_description, processed_by,
-                    image_embedding, location_embedding
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                INSERT INTO waste_types (name, description, hazard_level, recyclable)
+                VALUES (%s, %s, %s, %s)
                 """,
                 (
-                    report_id,
-                    datetime.now(),
-                    waste_type_id,
-                    analysis_result.get("waste_detection_confidence", 90.0),
-                    0.0,  # Zero volume for non-garbage
-                    1,    # Lowest severity
-                    "low", # Lowest priority
-                    "This image does not contain waste material.",
-                    analysis_result.get("full_description", "This image does not contain waste material."),
-                    'Nova AI',
-                    json.dumps(image_embedding) if image_embedding else None,
-                    json.dumps(location_embedding) if location_embedding else None
+                    "Not Garbage",
+                    "Images that do not contain waste materials",
+                    'low',
+                    False
                 )
             )
-            connection.commit()
+            waste_type_id = cursor.lastrowid
             
-            # Log the activity
-            cursor.execute(
-                """
-                INSERT INTO system_logs (agent, action, details, related_id, related_table)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (
-                    'api_server',
-                    'report_analyzed',
-                    f"Report {report_id} analyzed: Not Garbage",
-                    report_id,
-                    'reports'
-                )
+        # Insert analysis results for non-garbage
+        cursor.execute(
+            """
+            INSERT INTO analysis_results (
+                report_id, analyzed_date, waste_type_id, confidence_score,
+                estimated_volume, severity_score, priority_level,
+                analysis_notes, full_description, processed_by,
+                image_embedding, location_embedding
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (
+                report_id,
+                datetime.now(),
+                waste_type_id,
+                analysis_result.get("waste_detection_confidence", 90.0),
+                0.0,  # Zero volume for non-garbage
+                1,    # Lowest severity
+                "low", # Lowest priority
+                "This image does not contain waste material.",
+                analysis_result.get("full_description", "This image does not contain waste material."),
+                'Nova AI',
+                json.dumps(image_embedding) if image_embedding else None,
+                json.dumps(location_embedding) if location_embedding else None
             )
-            connection.commit()
-            
-            # Check for hotspots (reports nearby) - for Not Garbage reports too
-            logger.info(f"Checking for hotspots near report {report_id} (Not Garbage)")
-            hotspot_result = check_and_create_hotspots(cursor, connection, report, report_id, analysis_result)
+        )
             
-            cursor.close()
-            connection.close()
+        # Log the activity
+        cursor.execute(
+            """
+            INSERT INTO system_logs (agent, action, details, related_id, related_table)
+            VALUES (%s, %s, %s, %s, %s)
+            """,
+            (
+                'api_server',
+                'report_analyzed',
+                f"Report {report_id} analyzed: Not Garbage",
+                report_id,
+                'reports'
+            )
+        )
             
-            return {
-                "success": True,
-                "message": f"Report {report_id} analyzed successfully: Not Garbage",
-                "analysis": analysis_result,
-                "hotspot": hotspot_result
-            }
-        
-        # If image contains garbage, continue with normal analysis flow
-        # Set the AI-generated short description
-        short_description = analysis_result.get("short_description", "")
-        
-        # Make sure it's 8 words or less
-        if short_description and len(short_description.split()) > 8:
-            short_description = " ".join(short_description.split()[:8])
-        
-        # Fallback if no description is available
-        if not short_description:
-            short_description = f"{analysis_result['waste_type']} waste"
+        # Check for hotspots (reports nearby) - for Not Garbage reports too
+        logger.info(f"Checking for hotspots near report {report_id} (Not Garbage)")
+        hotspot_result = update_hotspots(cursor, connection, report, report_id, analysis_result)
         
+        # Fingerprint the photo so later copies of it can reuse this analysis
+        if fingerprint:
+            record_fingerprint(cursor, report_id, *fingerprint)
+
+        # Single commit for the whole analysis
+        connection.commit()
+            
+        return hotspot_result
+
+def _store_waste_analysis(report, report_id, analysis_result, short_description, image_embedding, location_embedding,
+                          fingerprint=None):
+    """Persist the analysis of an image containing waste and run hotspot detection in one transaction"""
+    # The report's hotspot cells stay locked until the commit
+    with hotspot_engine.transaction(report), db_session() as (connection, cursor):
         # Update the report with the short description
         cursor.execute(
             "UPDATE reports SET description = %s, status = %s WHERE report_id = %s",
             (short_description, "analyzed", report_id)
         )
-        connection.commit()
-        
+            
         # Get waste type ID
-        cursor.execute(
+        waste_type_result = execute_prepared(
+            connection,
             "SELECT waste_type_id FROM waste_types WHERE name = %s",
-            (analysis_result['waste_type'],)
+            (analysis_result['waste_type'],),
+            fetch='one'
         )
-        waste_type_result = cursor.fetchone()
-        
+            
         waste_type_id = None
         if waste_type_result:
             waste_type_id = waste_type_result['waste_type_id']
@@ -1290,13 +851,8 @@ async def process_report(report_id, background_tasks: BackgroundTasks):
                     False      # Default not recyclable
                 )
             )
-            connection.commit()
             waste_type_id = cursor.lastrowid
-        
-        # Generate embeddings for waste images (pass image_data for Titan Image Embed)
-        image_embedding = create_image_content_embedding(analysis_result, image_data)
-        location_embedding = create_location_embedding(report['latitude'], report['longitude'])
-        
+            
         # Insert analysis results
         cursor.execute(
             """
@@ -1322,12 +878,11 @@ async def process_report(report_id, background_tasks: BackgroundTasks):
                 json.dumps(location_embedding) if location_embedding else None
             )
         )
-        connection.commit()
-        
+            
         # Check for hotspots (reports nearby) - for actual waste reports
         logger.info(f"Checking for hotspots near report {report_id} (Actual Waste)")
-        hotspot_result = check_and_create_hotspots(cursor, connection, report, report_id, analysis_result)
-        
+        update_hotspots(cursor, connection, report, report_id, analysis_result)
+            
         # Log the activity
         cursor.execute(
             """
@@ -1342,10 +897,145 @@ async def process_report(report_id, background_tasks: BackgroundTasks):
                 'reports'
             )
         )
+        
+        # Fingerprint the photo so later copies of it can reuse this analysis
+        if fingerprint:
+            record_fingerprint(cursor, report_id, *fingerprint)
+
+        # Single commit for the whole analysis
         connection.commit()
+
+def log_persistence_cost(report_id, round_trips: RoundTripMeter, started: float):
+    """Log the database round trips and wall time spent storing a report's analysis"""
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        f"Stored analysis for report {report_id}: {round_trips.total} round trips "
+        f"({round_trips.statements} statements, {round_trips.prepares} prepares, "
+        f"{round_trips.commits} commits) in {elapsed_ms:.1f} ms"
+    )
+
+async def process_report(report_id, background_tasks: BackgroundTasks):
+    """
+    Process a waste report by analyzing its image and updating the database
+    
+    Args:
+        report_id: ID of the report to process
+        background_tasks: FastAPI background tasks for async processing
+    
+    Returns:
+        Dictionary with processing results
+    """
+    try:
+        # Mark the report as analyzing and load it
+        report = await run_db(_start_report_analysis, report_id)
+        if not report:
+            return {"success": False, "message": f"Report {report_id} not found"}
+        
+        # If no image, we can't analyze - return clear error
+        if not report['image_url']:
+            await execute(
+                "UPDATE reports SET status = 'submitted' WHERE report_id = %s",
+                (report_id,)
+            )
+            return {"success": False, "message": "No image available for analysis"}
+        
+        # Log the image URL we're about to analyze
+        logger.info(f"Processing report {report_id} with image URL: {report['image_url']}")
+
+        # Load and prepare the image once; analyze_image_with_bedrock retries the download on failure
+        try:
+            prepared_image = await prepare_report_image(await load_report_image(report['image_url']))
+        except ImageDownloadError as e:
+            logger.warning(f"Could not load image for report {report_id}, analysis will retry: {e}")
+            prepared_image = None
+        fingerprint = (prepared_image[0].sha256, prepared_image[0].dhash) if prepared_image else None
+
+        # The same photo (or a near-identical shot) may already have been analyzed
+        duplicate = None
+        if fingerprint:
+            try:
+                duplicate = await run_read_db(image_fingerprints.find, report_id, *fingerprint)
+            except Exception as e:
+                logger.warning(f"Duplicate image lookup failed for report {report_id}: {e}")
+
+        image_embedding = None
+        if duplicate:
+            logger.info(
+                f"Report {report_id} reuses the analysis of report {duplicate.report_id} "
+                f"({duplicate.match} match, distance {duplicate.distance})"
+            )
+            analysis_result = duplicate.analysis
+            image_embedding = duplicate.image_embedding
+            image_data = prepared_image[2]
+        else:
+            # Analyze image with Nova Pro via AgentCore
+            analysis_result, image_data = await analyze_image_with_bedrock(
+                report['image_url'],
+                report['latitude'],
+                report['longitude'],
+                report.get('description', ''),
+                prepared_image=prepared_image
+            )
+        
+        if not analysis_result:
+            await execute(
+                "UPDATE reports SET status = 'submitted' WHERE report_id = %s",
+                (report_id,)
+            )
+            return {"success": False, "message": "Image analysis failed"}
         
-        cursor.close()
-        connection.close()
+        # Generate embeddings (pass image_data for Titan Image Embed) off the event loop
+        if image_embedding is None:
+            image_embedding = await asyncio.to_thread(create_image_content_embedding, analysis_result, image_data)
+        location_embedding = await asyncio.to_thread(create_location_embedding, report['latitude'], report['longitude'])
+
+        # The image bytes aren't needed any more
+        await asyncio.to_thread(image_blobs.discard, report['image_url'])
+
+        # Don't hold a connection while the hotspot engine is still loading
+        await asyncio.to_thread(hotspot_engine.wait_until_ready)
+        
+        # If the image doesn't contain waste, update status to analyzed with "Not Garbage"
+        if analysis_result['waste_type'] == 'Not Garbage':
+            store_started = time.perf_counter()
+            with measure_round_trips() as round_trips:
+                hotspot_result = await run_db(
+                    _store_not_garbage_analysis,
+                    report, report_id, analysis_result, image_embedding, location_embedding, fingerprint
+                )
+            log_persistence_cost(report_id, round_trips, store_started)
+            if fingerprint:
+                image_fingerprints.add(report_id, fingerprint[1])
+            
+            return {
+                "success": True,
+                "message": f"Report {report_id} analyzed successfully: Not Garbage",
+                "analysis": analysis_result,
+                "hotspot": hotspot_result
+            }
+        
+        # If image contains garbage, continue with normal analysis flow
+        # Set the AI-generated short description
+        short_description = analysis_result.get("short_description", "")
+        
+        # Make sure it's 8 words or less
+        if short_description and len(short_description.split()) > 8:
+            short_description = " ".join(short_description.split()[:8])
+        
+        # Fallback if no description is available
+        if not short_description:
+            short_description = f"{analysis_result['waste_type']} waste"
+        
+        store_started = time.perf_counter()
+        with measure_round_trips() as round_trips:
+            await run_db(
+                _store_waste_analysis,
+                report, report_id, analysis_result, short_description, image_embedding, location_embedding,
+                fingerprint
+            )
+        log_persistence_cost(report_id, round_trips, store_started)
+        if fingerprint:
+            image_fingerprints.add(report_id, fingerprint[1])
         
         return {
             "success": True,
@@ -1364,21 +1054,8 @@ async def process_report(report_id, background_tasks: BackgroundTasks):
 async def health_check():
     try:
         # Check database connection
-        connection = get_db_connection()
-        if not connection:
-            return {
-                "status": "error",
-                "message": "Database connection failed",
-                "service": "EcoLafaek API",
-                "version": "1.0.0"
-            }
-            
-        cursor = connection.cursor()
-        cursor.execute("SELECT 1")
-        cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
+        await fetch_one("SELECT 1", dictionary=False)
+
         # Return service status
         return {
             "status": "ok",
@@ -1395,6 +1072,43 @@ async def health_check():
             "version": "1.0.0"
         }
 
+# Database pool telemetry
+@app.get("/api/admin/db/pool", response_model=dict, dependencies=[Depends(require_api_key)])
+async def get_db_pool_stats():
+    """Connection pool gauges, wait histogram and currently held connections - Requires API Key"""
+    return {
+        "status": "success",
+        "pools": [monitor.stats() for monitor in pool_monitors],
+        "liveness": idle_pinger.stats(),
+        "statement_cache": statement_cache.stats(),
+        "checkouts": checkout_tracker.snapshot(),
+        "location_index": location_index.stats(),
+        "map_grid_cache": grid_cache.stats(),
+        "hotspot_engine": hotspot_engine.stats(),
+        "image_downloads": image_downloader.stats(),
+        "image_blob_cache": image_blobs.stats(),
+        "image_preprocessing": image_preprocessor.stats(),
+        "image_dedup": image_fingerprints.stats(),
+        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+# Per-statement SQL telemetry
+@app.get("/api/admin/db/queries", response_model=dict, dependencies=[Depends(require_api_key)])
+async def get_db_query_stats(limit: int = 20, sort: str = "total_ms"):
+    """Top statements by latency and the slow query log - Requires API Key"""
+    if sort not in ("total_ms", "avg_ms", "max_ms", "calls", "rows"):
+        raise HTTPException(status_code=400, detail="sort must be one of total_ms, avg_ms, max_ms, calls, rows")
+
+    limit = min(max(limit, 1), 100)
+    return {
+        "status": "success",
+        "slow_threshold_ms": query_stats.slow_ms,
+        "statements": query_stats.top(limit, sort),
+        "slow_queries": query_stats.slow_queries(limit),
+        "untracked_statements": query_stats.dropped,
+        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
 # Authentication routes
 @app.get("/api/auth/check-existing", response_model=dict)
 async def check_existing_user(email: str = None, username: str = None):
@@ -1402,10 +1116,7 @@ async def check_existing_user(email: str = None, username: str = None):
     try:
         if not email and not username:
             raise HTTPException(status_code=400, detail="Either email or username is required")
-            
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
+
         conditions = []
         params = []
         
@@ -1418,15 +1129,11 @@ async def check_existing_user(email: str = None, username: str = None):
             
         where_clause = " OR ".join(conditions)
         
-        cursor.execute(
+        existing_user = await fetch_one(
             f"SELECT username, email FROM users WHERE {where_clause}",
             params
         )
-        existing_user = cursor.fetchone()
-        
-        cursor.close()
-        connection.close()
-        
+
         if existing_user:
             return {
                 "status": "exists",
@@ -1448,26 +1155,18 @@ async def check_existing_user(email: str = None, username: str = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 # Improved registration endpoint with better logging
-@app.post("/api/auth/register", response_model=dict)
-@limiter.limit("5/minute")  # Rate limit registration to prevent spam
-async def register(user_data: UserCreate, request: Request):
-    try:
-        logger.info(f"Registration attempt for username: {user_data.username}, email: {user_data.email}")
-        
-        # Check if username or email already exists in users table
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
+def _create_pending_registration(user_data: UserCreate):
+    """Validate uniqueness and store a pending registration, returning (otp, expires_at)"""
+    # Check if username or email already exists in users table
+    with db_session() as (connection, cursor):
         cursor.execute(
             "SELECT user_id, username, email FROM users WHERE username = %s OR email = %s",
             (user_data.username, user_data.email)
         )
         existing_user = cursor.fetchone()
-        
+            
         if existing_user:
             logger.warning(f"User already exists: {existing_user}")
-            cursor.close()
-            connection.close()
             # More specific error message
             if existing_user['username'] == user_data.username and existing_user['email'] == user_data.email:
                 raise HTTPException(status_code=409, detail="Both username and email already exist in users table")
@@ -1475,14 +1174,14 @@ async def register(user_data: UserCreate, request: Request):
                 raise HTTPException(status_code=409, detail="Username already exists in users table")
             else:
                 raise HTTPException(status_code=409, detail="Email already exists in users table")
-        
+            
         # Check if username or email exists in pending registrations
         cursor.execute(
             "SELECT registration_id, username, email, expires_at FROM pending_registrations WHERE username = %s OR email = %s",
             (user_data.username, user_data.email)
         )
         existing_pending = cursor.fetchone()
-        
+            
         if existing_pending:
             logger.info(f"Found pending registration: {existing_pending}")
             
@@ -1504,20 +1203,18 @@ async def register(user_data: UserCreate, request: Request):
                     # Same user re-registering - this is OK, we'll update below
                 else:
                     # Different user with conflicting credentials
-                    cursor.close()
-                    connection.close()
                     if existing_pending['username'] == user_data.username:
                         raise HTTPException(status_code=409, detail="Username is already being registered by another user")
                     else:
                         raise HTTPException(status_code=409, detail="Email is already being registered by another user")
-        
+            
         # Generate OTP
         otp = generate_otp()
         expires_at = datetime.now() + timedelta(minutes=10)
-        
+            
         # Hash the password
         hashed_password = hash_password(user_data.password)
-        
+            
         if existing_pending:
             # Update existing pending registration (same user re-registering)
             logger.info(f"Updating pending registration: {existing_pending['registration_id']}")
@@ -1542,8 +1239,18 @@ async def register(user_data: UserCreate, request: Request):
                 """,
                 (user_data.username, user_data.email, user_data.phone_number, hashed_password, otp, datetime.now(), expires_at)
             )
-        
+            
         connection.commit()
+            
+        return otp, expires_at
+
+@app.post("/api/auth/register", response_model=dict)
+@limiter.limit("5/minute")  # Rate limit registration to prevent spam
+async def register(user_data: UserCreate, request: Request):
+    try:
+        logger.info(f"Registration attempt for username: {user_data.username}, email: {user_data.email}")
+        
+        otp, expires_at = await run_db(_create_pending_registration, user_data)
         
         # Send OTP email
         email_subject = "EcoLafaek - Verify Your Email"
@@ -1570,8 +1277,6 @@ async def register(user_data: UserCreate, request: Request):
         
         # Send the actual email
         email_sent = send_email(user_data.email, email_subject, email_body)
-        cursor.close()
-        connection.close()
         
         if not email_sent:
             # Continue anyway but inform the user they may not receive the email
@@ -1599,16 +1304,9 @@ async def register(user_data: UserCreate, request: Request):
 async def force_cleanup_all_registrations():
     """DANGER: Force cleanup all pending registrations - USE WITH CAUTION"""
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
         # Delete ALL pending registrations
-        cursor.execute("DELETE FROM pending_registrations")
-        deleted_count = cursor.rowcount
-        connection.commit()
-        cursor.close()
-        connection.close()
-        
+        deleted_count = await execute("DELETE FROM pending_registrations")
+
         logger.info(f"Force cleaned up {deleted_count} pending registrations")
         return {
             "status": "success",
@@ -1617,14 +1315,12 @@ async def force_cleanup_all_registrations():
         
     except Exception as e:
         logger.error(f"Force cleanup error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-@app.post("/api/auth/verify-registration", response_model=TokenData)
-async def verify_registration(verification: OTPVerify):
-    try:
-        # Get pending registration details
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _complete_registration(verification: OTPVerify):
+    """Check the OTP of a pending registration and promote it to a user, returning (user_id, user)"""
+    # Get pending registration details
+    with db_session() as (connection, cursor):
         cursor.execute(
             """
             SELECT * FROM pending_registrations
@@ -1632,9 +1328,9 @@ async def verify_registration(verification: OTPVerify):
             """,
             (verification.email, verification.otp)
         )
-        
+            
         pending = cursor.fetchone()
-        
+            
         if not pending:
             cursor.execute(
                 """
@@ -1653,7 +1349,7 @@ async def verify_registration(verification: OTPVerify):
                     (wrong_otp_pending['registration_id'],)
                 )
                 connection.commit()
-                
+            
                 # Check if too many attempts
                 if wrong_otp_pending['attempts'] >= 3:
                     cursor.execute(
@@ -1661,21 +1357,15 @@ async def verify_registration(verification: OTPVerify):
                         (wrong_otp_pending['registration_id'],)
                     )
                     connection.commit()
-                    cursor.close()
-                    connection.close()
                     raise HTTPException(status_code=400, detail="Too many failed attempts. Please register again.")
-                
-                cursor.close()
-                connection.close()
+            
                 raise HTTPException(
                     status_code=400, 
                     detail=f"Invalid OTP. Please try again. Attempts left: {3 - wrong_otp_pending['attempts']}"
                 )
             
-            cursor.close()
-            connection.close()
             raise HTTPException(status_code=404, detail="Invalid verification details or OTP expired")
-        
+            
         # Check if OTP has expired
         now = datetime.now()
         if pending['expires_at'] < now:
@@ -1685,10 +1375,8 @@ async def verify_registration(verification: OTPVerify):
                 (pending['registration_id'],)
             )
             connection.commit()
-            cursor.close()
-            connection.close()
             raise HTTPException(status_code=400, detail="OTP has expired. Please register again.")
-        
+            
         # OTP is valid - create the actual user
         cursor.execute(
             """
@@ -1699,17 +1387,17 @@ async def verify_registration(verification: OTPVerify):
             (pending['username'], pending['email'], pending['phone_number'], 
              pending['password_hash'], datetime.now(), 'active', True)
         )
-        
+            
         user_id = cursor.lastrowid
         connection.commit()
-        
+            
         # Delete pending registration
         cursor.execute(
             "DELETE FROM pending_registrations WHERE registration_id = %s",
             (pending['registration_id'],)
         )
         connection.commit()
-        
+            
         # Get user details
         cursor.execute(
             """
@@ -1719,10 +1407,15 @@ async def verify_registration(verification: OTPVerify):
             """,
             (user_id,)
         )
-        
+            
         user = cursor.fetchone()
-        cursor.close()
-        connection.close()
+            
+        return user_id, user
+
+@app.post("/api/auth/verify-registration", response_model=TokenData)
+async def verify_registration(verification: OTPVerify):
+    try:
+        user_id, user = await run_db(_complete_registration, verification)
         
         # Convert datetime objects to strings
         if user:
@@ -1751,41 +1444,28 @@ async def verify_registration(verification: OTPVerify):
 async def login(login_data: UserLogin, request: Request):
     try:
         # Get user by username
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        cursor.execute(
+        user = await fetch_one(
             """
-            SELECT user_id, username, email, phone_number, password_hash, registration_date, 
+            SELECT user_id, username, email, phone_number, password_hash, registration_date,
                    last_login, account_status, profile_image_url, verification_status
             FROM users WHERE username = %s
             """,
             (login_data.username,)
         )
-        
-        user = cursor.fetchone()
-        
+
         if not user:
-            cursor.close()
-            connection.close()
             raise HTTPException(status_code=401, detail="Invalid username or password")
-        
+
         # Verify password
         if not verify_password(user['password_hash'], login_data.password):
-            cursor.close()
-            connection.close()
             raise HTTPException(status_code=401, detail="Invalid username or password")
-        
+
         # Update last login time
-        cursor.execute(
+        await execute(
             "UPDATE users SET last_login = %s WHERE user_id = %s",
             (datetime.now(), user['user_id'])
         )
-        connection.commit()
-        
-        cursor.close()
-        connection.close()
-        
+
         # Remove password hash from user object
         user.pop('password_hash', None)
         
@@ -1810,46 +1490,40 @@ async def login(login_data: UserLogin, request: Request):
         logger.error(f"Login error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/auth/send-otp", response_model=dict)
-async def send_otp(otp_request: OTPRequest):
-    try:
-        # Validate required fields
-        email = otp_request.email
-        username = otp_request.username
-        
-        # If OTP is provided in the request, use it (for testing)
-        # Otherwise generate a new one
-        otp = otp_request.otp or generate_otp()
-        
-        # Get user ID
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
+def _store_verification_otp(email: str, otp: str, not_found_detail: str):
+    """
+    Create or refresh the unverified OTP record for the user with this email
+
+    Args:
+        email: Email address of the user
+        otp: One-time password to store
+        not_found_detail: Error detail returned when no user has this email
+
+    Returns:
+        Tuple of (user dict with user_id and username, OTP expiry datetime)
+    """
+    with db_session() as (connection, cursor):
         cursor.execute(
-            "SELECT user_id FROM users WHERE email = %s",
+            "SELECT user_id, username FROM users WHERE email = %s",
             (email,)
         )
-        
+            
         user = cursor.fetchone()
-        
+            
         if not user:
-            cursor.close()
-            connection.close()
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        user_id = user['user_id']
-        
+            raise HTTPException(status_code=404, detail=not_found_detail)
+            
         # Set expiration time (10 minutes from now)
         expires_at = datetime.now() + timedelta(minutes=10)
-        
+            
         # Check if there's an existing OTP for this user
         cursor.execute(
             "SELECT verification_id FROM user_verifications WHERE user_id = %s AND is_verified = FALSE",
-            (user_id,)
+            (user['user_id'],)
         )
-        
+            
         existing_verification = cursor.fetchone()
-        
+            
         if existing_verification:
             # Update existing verification
             cursor.execute(
@@ -1868,10 +1542,26 @@ async def send_otp(otp_request: OTPRequest):
                 (user_id, email, otp, created_at, expires_at)
                 VALUES (%s, %s, %s, %s, %s)
                 """,
-                (user_id, email, otp, datetime.now(), expires_at)
+                (user['user_id'], email, otp, datetime.now(), expires_at)
             )
-        
+            
         connection.commit()
+            
+        return user, expires_at
+
+@app.post("/api/auth/send-otp", response_model=dict)
+async def send_otp(otp_request: OTPRequest):
+    try:
+        # Validate required fields
+        email = otp_request.email
+        username = otp_request.username
+        
+        # If OTP is provided in the request, use it (for testing)
+        # Otherwise generate a new one
+        otp = otp_request.otp or generate_otp()
+        
+        # Store the OTP against the user's pending verification
+        _, expires_at = await run_db(_store_verification_otp, email, otp, "User not found")
         
         # Prepare email content
         email_subject = "Your OTP Verification Code - EcoLafaek"
@@ -1899,9 +1589,6 @@ async def send_otp(otp_request: OTPRequest):
         # Send the email
         email_sent = send_email(email, email_subject, email_body)
         
-        cursor.close()
-        connection.close()
-        
         if email_sent:
             return {
                 "status": "success",
@@ -1922,13 +1609,10 @@ async def send_otp(otp_request: OTPRequest):
         logger.error(f"Send OTP error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/auth/verify-otp", response_model=TokenData)
-async def verify_otp(verification: OTPVerify):
-    try:
-        # Get verification details
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
+def _verify_user_otp(verification: OTPVerify):
+    """Check an OTP against the user's latest unverified record and mark it verified, returning (user_id, user)"""
+    # Get verification details
+    with db_session() as (connection, cursor):
         cursor.execute(
             """
             SELECT v.*, u.user_id, u.username
@@ -1940,28 +1624,24 @@ async def verify_otp(verification: OTPVerify):
             """,
             (verification.email,)
         )
-        
+            
         verification_record = cursor.fetchone()
-        
+            
         if not verification_record:
-            cursor.close()
-            connection.close()
             raise HTTPException(status_code=404, detail="No pending verification found")
-        
+            
         # Check if OTP has expired
         now = datetime.now()
         if verification_record['expires_at'] < now:
-            cursor.close()
-            connection.close()
             raise HTTPException(status_code=400, detail="OTP has expired")
-        
+            
         # Update attempt count
         cursor.execute(
             "UPDATE user_verifications SET attempts = attempts + 1 WHERE verification_id = %s",
             (verification_record['verification_id'],)
         )
         connection.commit()
-        
+            
         # Check if OTP matches
         if verification_record['otp'] != verification.otp:
             # If too many attempts, mark as expired
@@ -1971,33 +1651,26 @@ async def verify_otp(verification: OTPVerify):
                     (now - timedelta(minutes=1), verification_record['verification_id'])
                 )
                 connection.commit()
-                cursor.close()
-                connection.close()
                 raise HTTPException(status_code=400, detail="Too many failed attempts, OTP is now expired")
             
-            cursor.close()
-            connection.close()
             raise HTTPException(
                 status_code=400,
                 detail=f"Invalid OTP. Attempts left: {3 - verification_record['attempts']}"
             )
-        
+            
         # OTP is valid - mark as verified
         cursor.execute(
             "UPDATE user_verifications SET is_verified = TRUE WHERE verification_id = %s",
             (verification_record['verification_id'],)
         )
-        
+            
         # Update user's verification status
         cursor.execute(
             "UPDATE users SET verification_status = TRUE WHERE user_id = %s",
             (verification_record['user_id'],)
         )
         connection.commit()
-        
-        # Generate token for user
-        token = generate_token(verification_record['user_id'])
-        
+            
         # Get updated user data
         cursor.execute(
             """
@@ -2007,10 +1680,18 @@ async def verify_otp(verification: OTPVerify):
             """,
             (verification_record['user_id'],)
         )
-        
+            
         user = cursor.fetchone()
-        cursor.close()
-        connection.close()
+            
+        return verification_record['user_id'], user
+
+@app.post("/api/auth/verify-otp", response_model=TokenData)
+async def verify_otp(verification: OTPVerify):
+    try:
+        user_id, user = await run_db(_verify_user_otp, verification)
+        
+        # Generate token for user
+        token = generate_token(user_id)
         
         # Convert datetime objects to strings
         if user:
@@ -2036,56 +1717,9 @@ async def resend_otp(request: ResendOTPRequest):
     try:
         email = request.email
         
-        # Get user details
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        cursor.execute(
-            "SELECT user_id, username FROM users WHERE email = %s",
-            (email,)
-        )
-        
-        user = cursor.fetchone()
-        
-        if not user:
-            cursor.close()
-            connection.close()
-            raise HTTPException(status_code=404, detail="User not found for this email")
-        
-        # Generate new OTP
+        # Generate new OTP and store it against the user's pending verification
         otp = generate_otp()
-        expires_at = datetime.now() + timedelta(minutes=10)
-        
-        # Check if there's an existing OTP for this user
-        cursor.execute(
-            "SELECT verification_id FROM user_verifications WHERE user_id = %s AND is_verified = FALSE",
-            (user['user_id'],)
-        )
-        
-        existing_verification = cursor.fetchone()
-        
-        if existing_verification:
-            # Update existing verification
-            cursor.execute(
-                """
-                UPDATE user_verifications 
-                SET otp = %s, created_at = %s, expires_at = %s, attempts = 0
-                WHERE verification_id = %s
-                """,
-                (otp, datetime.now(), expires_at, existing_verification['verification_id'])
-            )
-        else:
-            # Create new verification
-            cursor.execute(
-                """
-                INSERT INTO user_verifications 
-                (user_id, email, otp, created_at, expires_at)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (user['user_id'], email, otp, datetime.now(), expires_at)
-            )
-        
-        connection.commit()
+        user, expires_at = await run_db(_store_verification_otp, email, otp, "User not found for this email")
         
         # Send OTP email
         email_subject = "EcoLafaek - New Verification Code"
@@ -2113,9 +1747,6 @@ async def resend_otp(request: ResendOTPRequest):
         # Send the email
         email_sent = send_email(email, email_subject, email_body)
         
-        cursor.close()
-        connection.close()
-        
         if email_sent:
             return {
                 "status": "success",
@@ -2140,38 +1771,25 @@ async def resend_otp(request: ResendOTPRequest):
 async def change_password(password_data: ChangePassword, user_id: int = Depends(get_user_from_token)):
     try:
         # Get user's current password hash
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        cursor.execute(
+        user = await fetch_one(
             "SELECT password_hash FROM users WHERE user_id = %s",
             (user_id,)
         )
         
-        user = cursor.fetchone()
-        
         if not user:
-            cursor.close()
-            connection.close()
             raise HTTPException(status_code=404, detail="User not found")
         
         # Verify current password
         if not verify_password(user['password_hash'], password_data.current_password):
-            cursor.close()
-            connection.close()
             raise HTTPException(status_code=401, detail="Current password is incorrect")
         
         # Update password
         new_password_hash = hash_password(password_data.new_password)
         
-        cursor.execute(
+        await execute(
             "UPDATE users SET password_hash = %s WHERE user_id = %s",
             (new_password_hash, user_id)
         )
-        connection.commit()
-        
-        cursor.close()
-        connection.close()
         
         return {
             "status": "success",
@@ -2209,17 +1827,13 @@ async def update_user(user_id: int, update_data: UpdateUserProfile, current_user
         values.append(user_id)  # Add user_id for the WHERE clause
         
         # Update the user profile
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        cursor.execute(
+        await execute(
             f"UPDATE users SET {set_clause} WHERE user_id = %s",
             values
         )
-        connection.commit()
         
         # Get the updated user data
-        cursor.execute(
+        updated_user = await fetch_one(
             """
             SELECT user_id, username, email, phone_number, registration_date, 
                    last_login, account_status, profile_image_url, verification_status
@@ -2229,10 +1843,6 @@ async def update_user(user_id: int, update_data: UpdateUserProfile, current_user
             (user_id,)
         )
         
-        updated_user = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
         # Convert datetime objects to strings
         if updated_user:
             for key, value in updated_user.items():
@@ -2259,10 +1869,7 @@ async def get_user(user_id: int, current_user_id: int = Depends(get_user_from_to
             raise HTTPException(status_code=403, detail="Access denied. You can only view your own profile")
         
         # Get user details
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        cursor.execute(
+        user = await fetch_one(
             """
             SELECT user_id, username, email, phone_number, registration_date, 
                    last_login, account_status, profile_image_url, verification_status
@@ -2271,10 +1878,6 @@ async def get_user(user_id: int, current_user_id: int = Depends(get_user_from_to
             (user_id,)
         )
         
-        user = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -2295,86 +1898,87 @@ async def get_user(user_id: int, current_user_id: int = Depends(get_user_from_to
         raise HTTPException(status_code=500, detail=str(e))
 
 # Report submission and processing
-@app.post("/api/reports", response_model=dict)
-@limiter.limit("20/hour")  # Rate limit report submissions
-async def submit_report(report_data: ReportCreate, background_tasks: BackgroundTasks, request: Request, user_id: int = Depends(get_user_from_token)):
-    try:
-        # Validate user permissions (check if user_id matches authenticated user)
-        if user_id != report_data.user_id:
-            raise HTTPException(status_code=403, detail="You can only submit reports for your own account")
-        
-        # Process image if provided
-        image_url = None
-        if report_data.image_data:
-            # Generate a unique filename
-            filename = f"report_{int(time.time())}_{report_data.user_id}.jpg"
-            image_url = upload_image_to_s3(report_data.image_data, filename)
-            
-            if not image_url:
-                raise HTTPException(status_code=500, detail="Failed to upload image")
-        
-        # Insert report into database
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        
+def _insert_report(report_data: ReportCreate, image_url: Optional[str]):
+    """Insert a new report with its processing queue entry and activity log, returning the report ID"""
+    # Insert report into database
+    with db_session(dictionary=False) as (connection, cursor):
         # Determine location_id if available
         location_id = None
-        if report_data.latitude and report_data.longitude:
-            # Find nearest location within 1km
-            cursor.execute("""
-                SELECT location_id 
+        if report_data.latitude and report_data.longitude and location_index.ready:
+            # Find nearest location within 1km from the in-memory index
+            location_id = location_index.nearest(report_data.latitude, report_data.longitude, 1)
+        elif report_data.latitude and report_data.longitude:
+            # Index not loaded yet: find nearest location within 1km in the database
+            nearest = RadiusFilter(report_data.latitude, report_data.longitude, 1)
+            cursor.execute(f"""
+                SELECT location_id, {nearest.distance_sql} AS distance
                 FROM locations 
-                WHERE 
-                    (6371 * acos(cos(radians(%s)) * cos(radians(latitude)) * 
-                    cos(radians(longitude) - radians(%s)) + 
-                    sin(radians(%s)) * sin(radians(latitude)))) < 1
-                ORDER BY
-                    (6371 * acos(cos(radians(%s)) * cos(radians(latitude)) * 
-                    cos(radians(longitude) - radians(%s)) + 
-                    sin(radians(%s)) * sin(radians(latitude)))) ASC
+                WHERE {nearest.where_sql}
+                ORDER BY distance ASC
                 LIMIT 1
-            """, (report_data.latitude, report_data.longitude, report_data.latitude, 
-                  report_data.latitude, report_data.longitude, report_data.latitude))
+            """, (*nearest.distance_params, *nearest.where_params))
             result = cursor.fetchone()
             if result:
                 location_id = result[0]
-        
+            
         # Insert report
         device_info_json = json.dumps(report_data.device_info) if report_data.device_info else None
-        
+            
         cursor.execute("""
             INSERT INTO reports 
-            (user_id, latitude, longitude, location_id, description, status, image_url, device_info) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            (user_id, latitude, longitude, geohash, location_id, description, status, image_url, device_info) 
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
         """, (
             report_data.user_id, 
             report_data.latitude, 
             report_data.longitude, 
+            geohash_encode(report_data.latitude, report_data.longitude),
             location_id, 
             report_data.description, 
             'submitted',
             image_url,
             device_info_json
         ))
-        
+            
         report_id = cursor.lastrowid
-        
+            
         # Add entry to image processing queue if there's an image
         if image_url:
             cursor.execute(
                 "INSERT INTO image_processing_queue (report_id, image_url) VALUES (%s, %s)",
                 (report_id, image_url)
             )
-        
+            
         # Log the activity
         cursor.execute(
             "INSERT INTO system_logs (agent, action, details, related_id, related_table) VALUES (%s, %s, %s, %s, %s)",
             ('api_server', 'report_created', f'New waste report submitted by user {report_data.user_id}', report_id, 'reports')
         )
-        
+            
         connection.commit()
-        cursor.close()
-        connection.close()
+            
+        return report_id
+
+@app.post("/api/reports", response_model=dict)
+@limiter.limit("20/hour")  # Rate limit report submissions
+async def submit_report(report_data: ReportCreate, background_tasks: BackgroundTasks, request: Request, user_id: int = Depends(get_user_from_token)):
+    try:
+        # Validate user permissions (check if user_id matches authenticated user)
+        if user_id != report_data.user_id:
+            raise HTTPException(status_code=403, detail="You can only submit reports for your own account")
+        
+        # Process image if provided
+        image_url = None
+        if report_data.image_data:
+            # Generate a unique filename
+            filename = f"report_{int(time.time())}_{report_data.user_id}.jpg"
+            # The S3 upload and the blob cache write block, so they run off the event loop
+            image_url = await asyncio.to_thread(upload_image_to_s3, report_data.image_data, filename)
+            
+            if not image_url:
+                raise HTTPException(status_code=500, detail="Failed to upload image")
+        
+        report_id = await run_db(_insert_report, report_data, image_url)
         
         # Process report with image analysis if an image was provided
         notification_message = "No image provided, analysis skipped"
@@ -2395,28 +1999,20 @@ async def submit_report(report_data: ReportCreate, background_tasks: BackgroundT
         logger.error(f"Error in submit_report: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/reports/{report_id}", response_model=dict)
+@app.get("/api/reports/{report_id:int}", response_model=dict)
 async def get_report(report_id: int, user_id: int = Depends(get_user_from_token)):
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
         # First check if the report exists and if the user has permission to view it
-        cursor.execute(
+        report_owner = await fetch_one(
             "SELECT user_id FROM reports WHERE report_id = %s",
             (report_id,)
         )
         
-        report_owner = cursor.fetchone()
         if not report_owner:
-            cursor.close()
-            connection.close()
             raise HTTPException(status_code=404, detail="Report not found")
         
         # Allow access if it's the user's own report
         if report_owner['user_id'] != user_id:
-            cursor.close()
-            connection.close()
             raise HTTPException(status_code=403, detail="Access denied. You can only view your own reports.")
         
         # Get the full report details
@@ -2428,11 +2024,7 @@ async def get_report(report_id: int, user_id: int = Depends(get_user_from_token)
             WHERE r.report_id = %s
         """
         
-        cursor.execute(query, (report_id,))
-        report = cursor.fetchone()
-        
-        cursor.close()
-        connection.close()
+        report = await fetch_one(query, (report_id,))
         
         # Convert datetime objects to strings
         if report:
@@ -2448,85 +2040,29 @@ async def get_report(report_id: int, user_id: int = Depends(get_user_from_token)
         logger.error(f"Error in get_report: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.delete("/api/reports/{report_id}", response_model=dict)
-async def delete_report(report_id: int, user_id: int = Depends(get_user_from_token)):
-    try:
-        # Connect to the database
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-
-        # Check if the report exists and belongs to the user
-        cursor.execute("SELECT user_id FROM reports WHERE report_id = %s", (report_id,))
+def _delete_report(report_id: int, user_id: int):
+    """Delete a user's report and its dependent rows, shrinking or removing affected hotspots"""
+    # Check if the report exists and belongs to the user
+    with db_session() as (connection, cursor):
+        cursor.execute("SELECT user_id, latitude, longitude FROM reports WHERE report_id = %s", (report_id,))
         report = cursor.fetchone()
 
-        if not report:
-            cursor.close()
-            connection.close()
-            raise HTTPException(status_code=404, detail="Report not found")
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
 
-        if int(report['user_id']) != int(user_id):
-            cursor.close()
-            connection.close()
-            raise HTTPException(status_code=403, detail="Access denied. You can only delete your own reports.")
+    if int(report['user_id']) != int(user_id):
+        raise HTTPException(status_code=403, detail="Access denied. You can only delete your own reports.")
 
-        # Handle hotspot count decrements before deleting
-        # First, get all hotspots that include this report
-        cursor.execute(
-            """
-            SELECT h.hotspot_id, h.total_reports
-            FROM hotspots h
-            JOIN hotspot_reports hr ON h.hotspot_id = hr.hotspot_id
-            WHERE hr.report_id = %s
-            """,
-            (report_id,)
-        )
-        affected_hotspots = cursor.fetchall()
-        
-        # Update or delete hotspots based on remaining report count
-        for hotspot in affected_hotspots:
-            hotspot_id = hotspot['hotspot_id']
-            new_count = hotspot['total_reports'] - 1
-            
-            if new_count < 3:  # Below minimum threshold - delete hotspot
-                logger.info(f"Deleting hotspot {hotspot_id} - report count below threshold ({new_count})")
-                cursor.execute("DELETE FROM hotspot_reports WHERE hotspot_id = %s", (hotspot_id,))
-                cursor.execute("DELETE FROM hotspots WHERE hotspot_id = %s", (hotspot_id,))
-            else:  # Update count and recalculate average severity
-                logger.info(f"Updating hotspot {hotspot_id} - new count: {new_count}")
-                cursor.execute(
-                    """
-                    UPDATE hotspots 
-                    SET total_reports = %s
-                    WHERE hotspot_id = %s
-                    """,
-                    (new_count, hotspot_id)
-                )
-                
-                # Recalculate average severity (excluding the report being deleted)
-                cursor.execute(
-                    """
-                    SELECT AVG(ar.severity_score) as avg_severity
-                    FROM hotspot_reports hr
-                    JOIN analysis_results ar ON hr.report_id = ar.report_id
-                    WHERE hr.hotspot_id = %s AND hr.report_id != %s
-                    """,
-                    (hotspot_id, report_id)
-                )
-                
-                avg_result = cursor.fetchone()
-                if avg_result and avg_result['avg_severity'] is not None:
-                    cursor.execute(
-                        """
-                        UPDATE hotspots
-                        SET average_severity = %s
-                        WHERE hotspot_id = %s
-                        """,
-                        (avg_result['avg_severity'], hotspot_id)
-                    )
+    # Hotspot rows and the engine's clusters change together, under the report's cell locks.
+    # The locks come before the connection, in the same order as the analysis store path
+    with hotspot_engine.transaction(report), db_session() as (connection, cursor):
+        # Shrink or remove the hotspots that include this report
+        unlink_report(cursor, report_id)
 
         # Delete from related tables in correct order
         cursor.execute("DELETE FROM hotspot_reports WHERE report_id = %s", (report_id,))
         cursor.execute("DELETE FROM image_processing_queue WHERE report_id = %s", (report_id,))
+        cursor.execute("DELETE FROM image_fingerprints WHERE report_id = %s", (report_id,))
         cursor.execute(
             """DELETE rw FROM report_waste_types rw 
                JOIN analysis_results a ON rw.analysis_id = a.analysis_id 
@@ -2535,11 +2071,20 @@ async def delete_report(report_id: int, user_id: int = Depends(get_user_from_tok
         )
         cursor.execute("DELETE FROM analysis_results WHERE report_id = %s", (report_id,))
         cursor.execute("DELETE FROM reports WHERE report_id = %s", (report_id,))
+        if cursor.rowcount == 0:
+            # Deleted by another request since the check; the session rolls back
+            raise HTTPException(status_code=404, detail="Report not found")
 
         # Commit changes
         connection.commit()
-        cursor.close()
-        connection.close()
+        hotspot_engine.remove_report(report_id)
+
+    image_fingerprints.forget(report_id)
+
+@app.delete("/api/reports/{report_id:int}", response_model=dict)
+async def delete_report(report_id: int, user_id: int = Depends(get_user_from_token)):
+    try:
+        await run_db(_delete_report, report_id, user_id)
 
         return {"status": "success", "message": "Report deleted successfully"}
 
@@ -2575,10 +2120,6 @@ async def get_reports(
         # Calculate offset for pagination
         offset = (page - 1) * per_page
         
-        # Get reports
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
         # Get total count
         count_query = f"""
             SELECT COUNT(*) as count
@@ -2588,8 +2129,7 @@ async def get_reports(
             WHERE {where_clause}
         """
         
-        cursor.execute(count_query, params)
-        count_result = cursor.fetchone()
+        count_result = await fetch_one(count_query, params, read_only=True)
         total_reports = count_result['count'] if count_result else 0
 
         # Get status counts for the user
@@ -2601,8 +2141,7 @@ async def get_reports(
             WHERE user_id = %s
             GROUP BY status
         """
-        cursor.execute(status_query, [user_id])
-        status_results = cursor.fetchall()
+        status_results = await fetch_all(status_query, [user_id], read_only=True)
 
         # Build status counts dictionary
         status_counts = {
@@ -2624,10 +2163,7 @@ async def get_reports(
             LIMIT %s OFFSET %s
         """
         
-        cursor.execute(report_query, params + [per_page, offset])
-        reports = cursor.fetchall()
-        cursor.close()
-        connection.close()
+        reports = await fetch_all(report_query, params + [per_page, offset], read_only=True)
 
         # Convert datetime objects to strings
         for report in reports:
@@ -2652,6 +2188,22 @@ async def get_reports(
         logger.error(f"Get reports error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _encode_nearby_cursor(lat: float, lon: float, radius: float, distance: float, report_id: int) -> str:
+    """Opaque continuation token: the query it belongs to and the last (distance, report_id) returned"""
+    payload = json.dumps({"q": [lat, lon, radius], "d": distance, "id": report_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def _decode_nearby_cursor(cursor: str, lat: float, lon: float, radius: float) -> Tuple[float, int]:
+    """Validate a continuation token against the current query, returning its (distance, report_id)"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        query, distance, report_id = payload["q"], float(payload["d"]), int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if query != [lat, lon, radius]:
+        raise HTTPException(status_code=400, detail="Cursor does not match lat, lon and radius")
+    return distance, report_id
+
 @app.get("/api/reports/nearby", response_model=dict)
 async def get_nearby_reports(
     lat: float,
@@ -2659,70 +2211,103 @@ async def get_nearby_reports(
     radius: float = 5.0,
     page: int = 1,
     per_page: int = 10,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None,
     user_id: int = Depends(get_user_from_token)
 ):
+    """
+    Reports within radius km ordered by distance.
+
+    Pass the returned next_cursor to continue from the last report seen (keyset
+    pagination). page/per_page offsets still work for older clients. The total is
+    counted on requests without a cursor unless include_total=false.
+
+    The distance can't be indexed, so every page, cursor or not, still reads and
+    sorts all reports in the radius's bounding box; the cursor only saves skipping
+    the earlier pages' rows. Page cost is bounded by the box, not the table.
+    """
     try:
-        # Calculate offset for pagination
-        offset = (page - 1) * per_page
-        
-        # Get nearby reports
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get total count using Haversine formula
-        count_query = """
-            SELECT COUNT(*) as count
-            FROM reports r
-            WHERE (
-                6371 * acos(
-                    cos(radians(%s)) * cos(radians(latitude)) * 
-                    cos(radians(longitude) - radians(%s)) + 
-                    sin(radians(%s)) * sin(radians(latitude))
-                )
-            ) < %s
-        """
-        
-        cursor.execute(count_query, (lat, lon, lat, radius))
-        count_result = cursor.fetchone()
-        total_reports = count_result['count'] if count_result else 0
-        
-        # Get reports with pagination
-        report_query = """
+        per_page = min(max(per_page, 1), 100)
+        if include_total is None:
+            include_total = cursor is None
+
+        # Bounding box first, so the location index narrows the rows the
+        # Haversine distance is computed for
+        nearby = RadiusFilter(lat, lon, radius, 'r.latitude', 'r.longitude')
+
+        total_reports = None
+        if include_total:
+            count_query = f"""
+                SELECT COUNT(*) as count
+                FROM reports r
+                WHERE {nearby.where_sql}
+            """
+            
+            count_result = await fetch_one(count_query, nearby.where_params, read_only=True, prepared=True)
+            total_reports = count_result['count'] if count_result else 0
+        
+        # Get one page of reports, plus one row to tell whether another page follows
+        if cursor:
+            last_distance, last_report_id = _decode_nearby_cursor(cursor, lat, lon, radius)
+            page_clause = "AND (distance > %s OR (distance = %s AND r.report_id > %s))"
+            page_params = (last_distance, last_distance, last_report_id, per_page + 1)
+            limit_clause = "LIMIT %s"
+        else:
+            page_clause = ""
+            page_params = (per_page + 1, (page - 1) * per_page)
+            limit_clause = "LIMIT %s OFFSET %s"
+
+        # Only each report's latest analysis: a re-analyzed report would otherwise
+        # come back once per analysis, and (distance, report_id) would stop being unique
+        report_query = f"""
             SELECT r.*, a.severity_score, a.priority_level, w.name as waste_type,
-                   (
-                       6371 * acos(
-                           cos(radians(%s)) * cos(radians(latitude)) * 
-                           cos(radians(longitude) - radians(%s)) + 
-                           sin(radians(%s)) * sin(radians(latitude))
-                       )
-                   ) as distance
+                   {nearby.distance_sql} as distance
             FROM reports r
             LEFT JOIN analysis_results a ON r.report_id = a.report_id
             LEFT JOIN waste_types w ON a.waste_type_id = w.waste_type_id
-            HAVING distance < %s
-            ORDER BY distance
-            LIMIT %s OFFSET %s
+            WHERE {nearby.box_sql}
+              AND NOT EXISTS (
+                  SELECT 1 FROM analysis_results newer
+                  WHERE newer.report_id = r.report_id AND newer.analysis_id > a.analysis_id
+              )
+            HAVING distance < %s {page_clause}
+            ORDER BY distance, r.report_id
+            {limit_clause}
         """
         
-        cursor.execute(report_query, (lat, lon, lat, radius, per_page, offset))
-        reports = cursor.fetchall()
-        cursor.close()
-        connection.close()
+        reports = await fetch_all(
+            report_query,
+            (*nearby.distance_params, *nearby.box_params, radius, *page_params),
+            read_only=True, prepared=True
+        )
+
+        has_more = len(reports) > per_page
+        reports = reports[:per_page]
+        next_cursor = None
+        if has_more:
+            last = reports[-1]
+            next_cursor = _encode_nearby_cursor(lat, lon, radius, last['distance'], last['report_id'])
         
         # Convert datetime objects to strings
         for report in reports:
             if 'report_date' in report and report['report_date']:
                 report['report_date'] = report['report_date'].strftime('%Y-%m-%d %H:%M:%S')
         
+        pagination = {
+            "total": total_reports,
+            "per_page": per_page,
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        }
+        if not cursor:
+            pagination["page"] = page
+            if total_reports is not None:
+                pagination["total_pages"] = (total_reports + per_page - 1) // per_page
+
         return {
             "status": "success",
             "reports": reports,
-            "pagination": {
-                "total": total_reports,
-                "page": page,
-                "per_page": per_page,
-                "total_pages": (total_reports + per_page - 1) // per_page
-            }
+            "pagination": pagination
         }
         
     except HTTPException as e:
@@ -2735,10 +2320,7 @@ async def get_nearby_reports(
 async def get_waste_types(user_id: int = Depends(get_user_from_token)):
     try:
         # Get waste types
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
-        cursor.execute(
+        waste_types = await fetch_all(
             """
             SELECT waste_type_id, name, description, hazard_level, recyclable, icon_url
             FROM waste_types
@@ -2746,10 +2328,6 @@ async def get_waste_types(user_id: int = Depends(get_user_from_token)):
             """
         )
         
-        waste_types = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        
         return {
             "status": "success",
             "waste_types": waste_types
@@ -2761,60 +2339,41 @@ async def get_waste_types(user_id: int = Depends(get_user_from_token)):
         logger.error(f"Get waste types error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/hotspots", response_model=dict)
-async def get_hotspots(
-    lat: Optional[float] = None,
-    lon: Optional[float] = None,
-    radius: float = 10.0,
-    page: int = 1,
-    per_page: int = 10,
-    user_id: int = Depends(get_user_from_token)
-):
-    try:
-        # Calculate offset for pagination
-        offset = (page - 1) * per_page
-        
-        # Get hotspots
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
+def _fetch_hotspots(lat: Optional[float], lon: Optional[float], radius: float, per_page: int, offset: int):
+    """Fetch one page of hotspots (optionally near a point) with their report counts, returning (total, hotspots)"""
+    # Get hotspots
+    with db_session(read_only=True) as (connection, cursor):
         if lat is not None and lon is not None:
             # Get hotspots near a specific location
-            count_query = """
+            nearby = RadiusFilter(lat, lon, radius, 'center_latitude', 'center_longitude')
+            count_query = f"""
                 SELECT COUNT(*) as count
                 FROM hotspots
-                WHERE (
-                    6371 * acos(
-                        cos(radians(%s)) * cos(radians(center_latitude)) * 
-                        cos(radians(center_longitude) - radians(%s)) + 
-                        sin(radians(%s)) * sin(radians(center_latitude))
-                    )
-                ) < %s
+                WHERE {nearby.where_sql}
             """
             
-            cursor.execute(count_query, (lat, lon, lat, radius))
-            count_result = cursor.fetchone()
+            count_result = execute_prepared(connection, count_query, nearby.where_params, fetch='one')
             total_hotspots = count_result['count'] if count_result else 0
             
             # Get hotspots with pagination
-            hotspot_query = """
+            hotspot_query = f"""
                 SELECT h.*,
-                       (
-                           6371 * acos(
-                               cos(radians(%s)) * cos(radians(center_latitude)) * 
-                               cos(radians(center_longitude) - radians(%s)) + 
-                               sin(radians(%s)) * sin(radians(center_latitude))
-                           )
-                       ) as distance,
+                       {nearby.distance_sql} as distance,
                        l.name as location_name
                 FROM hotspots h
                 LEFT JOIN locations l ON h.location_id = l.location_id
+                WHERE {nearby.box_sql}
                 HAVING distance < %s
                 ORDER BY distance
                 LIMIT %s OFFSET %s
             """
             
-            cursor.execute(hotspot_query, (lat, lon, lat, radius, per_page, offset))
+            hotspots = execute_prepared(
+                connection,
+                hotspot_query,
+                (*nearby.distance_params, *nearby.box_params, radius, per_page, offset),
+                fetch='all'
+            )
         else:
             # Get all hotspots with pagination
             count_query = "SELECT COUNT(*) as count FROM hotspots"
@@ -2831,25 +2390,39 @@ async def get_hotspots(
             """
             
             cursor.execute(hotspot_query, (per_page, offset))
-        
-        hotspots = cursor.fetchall()
-        
+            hotspots = cursor.fetchall()
+            
         # For each hotspot, get a count of reports
         for hotspot in hotspots:
-            cursor.execute(
+            count_result = execute_prepared(
+                connection,
                 "SELECT COUNT(*) as report_count FROM hotspot_reports WHERE hotspot_id = %s",
-                (hotspot['hotspot_id'],)
+                (hotspot['hotspot_id'],),
+                fetch='one'
             )
-            count_result = cursor.fetchone()
             hotspot['report_count'] = count_result['report_count'] if count_result else 0
             
             # Convert date objects to strings
             for key, value in hotspot.items():
                 if isinstance(value, datetime):
                     hotspot[key] = value.strftime('%Y-%m-%d %H:%M:%S')
+            
+        return total_hotspots, hotspots
+
+@app.get("/api/hotspots", response_model=dict)
+async def get_hotspots(
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    radius: float = 10.0,
+    page: int = 1,
+    per_page: int = 10,
+    user_id: int = Depends(get_user_from_token)
+):
+    try:
+        # Calculate offset for pagination
+        offset = (page - 1) * per_page
         
-        cursor.close()
-        connection.close()
+        total_hotspots, hotspots = await run_read_db(_fetch_hotspots, lat, lon, radius, per_page, offset)
         
         return {
             "status": "success",
@@ -2868,21 +2441,103 @@ async def get_hotspots(
         logger.error(f"Get hotspots error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/hotspots/{hotspot_id}/reports", response_model=dict)
-async def get_hotspot_reports(
-    hotspot_id: int,
-    page: int = 1,
-    per_page: int = 10,
+@app.get("/api/map/clusters", response_model=dict)
+async def get_map_clusters(
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+    zoom: int,
     user_id: int = Depends(get_user_from_token)
 ):
+    """
+    Everything a map client needs for one viewport in a single request: report
+    clusters (count, centroid, dominant waste type) on a zoom-dependent grid, or
+    individual reports at street zoom, plus the hotspots inside the bounds.
+    """
+    try:
+        if not 0 <= zoom <= 22:
+            raise HTTPException(status_code=400, detail="zoom must be between 0 and 22")
+        try:
+            viewport = Viewport(min_lat, min_lon, max_lat, max_lon)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        view = await run_read_db(fetch_map_view, viewport, zoom)
+
+        return {
+            "status": "success",
+            "zoom": zoom,
+            **view
+        }
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Get map clusters error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/export/{dataset}", dependencies=[Depends(require_api_key)])
+async def export_dataset(
+    dataset: str,
+    format: str = "geojson",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    status: Optional[str] = None,
+    waste_type: Optional[str] = None
+):
+    """
+    Stream every report (with its analysis) or hotspot matching the filters as
+    GeoJSON or NDJSON. The response is written while rows are read, so exports
+    of any size use constant memory.
+    """
     try:
-        # Calculate offset for pagination
-        offset = (page - 1) * per_page
-        
-        # Get reports for the hotspot
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
+        if format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+        try:
+            query, params = build_export_query(dataset, date_from, date_to, status, waste_type)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if export_slots.locked():
+            raise HTTPException(status_code=429, detail="Too many exports in progress, try again later")
+        # Released by stream_export() when its producer is done with the read connection
+        await export_slots.acquire()
+
+        stream = stream_export(dataset, format, query, params)
+        try:
+            # Pull the first chunk here so query errors still get a proper error response
+            first_chunk = await stream.__anext__()
+        except StopAsyncIteration:
+            first_chunk = b""
+
+        async def body():
+            try:
+                yield first_chunk
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                # The slot is released by the export's producer once its connection is back
+                await stream.aclose()
+
+        extension = "geojson" if format == "geojson" else "ndjson"
+        filename = f"ecolafaek-{dataset}-{datetime.now().strftime('%Y%m%d')}.{extension}"
+        return StreamingResponse(
+            body(),
+            media_type=EXPORT_FORMATS[format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Export {dataset} error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _fetch_hotspot_reports(hotspot_id: int, per_page: int, offset: int):
+    """Fetch one page of reports linked to a hotspot, returning (total, reports)"""
+    # Get reports for the hotspot
+    with db_session(read_only=True) as (connection, cursor):
         # Get total count
         count_query = """
             SELECT COUNT(*) as count
@@ -2890,11 +2545,11 @@ async def get_hotspot_reports(
             JOIN reports r ON hr.report_id = r.report_id
             WHERE hr.hotspot_id = %s
         """
-        
+            
         cursor.execute(count_query, (hotspot_id,))
         count_result = cursor.fetchone()
         total_reports = count_result['count'] if count_result else 0
-        
+            
         # Get reports with pagination
         report_query = """
             SELECT r.*, a.severity_score, a.priority_level, w.name as waste_type
@@ -2906,11 +2561,24 @@ async def get_hotspot_reports(
             ORDER BY r.report_date DESC
             LIMIT %s OFFSET %s
         """
-        
+            
         cursor.execute(report_query, (hotspot_id, per_page, offset))
         reports = cursor.fetchall()
-        cursor.close()
-        connection.close()
+            
+        return total_reports, reports
+
+@app.get("/api/hotspots/{hotspot_id}/reports", response_model=dict)
+async def get_hotspot_reports(
+    hotspot_id: int,
+    page: int = 1,
+    per_page: int = 10,
+    user_id: int = Depends(get_user_from_token)
+):
+    try:
+        # Calculate offset for pagination
+        offset = (page - 1) * per_page
+        
+        total_reports, reports = await run_read_db(_fetch_hotspot_reports, hotspot_id, per_page, offset)
         
         # Convert datetime objects to strings
         for report in reports:
@@ -2934,12 +2602,9 @@ async def get_hotspot_reports(
         logger.error(f"Get hotspot reports error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/dashboard/statistics", response_model=dict)
-async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        
+def _fetch_dashboard_statistics(user_id: int):
+    """Run the dashboard aggregation queries for a user on a single connection"""
+    with db_session(read_only=True, stale_ok=True) as (connection, cursor):
         # Get user's report counts
         cursor.execute(
             """
@@ -2952,10 +2617,11 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
             """,
             (user_id,)
         )
-        
+            
         user_stats = cursor.fetchone()
-        
-        # Get waste type distribution for this user
+            
+        # Get waste type distribution for this user (each report's latest analysis only,
+        # so re-analyzed reports aren't counted twice here or below)
         cursor.execute(
             """
             SELECT w.name, COUNT(*) as count 
@@ -2963,14 +2629,18 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
             JOIN analysis_results a ON r.report_id = a.report_id
             JOIN waste_types w ON a.waste_type_id = w.waste_type_id
             WHERE r.user_id = %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM analysis_results newer
+                  WHERE newer.report_id = r.report_id AND newer.analysis_id > a.analysis_id
+              )
             GROUP BY w.name
             ORDER BY count DESC
             """,
             (user_id,)
         )
-        
+            
         waste_distribution = cursor.fetchall()
-        
+            
         # Get severity distribution 
         cursor.execute(
             """
@@ -2978,14 +2648,18 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
             FROM reports r
             JOIN analysis_results a ON r.report_id = a.report_id
             WHERE r.user_id = %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM analysis_results newer
+                  WHERE newer.report_id = r.report_id AND newer.analysis_id > a.analysis_id
+              )
             GROUP BY a.severity_score
             ORDER BY a.severity_score
             """,
             (user_id,)
         )
-        
+            
         severity_distribution = cursor.fetchall()
-        
+            
         # Get priority level distribution
         cursor.execute(
             """
@@ -2993,6 +2667,10 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
             FROM reports r
             JOIN analysis_results a ON r.report_id = a.report_id
             WHERE r.user_id = %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM analysis_results newer
+                  WHERE newer.report_id = r.report_id AND newer.analysis_id > a.analysis_id
+              )
             GROUP BY a.priority_level
             ORDER BY 
                 CASE a.priority_level 
@@ -3004,9 +2682,9 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
             """,
             (user_id,)
         )
-        
+            
         priority_distribution = cursor.fetchall()
-        
+            
         # Get user's reports by month
         cursor.execute(
             """
@@ -3021,9 +2699,9 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
             """,
             (user_id,)
         )
-        
+            
         monthly_reports = cursor.fetchall()
-        
+            
         # Get recent reports
         cursor.execute(
             """
@@ -3039,14 +2717,14 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
             """,
             (user_id,)
         )
-        
+            
         recent_reports = cursor.fetchall()
-        
+            
         # Convert datetime objects to strings in all results
         for report in recent_reports:
             if 'report_date' in report and report['report_date']:
                 report['report_date'] = report['report_date'].strftime('%Y-%m-%d %H:%M:%S')
-        
+            
         # Get community statistics (user ranking and total contributors)
         cursor.execute(
             """
@@ -3054,10 +2732,10 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
             FROM reports
             WHERE user_id IS NOT NULL
             """)
-        
+            
         community_result = cursor.fetchone()
         total_contributors = community_result['total_contributors'] if community_result else 0
-        
+            
         # Get user's ranking based on total reports
         cursor.execute(
             """
@@ -3074,21 +2752,17 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
             """,
             (user_id,)
         )
-        
+            
         ranking_result = cursor.fetchone()
         user_rank = ranking_result['ranking'] if ranking_result else None
-        
+            
         # Create community stats object
         community_stats = {
             'total_contributors': total_contributors,
             'user_rank': user_rank
         }
-        
-        cursor.close()
-        connection.close()
-        
+            
         return {
-            "status": "success",
             "user_stats": user_stats,
             "waste_distribution": waste_distribution,
             "severity_distribution": severity_distribution,
@@ -3097,6 +2771,16 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
             "recent_reports": recent_reports,
             "community_stats": community_stats
         }
+
+@app.get("/api/dashboard/statistics", response_model=dict)
+async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
+    try:
+        statistics = await run_read_db(_fetch_dashboard_statistics, user_id)
+        
+        return {
+            "status": "success",
+            **statistics
+        }
         
     except HTTPException as e:
         raise e
@@ -3108,15 +2792,8 @@ async def get_dashboard_statistics(user_id: int = Depends(get_user_from_token)):
 async def process_queue(background_tasks: BackgroundTasks, user_id: int = Depends(get_user_from_token)):
     """Process the queue of unanalyzed reports"""
     try:
-        # Get database connection
-        connection = get_db_connection()
-        if not connection:
-            raise HTTPException(status_code=500, detail="Failed to connect to database")
-        
-        cursor = connection.cursor(dictionary=True)
-        
         # Get unprocessed reports from the queue
-        cursor.execute(
+        queue_items = await fetch_all(
             """
             SELECT q.queue_id, q.report_id, q.image_url
             FROM image_processing_queue q
@@ -3126,10 +2803,6 @@ async def process_queue(background_tasks: BackgroundTasks, user_id: int = Depend
             """
         )
         
-        queue_items = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        
         if not queue_items:
             return {"status": "success", "message": "No items in the queue", "processed_count": 0}
         
@@ -3137,10 +2810,7 @@ async def process_queue(background_tasks: BackgroundTasks, user_id: int = Depend
         processed_count = 0
         for item in queue_items:
             # Update queue item status to processing
-            connection = get_db_connection()
-            cursor = connection.cursor()
-            
-            cursor.execute(
+            await execute(
                 """
                 UPDATE image_processing_queue
                 SET status = 'processing', processed_at = %s
@@ -3148,9 +2818,6 @@ async def process_queue(background_tasks: BackgroundTasks, user_id: int = Depend
                 """,
                 (datetime.now(), item['queue_id'])
             )
-            connection.commit()
-            cursor.close()
-            connection.close()
             
             # Add report to the background processing queue
             background_tasks.add_task(process_report, item['report_id'], background_tasks)
@@ -3333,40 +3000,35 @@ class ChatRequest(BaseModel):
 def get_waste_statistics() -> dict:
     """Get overall waste statistics from the database"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        # Get total reports
-        cursor.execute("SELECT COUNT(*) as total FROM reports")
-        total_reports = cursor.fetchone()['total']
-
-        # Get reports by status
-        cursor.execute("""
-            SELECT status, COUNT(*) as count
-            FROM reports
-            GROUP BY status
-        """)
-        status_counts = cursor.fetchall()
+        with db_session(read_only=True, stale_ok=True) as (conn, cursor):
+            # Get total reports
+            cursor.execute("SELECT COUNT(*) as total FROM reports")
+            total_reports = cursor.fetchone()['total']
 
-        # Get reports by waste type
-        cursor.execute("""
-            SELECT wt.name, COUNT(*) as count
-            FROM analysis_results ar
-            JOIN waste_types wt ON ar.waste_type_id = wt.waste_type_id
-            GROUP BY wt.name
-            ORDER BY count DESC
-            LIMIT 10
-        """)
-        waste_type_counts = cursor.fetchall()
+            # Get reports by status
+            cursor.execute("""
+                SELECT status, COUNT(*) as count
+                FROM reports
+                GROUP BY status
+            """)
+            status_counts = cursor.fetchall()
 
-        cursor.close()
-        conn.close()
+            # Get reports by waste type
+            cursor.execute("""
+                SELECT wt.name, COUNT(*) as count
+                FROM analysis_results ar
+                JOIN waste_types wt ON ar.waste_type_id = wt.waste_type_id
+                GROUP BY wt.name
+                ORDER BY count DESC
+                LIMIT 10
+            """)
+            waste_type_counts = cursor.fetchall()
 
-        return {
-            "total_reports": total_reports,
-            "status_breakdown": status_counts,
-            "top_waste_types": waste_type_counts
-        }
+            return {
+                "total_reports": total_reports,
+                "status_breakdown": status_counts,
+                "top_waste_types": waste_type_counts
+            }
     except Exception as e:
         logger.error(f"Error getting waste statistics: {e}")
         return {"error": str(e)}
@@ -3374,49 +3036,45 @@ def get_waste_statistics() -> dict:
 def search_reports_by_location(district: str = None, limit: int = 10) -> dict:
     """Search waste reports by location"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        if district:
-            cursor.execute("""
-                SELECT r.report_id, r.latitude, r.longitude, r.report_date,
-                       r.description, r.status, r.address_text,
-                       ar.severity_score, ar.priority_level, wt.name as waste_type
-                FROM reports r
-                LEFT JOIN analysis_results ar ON r.report_id = ar.report_id
-                LEFT JOIN waste_types wt ON ar.waste_type_id = wt.waste_type_id
-                WHERE r.address_text LIKE %s
-                ORDER BY r.report_date DESC
-                LIMIT %s
-            """, (f'%{district}%', limit))
-        else:
-            cursor.execute("""
-                SELECT r.report_id, r.latitude, r.longitude, r.report_date,
-                       r.description, r.status, r.address_text,
-                       ar.severity_score, ar.priority_level, wt.name as waste_type
-                FROM reports r
-                LEFT JOIN analysis_results ar ON r.report_id = ar.report_id
-                LEFT JOIN waste_types wt ON ar.waste_type_id = wt.waste_type_id
-                ORDER BY r.report_date DESC
-                LIMIT %s
-            """, (limit,))
-
-        reports = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
-        # Convert Decimal and date/datetime objects to JSON-serializable types
-        for report in reports:
-            if 'latitude' in report and report['latitude'] is not None:
-                report['latitude'] = float(report['latitude'])
-            if 'longitude' in report and report['longitude'] is not None:
-                report['longitude'] = float(report['longitude'])
-            if 'severity_score' in report and report['severity_score'] is not None:
-                report['severity_score'] = float(report['severity_score'])
-            if 'report_date' in report and report['report_date'] is not None:
-                report['report_date'] = report['report_date'].isoformat()
-
-        return {"reports": reports, "count": len(reports)}
+        with db_session(read_only=True, stale_ok=True) as (conn, cursor):
+            if district:
+                cursor.execute("""
+                    SELECT r.report_id, r.latitude, r.longitude, r.report_date,
+                           r.description, r.status, r.address_text,
+                           ar.severity_score, ar.priority_level, wt.name as waste_type
+                    FROM reports r
+                    LEFT JOIN analysis_results ar ON r.report_id = ar.report_id
+                    LEFT JOIN waste_types wt ON ar.waste_type_id = wt.waste_type_id
+                    WHERE r.address_text LIKE %s
+                    ORDER BY r.report_date DESC
+                    LIMIT %s
+                """, (f'%{district}%', limit))
+            else:
+                cursor.execute("""
+                    SELECT r.report_id, r.latitude, r.longitude, r.report_date,
+                           r.description, r.status, r.address_text,
+                           ar.severity_score, ar.priority_level, wt.name as waste_type
+                    FROM reports r
+                    LEFT JOIN analysis_results ar ON r.report_id = ar.report_id
+                    LEFT JOIN waste_types wt ON ar.waste_type_id = wt.waste_type_id
+                    ORDER BY r.report_date DESC
+                    LIMIT %s
+                """, (limit,))
+
+            reports = cursor.fetchall()
+
+            # Convert Decimal and date/datetime objects to JSON-serializable types
+            for report in reports:
+                if 'latitude' in report and report['latitude'] is not None:
+                    report['latitude'] = float(report['latitude'])
+                if 'longitude' in report and report['longitude'] is not None:
+                    report['longitude'] = float(report['longitude'])
+                if 'severity_score' in report and report['severity_score'] is not None:
+                    report['severity_score'] = float(report['severity_score'])
+                if 'report_date' in report and report['report_date'] is not None:
+                    report['report_date'] = report['report_date'].isoformat()
+
+            return {"reports": reports, "count": len(reports)}
     except Exception as e:
         logger.error(f"Error searching reports: {e}")
         return {"error": str(e)}
@@ -3424,36 +3082,32 @@ def search_reports_by_location(district: str = None, limit: int = 10) -> dict:
 def get_hotspot_information(limit: int = 10) -> dict:
     """Get information about waste hotspots"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        with db_session(read_only=True, stale_ok=True) as (conn, cursor):
+            cursor.execute("""
+                SELECT h.hotspot_id, h.name, h.center_latitude, h.center_longitude,
+                       h.total_reports, h.average_severity, h.status, h.first_reported, h.last_reported
+                FROM hotspots h
+                WHERE h.status = 'active'
+                ORDER BY h.average_severity DESC, h.total_reports DESC
+                LIMIT %s
+            """, (limit,))
 
-        cursor.execute("""
-            SELECT h.hotspot_id, h.name, h.center_latitude, h.center_longitude,
-                   h.total_reports, h.average_severity, h.status, h.first_reported, h.last_reported
-            FROM hotspots h
-            WHERE h.status = 'active'
-            ORDER BY h.average_severity DESC, h.total_reports DESC
-            LIMIT %s
-        """, (limit,))
-
-        hotspots = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
-        # Convert Decimal and date objects to JSON-serializable types
-        for hotspot in hotspots:
-            if 'center_latitude' in hotspot and hotspot['center_latitude'] is not None:
-                hotspot['center_latitude'] = float(hotspot['center_latitude'])
-            if 'center_longitude' in hotspot and hotspot['center_longitude'] is not None:
-                hotspot['center_longitude'] = float(hotspot['center_longitude'])
-            if 'average_severity' in hotspot and hotspot['average_severity'] is not None:
-                hotspot['average_severity'] = float(hotspot['average_severity'])
-            if 'first_reported' in hotspot and hotspot['first_reported'] is not None:
-                hotspot['first_reported'] = hotspot['first_reported'].isoformat()
-            if 'last_reported' in hotspot and hotspot['last_reported'] is not None:
-                hotspot['last_reported'] = hotspot['last_reported'].isoformat()
-
-        return {"hotspots": hotspots, "count": len(hotspots)}
+            hotspots = cursor.fetchall()
+
+            # Convert Decimal and date objects to JSON-serializable types
+            for hotspot in hotspots:
+                if 'center_latitude' in hotspot and hotspot['center_latitude'] is not None:
+                    hotspot['center_latitude'] = float(hotspot['center_latitude'])
+                if 'center_longitude' in hotspot and hotspot['center_longitude'] is not None:
+                    hotspot['center_longitude'] = float(hotspot['center_longitude'])
+                if 'average_severity' in hotspot and hotspot['average_severity'] is not None:
+                    hotspot['average_severity'] = float(hotspot['average_severity'])
+                if 'first_reported' in hotspot and hotspot['first_reported'] is not None:
+                    hotspot['first_reported'] = hotspot['first_reported'].isoformat()
+                if 'last_reported' in hotspot and hotspot['last_reported'] is not None:
+                    hotspot['last_reported'] = hotspot['last_reported'].isoformat()
+
+            return {"hotspots": hotspots, "count": len(hotspots)}
     except Exception as e:
         logger.error(f"Error getting hotspots: {e}")
         return {"error": str(e)}
@@ -3461,20 +3115,16 @@ def get_hotspot_information(limit: int = 10) -> dict:
 def get_waste_types_info() -> dict:
     """Get information about waste types and categories"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute("""
-            SELECT waste_type_id, name, description, hazard_level, recyclable
-            FROM waste_types
-            ORDER BY name
-        """)
+        with db_session(read_only=True, stale_ok=True) as (conn, cursor):
+            cursor.execute("""
+                SELECT waste_type_id, name, description, hazard_level, recyclable
+                FROM waste_types
+                ORDER BY name
+            """)
 
-        waste_types = cursor.fetchall()
-        cursor.close()
-        conn.close()
+            waste_types = cursor.fetchall()
 
-        return {"waste_types": waste_types, "count": len(waste_types)}
+            return {"waste_types": waste_types, "count": len(waste_types)}
     except Exception as e:
         logger.error(f"Error getting waste types: {e}")
         return {"error": str(e)}
@@ -3493,32 +3143,28 @@ def execute_sql_query(sql_query: str) -> dict:
             if keyword in query_upper:
                 return {"error": f"Query contains forbidden keyword: {keyword}"}
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        with db_session(read_only=True, stale_ok=True) as (conn, cursor):
+            # Execute the query with a limit to prevent large result sets
+            if 'LIMIT' not in query_upper:
+                sql_query = sql_query.rstrip(';') + ' LIMIT 100'
 
-        # Execute the query with a limit to prevent large result sets
-        if 'LIMIT' not in query_upper:
-            sql_query = sql_query.rstrip(';') + ' LIMIT 100'
+            cursor.execute(sql_query)
+            results = cursor.fetchall()
 
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
+            # Convert non-serializable types
+            for row in results:
+                for key, value in row.items():
+                    if hasattr(value, 'isoformat'):  # datetime/date
+                        row[key] = value.isoformat()
+                    elif isinstance(value, type(Decimal('0'))):  # Decimal
+                        row[key] = float(value)
 
-        # Convert non-serializable types
-        for row in results:
-            for key, value in row.items():
-                if hasattr(value, 'isoformat'):  # datetime/date
-                    row[key] = value.isoformat()
-                elif isinstance(value, type(Decimal('0'))):  # Decimal
-                    row[key] = float(value)
-
-        return {
-            "success": True,
-            "rows": results,
-            "count": len(results),
-            "query": sql_query
-        }
+            return {
+                "success": True,
+                "rows": results,
+                "count": len(results),
+                "query": sql_query
+            }
     except Exception as e:
         error_msg = str(e)
         logger.error(f"Error executing SQL query: {error_msg}")
@@ -3865,7 +3511,7 @@ User question: {user_message}"""
                             # Execute the appropriate tool
                             if tool_name == "execute_sql_query":
                                 sql_query = tool_input.get('sql_query', '')
-                                result = execute_sql_query(sql_query)
+                                result = await run_read_db(execute_sql_query, sql_query)
                             elif tool_name == "get_ecolafaek_info":
                                 topic = tool_input.get('topic', 'general')
                                 result = get_ecolafaek_info(topic)
@@ -3938,7 +3584,7 @@ User question: {user_message}"""
             logger.error(f"Bedrock Nova error: {bedrock_error}")
 
             # Fallback: Use keyword-based responses
-            reply_text = handle_chat_fallback(user_message)
+            reply_text = await run_read_db(handle_chat_fallback, user_message)
 
             return {
                 "reply": reply_text,
@@ -4010,6 +3656,12 @@ async def custom_404_handler(request: requests, exc: HTTPException):
         }
     )
 
+@app.on_event("shutdown")
+async def close_image_pipeline():
+    """Close the pooled image download connections and the preprocessing workers"""
+    image_downloader.close()
+    image_preprocessor.close()
+
 # Run the app
 if __name__ == "__main__":
     # Always use AgentCore when deployed - it handles both local and cloud environments
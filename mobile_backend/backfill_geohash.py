@@ -0,0 +1,85 @@
+# Geohash backfill for EcoLafaek API
+# Fills reports.geohash and hotspots.geohash for rows written before the columns
+# existed (or by tools that don't set them), walking each table by primary key
+
+import argparse
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import mysql.connector
+
+from db import DB_CONFIG
+from geo import geohash_encode
+
+# table -> (primary key, latitude column, longitude column)
+TABLES = {
+    'reports': ('report_id', 'latitude', 'longitude'),
+    'hotspots': ('hotspot_id', 'center_latitude', 'center_longitude'),
+}
+
+
+def backfill_table(connection, table: str, batch_size: int, recompute: bool, dry_run: bool) -> int:
+    """Set geohash on every row of table that lacks one (or on all rows with recompute), returning the count"""
+    key, lat_column, lon_column = TABLES[table]
+    missing_clause = "" if recompute else "AND geohash IS NULL"
+    cursor = connection.cursor()
+    updated = 0
+    last_id = 0
+    try:
+        while True:
+            cursor.execute(
+                f"""
+                SELECT {key}, {lat_column}, {lon_column}
+                FROM {table}
+                WHERE {key} > %s {missing_clause}
+                ORDER BY {key}
+                LIMIT %s
+                """,
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            last_id = rows[-1][0]
+            updates = [
+                (geohash_encode(float(lat), float(lon)), row_id)
+                for row_id, lat, lon in rows
+                if lat is not None and lon is not None
+            ]
+            if updates and not dry_run:
+                cursor.executemany(f"UPDATE {table} SET geohash = %s WHERE {key} = %s", updates)
+                connection.commit()
+            updated += len(updates)
+            print(f"  {table}: {updated:,} rows (up to {key} {last_id})")
+    finally:
+        cursor.close()
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill geohash cells on reports and hotspots")
+    parser.add_argument('--table', choices=sorted(TABLES), action='append',
+                        help='Table to backfill (repeatable, default both)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows per UPDATE batch')
+    parser.add_argument('--recompute', action='store_true', help='Recompute rows that already have a geohash')
+    parser.add_argument('--dry-run', action='store_true', help='Count the rows without writing')
+    args = parser.parse_args()
+
+    print(f"Target: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}")
+    connection = mysql.connector.connect(**DB_CONFIG)
+    try:
+        for table in args.table or list(TABLES):
+            started = time.perf_counter()
+            count = backfill_table(connection, table, args.batch_size, args.recompute, args.dry_run)
+            action = "would update" if args.dry_run else "updated"
+            print(f"{table}: {action} {count:,} rows in {time.perf_counter() - started:.1f}s")
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# DB executor load check for EcoLafaek API
+# Starts a small query (checkout + SELECT 1 + return, the shape of a simple
+# route) at a steady rate through run_db() and reports its latency, alone,
+# while a slow query runs on the DB executor, and while the same slow query
+# runs inline on the event loop the way routes used to call the database.
+# Latency counts from when a request was due, so event loop stalls show up.
+# With the executor p99 should stay close to the baseline.
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from db import DB_CONFIG, DB_EXECUTOR_WORKERS, db_session, run_db
+
+
+def fast_query():
+    with db_session(label='benchmark fast query') as (connection, cursor):
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+
+
+def slow_query(seconds: float):
+    with db_session(label='benchmark slow query') as (connection, cursor):
+        cursor.execute("SELECT SLEEP(%s)", (seconds,))
+        cursor.fetchall()
+
+
+async def fire(requests_count: int, interval: float) -> list:
+    """Start a fast query through run_db every interval; milliseconds from due to done"""
+    timings = []
+
+    async def request(due: float):
+        await run_db(fast_query)
+        timings.append((time.perf_counter() - due) * 1000)
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(requests_count):
+        due = start + i * interval
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(request(due)))
+    await asyncio.gather(*tasks)
+    return timings
+
+
+async def slow_on_executor(seconds: float, stop: asyncio.Event):
+    while not stop.is_set():
+        await run_db(slow_query, seconds)
+
+
+async def slow_inline(seconds: float, stop: asyncio.Event):
+    while not stop.is_set():
+        # Blocks the event loop, as the routes did before run_db()
+        slow_query(seconds)
+        await asyncio.sleep(0)
+
+
+def summarize(label: str, timings: list) -> float:
+    """Print latency percentiles in milliseconds and return p99"""
+    ordered = sorted(timings)
+    p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+    p99 = ordered[max(int(len(ordered) * 0.99) - 1, 0)]
+    print(f"{label:<20} mean {statistics.mean(ordered):8.2f} ms   p50 {statistics.median(ordered):8.2f} ms   "
+          f"p95 {p95:8.2f} ms   p99 {p99:8.2f} ms   max {ordered[-1]:8.2f} ms")
+    return p99
+
+
+async def scenario(label: str, requests_count: int, interval: float, slow=None) -> float:
+    stop = asyncio.Event()
+    background = asyncio.create_task(slow(stop)) if slow else None
+    await asyncio.sleep(0)  # let the slow query start
+    timings = await fire(requests_count, interval)
+    stop.set()
+    if background:
+        await background
+    return summarize(label, timings)
+
+
+async def run(args):
+    interval = args.interval_ms / 1000
+    await fire(20, interval)  # warm up the pool and the executor threads
+
+    baseline = await scenario('no slow query', args.requests, interval)
+    executor = await scenario('slow on executor', args.requests, interval,
+                              lambda stop: slow_on_executor(args.slow_seconds, stop))
+    inline = await scenario('slow inline', args.requests, interval,
+                            lambda stop: slow_inline(args.slow_seconds, stop))
+
+    print(f"\np99 change with a slow query: {executor - baseline:+.2f} ms on the executor, "
+          f"{inline - baseline:+.2f} ms inline")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check request latency while a slow query runs")
+    parser.add_argument('--requests', type=int, default=500, help='Fast requests per scenario')
+    parser.add_argument('--interval-ms', type=float, default=10.0, help='Milliseconds between fast requests')
+    parser.add_argument('--slow-seconds', type=float, default=2.0, help='Duration of each slow query')
+    args = parser.parse_args()
+
+    print(f"Target: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}")
+    print(f"{args.requests} requests per scenario every {args.interval_ms:g} ms, "
+          f"slow query SLEEP({args.slow_seconds:g}) back to back, {DB_EXECUTOR_WORKERS} executor workers\n")
+    if DB_EXECUTOR_WORKERS < 2:
+        print("The slow query takes the only executor worker; set DB_EXECUTOR_WORKERS to 2 or more\n")
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Connection liveness benchmark for EcoLafaek API
+# Compares ping-on-every-checkout with the idle-window check used by db.py
+
+import argparse
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import mysql.connector
+from dbutils.pooled_db import PooledDB
+
+from db import DB_CONFIG, DB_PING_IDLE_SECONDS, CONNECTION_FAILURES, IdlePinger
+
+
+def run_requests(pool: PooledDB, requests_count: int, pause: float) -> list:
+    """Time checkout + SELECT 1 + return, the shape of a simple API request"""
+    timings = []
+    for _ in range(requests_count):
+        start = time.perf_counter()
+        connection = pool.connection()
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        cursor.close()
+        connection.close()
+        timings.append((time.perf_counter() - start) * 1000)
+        if pause:
+            time.sleep(pause)
+    return timings
+
+
+def summarize(label: str, timings: list) -> float:
+    """Print latency percentiles in milliseconds and return the mean"""
+    ordered = sorted(timings)
+    p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+    mean = statistics.mean(ordered)
+    print(f"{label:<22} mean {mean:8.2f} ms   p50 {statistics.median(ordered):8.2f} ms   p95 {p95:8.2f} ms")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DB connection liveness strategies")
+    parser.add_argument('--requests', type=int, default=200, help='Requests per strategy')
+    parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between requests')
+    parser.add_argument('--idle-seconds', type=float, default=DB_PING_IDLE_SECONDS,
+                        help='Idle window before a connection is pinged')
+    args = parser.parse_args()
+
+    print(f"Target: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}")
+    print(f"{args.requests} requests per strategy, idle window {args.idle_seconds:g}s\n")
+
+    strategies = [
+        ('ping every checkout', 1),
+        ('idle-window ping', IdlePinger(args.idle_seconds)),
+    ]
+    means = []
+    for label, ping in strategies:
+        pool = PooledDB(
+            creator=mysql.connector,
+            maxconnections=1,
+            mincached=1,
+            maxcached=1,
+            blocking=True,
+            ping=ping,
+            failures=CONNECTION_FAILURES,
+            **DB_CONFIG
+        )
+        try:
+            run_requests(pool, 5, 0)  # warm up
+            means.append(summarize(label, run_requests(pool, args.requests, args.pause)))
+        finally:
+            pool.close()
+
+    saved = means[0] - means[1]
+    print(f"\nSaved per request: {saved:.2f} ms ({saved / means[0] * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
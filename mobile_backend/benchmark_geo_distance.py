@@ -0,0 +1,149 @@
+# Distance computation benchmark for EcoLafaek API
+# Checks geo.py against reference distances, then times the scalar, vectorised
+# NumPy and (with --sql) database Haversine paths on the same points
+
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from geo import (
+    EARTH_RADIUS_KM, haversine_km, haversine_km_array, pairwise_distances_km,
+    within_radius, distance_sql
+)
+
+# Timor-Leste, where real reports are clustered
+LAT_RANGE = (-9.50, -8.10)
+LON_RANGE = (124.00, 127.35)
+
+# (lat1, lon1, lat2, lon2, expected km) on a sphere of radius 6371 km
+REFERENCE_DISTANCES = [
+    (0.0, 0.0, 0.0, 1.0, math.pi * EARTH_RADIUS_KM / 180),           # 1 degree of the equator
+    (0.0, 0.0, 90.0, 0.0, math.pi * EARTH_RADIUS_KM / 2),            # equator to pole
+    (-8.55, 125.57, 8.55, -54.43, math.pi * EARTH_RADIUS_KM),        # Dili to its antipode
+    (-8.55, 125.57, -8.55, 125.57, 0.0),                             # same point
+    (0.0, 179.5, 0.0, -179.5, math.pi * EARTH_RADIUS_KM / 180),      # across the antimeridian
+    (51.5074, -0.1278, 48.8566, 2.3522, 343.556),                    # London to Paris
+    (-8.5569, 125.5603, -8.4667, 126.4583, 99.261),                  # Dili to Baucau
+]
+
+
+def check_references() -> bool:
+    """Compare the scalar and vectorised distances with the reference table"""
+    ok = True
+    lat1, lon1, lat2, lon2, expected = (np.array(column) for column in zip(*REFERENCE_DISTANCES))
+    vectorised = haversine_km_array(lat1, lon1, lat2, lon2)
+    for i, (a_lat, a_lon, b_lat, b_lon, km) in enumerate(REFERENCE_DISTANCES):
+        scalar = haversine_km(a_lat, a_lon, b_lat, b_lon)
+        tolerance = max(1e-6, km * 1e-5)
+        if abs(scalar - km) > tolerance or abs(vectorised[i] - km) > tolerance:
+            print(f"  FAIL ({a_lat}, {a_lon}) -> ({b_lat}, {b_lon}): expected {km:.3f} km, "
+                  f"scalar {scalar:.3f}, vectorised {vectorised[i]:.3f}")
+            ok = False
+
+    matrix = pairwise_distances_km(lat1, lon1)
+    if not (np.allclose(matrix, matrix.T) and np.allclose(np.diag(matrix), 0)):
+        print("  FAIL pairwise matrix is not symmetric with a zero diagonal")
+        ok = False
+
+    mask = within_radius(lat2, lon2, 0.0, 0.0, 10008.0)
+    expected_mask = haversine_km_array(0.0, 0.0, lat2, lon2) < 10008.0
+    if not np.array_equal(mask, expected_mask):
+        print(f"  FAIL within_radius mask {mask.tolist()} != {expected_mask.tolist()}")
+        ok = False
+
+    print(f"Reference distances: {'ok' if ok else 'FAILED'} ({len(REFERENCE_DISTANCES)} pairs)")
+    return ok
+
+
+def best_of(func, repeat: int) -> float:
+    """Fastest of repeat runs in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def sql_distances(lats: np.ndarray, lons: np.ndarray, origin: tuple) -> tuple:
+    """Distances from origin computed by the database over a temporary table, with the query time"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    import mysql.connector
+    from db import DB_CONFIG
+
+    connection = mysql.connector.connect(**DB_CONFIG)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            CREATE TEMPORARY TABLE bench_geo_points (
+                point_id INT PRIMARY KEY,
+                latitude DECIMAL(10, 8) NOT NULL,
+                longitude DECIMAL(11, 8) NOT NULL
+            )
+        """)
+        rows = [(i, round(float(lat), 8), round(float(lon), 8)) for i, (lat, lon) in enumerate(zip(lats, lons))]
+        for offset in range(0, len(rows), 5000):
+            cursor.executemany(
+                "INSERT INTO bench_geo_points (point_id, latitude, longitude) VALUES (%s, %s, %s)",
+                rows[offset:offset + 5000]
+            )
+        connection.commit()
+
+        query = f"SELECT {distance_sql()} FROM bench_geo_points ORDER BY point_id"
+        params = (origin[0], origin[1], origin[0])
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        distances = np.array([row[0] for row in cursor.fetchall()], dtype=np.float64)
+        return distances, (time.perf_counter() - start) * 1000
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Haversine distance paths")
+    parser.add_argument('--points', type=int, default=100000, help='Points to compute distances for')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per path (best is reported)')
+    parser.add_argument('--sql', action='store_true', help='Also time the database distance expression')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the points')
+    args = parser.parse_args()
+
+    if not check_references():
+        sys.exit(1)
+
+    rng = np.random.default_rng(args.seed)
+    lats = rng.uniform(*LAT_RANGE, args.points)
+    lons = rng.uniform(*LON_RANGE, args.points)
+    origin = (-8.5569, 125.5603)
+    lat_list, lon_list = lats.tolist(), lons.tolist()
+
+    print(f"\n{args.points:,} points, best of {args.repeat}")
+    results = {
+        'python loop': best_of(lambda: [haversine_km(origin[0], origin[1], a, b) for a, b in zip(lat_list, lon_list)],
+                               args.repeat),
+        'numpy vectorised': best_of(lambda: haversine_km_array(origin[0], origin[1], lats, lons), args.repeat),
+        'numpy radius mask': best_of(lambda: within_radius(lats, lons, origin[0], origin[1], 5.0), args.repeat),
+    }
+
+    if args.sql:
+        db_distances, db_ms = sql_distances(lats, lons, origin)
+        # The database works on coordinates rounded to the DECIMAL(10,8) columns
+        expected = haversine_km_array(origin[0], origin[1], np.round(lats, 8), np.round(lons, 8))
+        max_error = float(np.max(np.abs(db_distances - expected)))
+        print(f"SQL vs NumPy max difference: {max_error * 1000:.6f} m")
+        results['sql expression'] = db_ms
+
+    baseline = results['python loop']
+    for label, ms in results.items():
+        print(f"  {label:<18} {ms:10.2f} ms   {baseline / ms:8.1f}x")
+    print(f"  per point (numpy)  {results['numpy vectorised'] / args.points * 1e6:10.1f} ns")
+
+
+if __name__ == '__main__':
+    main()
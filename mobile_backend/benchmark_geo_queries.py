@@ -0,0 +1,149 @@
+# Radius query benchmark for EcoLafaek API
+# Compares the full-scan Haversine predicate with the bounding-box prefilter from
+# geo.py on a scratch table seeded with synthetic reports across Timor-Leste
+
+import argparse
+import random
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import mysql.connector
+
+from db import DB_CONFIG
+from geo import RadiusFilter
+
+BENCH_TABLE = 'bench_geo_reports'
+
+# Rough extent of Timor-Leste, where real reports are clustered
+LAT_RANGE = (-9.50, -8.10)
+LON_RANGE = (124.00, 127.35)
+
+FULL_SCAN_QUERY = f"""
+    SELECT COUNT(*)
+    FROM {BENCH_TABLE}
+    WHERE (
+        6371 * acos(
+            cos(radians(%s)) * cos(radians(latitude)) *
+            cos(radians(longitude) - radians(%s)) +
+            sin(radians(%s)) * sin(radians(latitude))
+        )
+    ) < %s
+    AND status = 'analyzed'
+"""
+
+
+def create_table(cursor):
+    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    cursor.execute(f"""
+        CREATE TABLE {BENCH_TABLE} (
+            report_id INT AUTO_INCREMENT PRIMARY KEY,
+            latitude DECIMAL(10, 8) NOT NULL,
+            longitude DECIMAL(11, 8) NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            KEY idx_bench_location (latitude, longitude)
+        )
+    """)
+
+
+def seed(connection, cursor, current: int, target: int, rng: random.Random, batch_size: int = 5000):
+    """Grow the scratch table to target rows"""
+    while current < target:
+        count = min(batch_size, target - current)
+        rows = [
+            (
+                round(rng.uniform(*LAT_RANGE), 8),
+                round(rng.uniform(*LON_RANGE), 8),
+                'analyzed' if rng.random() < 0.8 else 'submitted'
+            )
+            for _ in range(count)
+        ]
+        cursor.executemany(
+            f"INSERT INTO {BENCH_TABLE} (latitude, longitude, status) VALUES (%s, %s, %s)",
+            rows
+        )
+        connection.commit()
+        current += count
+    cursor.execute(f"ANALYZE TABLE {BENCH_TABLE}")
+    cursor.fetchall()
+    return current
+
+
+def time_query(cursor, query: str, params_for, points: list) -> tuple:
+    """Run query once per point, returning (timings in ms, total rows matched)"""
+    timings = []
+    matched = 0
+    for lat, lon in points:
+        start = time.perf_counter()
+        cursor.execute(query, params_for(lat, lon))
+        matched += cursor.fetchone()[0]
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, matched
+
+
+def summarize(label: str, timings: list, matched: int) -> float:
+    """Print latency percentiles in milliseconds and return the mean"""
+    ordered = sorted(timings)
+    p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+    mean = statistics.mean(ordered)
+    print(f"  {label:<18} mean {mean:9.2f} ms   p50 {statistics.median(ordered):9.2f} ms   "
+          f"p95 {p95:9.2f} ms   rows {matched}")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark radius queries with and without the bounding-box prefilter")
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma-separated table sizes to test')
+    parser.add_argument('--radius', type=float, action='append',
+                        help='Radius in km (repeatable, default 0.5 and 5)')
+    parser.add_argument('--queries', type=int, default=50, help='Queries per strategy and radius')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for data and query points')
+    parser.add_argument('--keep', action='store_true', help=f'Keep the {BENCH_TABLE} table afterwards')
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+    radii = args.radius or [0.5, 5.0]
+    rng = random.Random(args.seed)
+
+    print(f"Target: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']} (table {BENCH_TABLE})")
+    print(f"{args.queries} queries per strategy, radii {', '.join(f'{r:g} km' for r in radii)}\n")
+
+    connection = mysql.connector.connect(**DB_CONFIG)
+    cursor = connection.cursor()
+    try:
+        create_table(cursor)
+        rows = 0
+        for size in sizes:
+            started = time.perf_counter()
+            rows = seed(connection, cursor, rows, size, rng)
+            print(f"{rows:,} reports (seeded in {time.perf_counter() - started:.1f}s)")
+
+            points = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(args.queries)]
+            for radius in radii:
+                print(f" radius {radius:g} km")
+                full_scan, full_rows = time_query(
+                    cursor, FULL_SCAN_QUERY, lambda lat, lon: (lat, lon, lat, radius), points
+                )
+                sample = RadiusFilter(0, 0, radius)
+                prefilter_query = f"SELECT COUNT(*) FROM {BENCH_TABLE} WHERE {sample.where_sql} AND status = 'analyzed'"
+                prefiltered, box_rows = time_query(
+                    cursor, prefilter_query, lambda lat, lon: RadiusFilter(lat, lon, radius).where_params, points
+                )
+                before = summarize('full scan', full_scan, full_rows)
+                after = summarize('bounding box', prefiltered, box_rows)
+                if full_rows != box_rows:
+                    print(f"  WARNING: result mismatch ({full_rows} vs {box_rows} rows)")
+                print(f"  speedup {before / after:.1f}x")
+            print()
+    finally:
+        if not args.keep:
+            cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        cursor.close()
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,474 @@
+# Hotspot engine concurrency check for EcoLafaek API
+# Fires many simultaneous reports at a few areas, each stored the way
+# _store_waste_analysis() does it: mark the report analyzed, update_hotspots(),
+# a few more statements, commit. Some commits fail, some stored reports are
+# deleted again the way _delete_report() does it, and the engine rebuilds its
+# clusters in the background every few hundred milliseconds meanwhile. The
+# tables are an in-memory stand-in that keeps the commit boundary: a
+# transaction's writes are only seen by others once it commits, hotspot rows
+# stay locked until then, foreign keys are enforced, and every statement adds
+# a fixed latency, which widens the race windows the way database round trips
+# do. Afterwards the committed hotspots must match a from-scratch clustering of
+# the remaining reports. The same load is run with the cell stripes held until
+# the commit, with stripes held only during the hotspot update, with one global
+# lock, and with no locking at all.
+
+import argparse
+import itertools
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+import hotspot_engine
+from hotspot_engine import (
+    HOTSPOT_LOCK_STRIPES, HotspotEngine, StripedLock, cluster_points, unlink_report, update_hotspots
+)
+
+# Area centres across Timor-Leste, well over a lock cell apart
+AREAS = [
+    (-8.5569, 125.5603),  # Dili
+    (-8.4667, 126.4583),  # Baucau
+    (-8.9500, 125.2167),  # Ainaro
+    (-8.7333, 126.5667),  # Viqueque
+    (-8.9667, 125.4000),  # Same
+    (-8.6333, 125.7833),  # Manatuto
+    (-9.0333, 124.8833),  # Suai
+    (-8.5333, 124.9667),  # Maliana
+]
+
+LOCK_WAIT_TIMEOUT_SECONDS = 5.0
+
+
+class DatabaseError(Exception):
+    pass
+
+
+class MemoryDatabase:
+    """Committed reports, hotspots and hotspot_reports, with hotspot row locks held until commit"""
+
+    def __init__(self, reports, latency_seconds: float, failure_rate: float, seed: int):
+        self.reports = reports  # report_id -> (lat, lon), as submitted
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.analyzed = set()
+        self.deleted = set()
+        self.hotspots = {}  # hotspot_id -> {'total_reports': n}
+        self.links = set()  # (hotspot_id, report_id)
+        self._ids = itertools.count(1)
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Condition()
+        self._owners = {}  # hotspot_id -> connection holding its row lock
+
+    def connect(self):
+        return MemoryConnection(self)
+
+    @contextmanager
+    def read_session(self):
+        connection = self.connect()
+        try:
+            yield connection, connection.cursor()
+        finally:
+            connection.rollback()
+
+
+class MemoryConnection:
+    """One transaction at a time; its writes are kept aside until commit"""
+
+    def __init__(self, database: MemoryDatabase):
+        self.database = database
+        self._begin()
+
+    def _begin(self):
+        self.hotspots = {}  # hotspot_id -> row, or None once deleted
+        self.links_added = set()
+        self.links_removed = set()
+        self.analyzed = set()
+        self.deleted = set()
+        self.locks = set()
+        self._savepoints = {}
+
+    def cursor(self):
+        return MemoryCursor(self)
+
+    # Reads: the committed state with this transaction's writes on top
+
+    def hotspot(self, hotspot_id):
+        if hotspot_id in self.hotspots:
+            return self.hotspots[hotspot_id]
+        return self.database.hotspots.get(hotspot_id)
+
+    def links(self):
+        return (self.database.links - self.links_removed) | self.links_added
+
+    def report_exists(self, report_id):
+        return (report_id in self.database.reports and report_id not in self.database.deleted
+                and report_id not in self.deleted)
+
+    def lock(self, hotspot_id):
+        database = self.database
+        with database._lock:
+            deadline = time.monotonic() + LOCK_WAIT_TIMEOUT_SECONDS
+            while database._owners.get(hotspot_id, self) is not self:
+                if not database._lock.wait(deadline - time.monotonic()):
+                    raise DatabaseError(f"Lock wait timeout on hotspot {hotspot_id}")
+            database._owners[hotspot_id] = self
+        self.locks.add(hotspot_id)
+
+    def _release(self):
+        database = self.database
+        with database._lock:
+            for hotspot_id in self.locks:
+                database._owners.pop(hotspot_id, None)
+            database._lock.notify_all()
+        self._begin()
+
+    def savepoint(self, name):
+        self._savepoints[name] = (dict(self.hotspots), set(self.links_added),
+                                  set(self.links_removed), set(self.analyzed), set(self.deleted))
+
+    def rollback_to(self, name):
+        # Row locks taken since the savepoint are kept, as in MySQL
+        hotspots, added, removed, analyzed, deleted = self._savepoints[name]
+        self.hotspots, self.links_added = dict(hotspots), set(added)
+        self.links_removed, self.analyzed, self.deleted = set(removed), set(analyzed), set(deleted)
+
+    def commit(self):
+        database = self.database
+        time.sleep(database.latency_seconds)
+        with database._lock:
+            failed = database._rng.random() < database.failure_rate
+            if not failed:
+                for hotspot_id, row in self.hotspots.items():
+                    if row is None:
+                        database.hotspots.pop(hotspot_id, None)
+                    else:
+                        database.hotspots[hotspot_id] = row
+                database.links = self.links()
+                database.analyzed = (database.analyzed | self.analyzed) - self.deleted
+                database.deleted |= self.deleted
+        self._release()
+        if failed:
+            raise DatabaseError("Commit failed")
+
+    def rollback(self):
+        self._release()
+
+
+class MemoryCursor:
+    """Understands exactly the statements HotspotEngine and this check send"""
+
+    def __init__(self, connection: MemoryConnection):
+        self.connection = connection
+        self.lastrowid = None
+        self.rowcount = 0
+        self._rows = []
+
+    def execute(self, query, params=()):
+        connection = self.connection
+        database = connection.database
+        time.sleep(database.latency_seconds)
+        statement = ' '.join(query.split())
+        self._rows = []
+        self.rowcount = 0
+
+        if statement.startswith('UPDATE reports SET status'):
+            connection.analyzed.add(params[-1])
+        elif statement.startswith('DELETE FROM reports'):
+            connection.deleted.add(params[0])
+        elif statement.startswith('SAVEPOINT'):
+            connection.savepoint(statement.split()[1])
+        elif statement.startswith('ROLLBACK TO SAVEPOINT'):
+            connection.rollback_to(statement.split()[3])
+        elif statement.startswith('RELEASE SAVEPOINT'):
+            pass
+        elif statement.startswith('SELECT r.report_id'):
+            with database._lock:
+                analyzed = (database.analyzed | connection.analyzed) - connection.deleted
+            self._rows = [
+                {'report_id': report_id, 'latitude': database.reports[report_id][0],
+                 'longitude': database.reports[report_id][1], 'severity_score': 5, 'waste_type': 'Plastic'}
+                for report_id in sorted(analyzed) if not params or report_id != params[0]
+            ]
+        elif statement.startswith('SELECT report_id, hotspot_id FROM hotspot_reports'):
+            with database._lock:
+                links = connection.links()
+            self._rows = [{'report_id': report_id, 'hotspot_id': hotspot_id} for hotspot_id, report_id in links]
+        elif statement.startswith('SELECT a.severity_score'):
+            self._rows = [{'severity_score': 5, 'waste_type': 'Plastic'}]
+        elif statement.startswith('SELECT h.hotspot_id, h.total_reports'):
+            with database._lock:
+                hotspot_ids = sorted(hotspot_id for hotspot_id, report_id in connection.links() if report_id == params[0])
+            for hotspot_id in hotspot_ids:
+                connection.lock(hotspot_id)
+            with database._lock:
+                self._rows = [{'hotspot_id': hotspot_id, 'total_reports': connection.hotspot(hotspot_id)['total_reports']}
+                              for hotspot_id in hotspot_ids if connection.hotspot(hotspot_id) is not None]
+        elif statement.startswith('SELECT hotspot_id FROM hotspots'):
+            connection.lock(params[0])
+            with database._lock:
+                if connection.hotspot(params[0]) is not None:
+                    self._rows = [{'hotspot_id': params[0]}]
+        elif statement.startswith('INSERT INTO hotspots'):
+            with database._lock:
+                self.lastrowid = next(database._ids)
+            connection.lock(self.lastrowid)
+            connection.hotspots[self.lastrowid] = {'total_reports': params[8]}
+            self.rowcount = 1
+        elif statement.startswith('UPDATE hotspots SET total_reports'):
+            # unlink_report(); only the count is tracked
+            connection.lock(params[-1])
+            with database._lock:
+                if connection.hotspot(params[-1]) is not None:
+                    connection.hotspots[params[-1]] = {'total_reports': params[0]}
+                    self.rowcount = 1
+        elif statement.startswith('UPDATE hotspots'):
+            connection.lock(params[-1])
+            with database._lock:
+                if connection.hotspot(params[-1]) is not None:
+                    connection.hotspots[params[-1]] = {'total_reports': params[4]}
+                    self.rowcount = 1
+        elif statement.startswith('DELETE FROM hotspots'):
+            connection.lock(params[0])
+            with database._lock:
+                if any(hotspot_id == params[0] for hotspot_id, _ in connection.links()):
+                    raise DatabaseError(f"Hotspot {params[0]} still has reports linked")
+                if connection.hotspot(params[0]) is not None:
+                    connection.hotspots[params[0]] = None
+                    self.rowcount = 1
+        elif statement.startswith('INSERT INTO hotspot_reports'):
+            pairs = list(zip(params[::2], params[1::2]))
+            for hotspot_id in {hotspot_id for hotspot_id, _ in pairs}:
+                connection.lock(hotspot_id)
+            with database._lock:
+                links = connection.links()
+                for hotspot_id, report_id in pairs:
+                    if connection.hotspot(hotspot_id) is None or not connection.report_exists(report_id):
+                        raise DatabaseError(f"Foreign key violation linking report {report_id} to {hotspot_id}")
+                    if (hotspot_id, report_id) not in links:
+                        self._add_link((hotspot_id, report_id))
+                        links.add((hotspot_id, report_id))
+                        self.rowcount += 1
+        elif statement.startswith('DELETE absorbed FROM hotspot_reports'):
+            kept_id, absorbed_id = params
+            with database._lock:
+                links = connection.links()
+                kept = {report_id for hotspot_id, report_id in links if hotspot_id == kept_id}
+                for link in [link for link in links if link[0] == absorbed_id and link[1] in kept]:
+                    self._remove_link(link)
+        elif statement.startswith('UPDATE hotspot_reports SET hotspot_id'):
+            kept_id, absorbed_id = params
+            with database._lock:
+                if connection.hotspot(kept_id) is None:
+                    raise DatabaseError(f"Foreign key violation moving links to {kept_id}")
+                for link in [link for link in connection.links() if link[0] == absorbed_id]:
+                    self._remove_link(link)
+                    self._add_link((kept_id, link[1]))
+        elif statement.startswith('DELETE FROM hotspot_reports WHERE hotspot_id'):
+            with database._lock:
+                for link in [link for link in connection.links() if link[0] == params[0]]:
+                    self._remove_link(link)
+        elif statement.startswith('DELETE FROM hotspot_reports WHERE report_id'):
+            with database._lock:
+                for link in [link for link in connection.links() if link[1] == params[0]]:
+                    self._remove_link(link)
+        else:
+            raise DatabaseError(f"Statement not understood by the check: {statement[:60]}")
+
+    def _add_link(self, link):
+        self.connection.links_removed.discard(link)
+        self.connection.links_added.add(link)
+
+    def _remove_link(self, link):
+        self.connection.links_added.discard(link)
+        self.connection.links_removed.add(link)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+
+class NoLock:
+    """Stands in for StripedLock to show what happens without cell locking"""
+    waits = 0
+
+    @contextmanager
+    def hold(self, keys):
+        yield
+
+
+def store_analysis(engine: HotspotEngine, database: MemoryDatabase, report, report_id, hold_until_commit: bool):
+    """The shape of _store_waste_analysis(): one transaction, hotspots updated before the last statements"""
+    with engine.transaction(report) if hold_until_commit else nullcontext():
+        connection = database.connect()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("UPDATE reports SET status = %s WHERE report_id = %s", ('analyzed', report_id))
+            result = update_hotspots(cursor, connection, report, report_id,
+                                     {'severity_score': 5, 'waste_type': 'Plastic'})
+            # system_logs and the fingerprint
+            time.sleep(2 * database.latency_seconds)
+            connection.commit()
+            return result
+        except Exception:
+            connection.rollback()
+            if not hold_until_commit:
+                # What transaction() does, so the modes only differ in how long the stripes are held
+                engine.invalidate()
+            raise
+
+
+def delete_report(engine: HotspotEngine, database: MemoryDatabase, report, report_id):
+    """The shape of _delete_report()"""
+    with engine.transaction(report):
+        connection = database.connect()
+        cursor = connection.cursor()
+        try:
+            unlink_report(cursor, report_id)
+            cursor.execute("DELETE FROM hotspot_reports WHERE report_id = %s", (report_id,))
+            cursor.execute("DELETE FROM reports WHERE report_id = %s", (report_id,))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        engine.remove_report(report_id)
+
+
+def check(database: MemoryDatabase, radius_km: float, min_reports: int) -> list:
+    """Differences between the committed hotspots and a fresh clustering of the committed reports"""
+    problems = []
+    analyzed = sorted(database.analyzed)
+    lats = [database.reports[report_id][0] for report_id in analyzed]
+    lons = [database.reports[report_id][1] for report_id in analyzed]
+    labels, _ = cluster_points(lats, lons, radius_km, min_reports)
+    expected = {}
+    for report_id, label in zip(analyzed, labels):
+        if label >= 0:
+            expected.setdefault(int(label), set()).add(report_id)
+
+    linked = {}
+    for hotspot_id, report_id in database.links:
+        linked.setdefault(hotspot_id, set()).add(report_id)
+        if hotspot_id not in database.hotspots:
+            problems.append(f"link to missing hotspot {hotspot_id}")
+        if report_id not in database.analyzed:
+            problems.append(f"report {report_id} linked to hotspot {hotspot_id} but never committed")
+    for members in expected.values():
+        holders = [hotspot_id for hotspot_id, reports in linked.items() if reports & members]
+        if len(holders) != 1:
+            problems.append(f"cluster of {len(members)} reports spread over hotspots {holders}")
+        elif linked[holders[0]] != members:
+            problems.append(f"hotspot {holders[0]} links {len(linked[holders[0]])} reports, cluster has {len(members)}")
+        elif database.hotspots[holders[0]]['total_reports'] != len(members):
+            problems.append(f"hotspot {holders[0]} counts {database.hotspots[holders[0]]['total_reports']} "
+                            f"reports, cluster has {len(members)}")
+    if len(database.hotspots) != len(expected):
+        problems.append(f"{len(database.hotspots)} hotspots for {len(expected)} clusters")
+    return problems
+
+
+def run(mode: str, reports_per_area: int, areas: int, latency_seconds: float, failure_rate: float,
+        delete_rate: float, refresh_seconds: float, seed: int):
+    rng = np.random.default_rng(seed)
+    engine = HotspotEngine(0.5, 3, refresh_seconds)
+    if mode == 'global lock':
+        engine.cell_locks = StripedLock(1)
+    elif mode == 'no locks':
+        engine.cell_locks = NoLock()
+    hold_until_commit = mode != 'update only'
+    # update_hotspots() works on the module's engine
+    hotspot_engine.hotspot_engine = engine
+
+    # Reports scattered within ~100 m of each area centre
+    jobs = []
+    for area, (lat, lon) in enumerate(AREAS[:areas]):
+        for offset in range(reports_per_area):
+            report_id = area * reports_per_area + offset + 1
+            report = {
+                'latitude': lat + rng.normal(0, 0.0005),
+                'longitude': lon + rng.normal(0, 0.0005),
+                'address_text': f"area {area}",
+            }
+            jobs.append((report_id, report))
+    deleting = set(rng.choice([report_id for report_id, _ in jobs], int(len(jobs) * delete_rate), replace=False))
+    database = MemoryDatabase({report_id: (report['latitude'], report['longitude']) for report_id, report in jobs},
+                              latency_seconds, failure_rate, seed)
+    engine.start(database.read_session)
+    engine.wait_until_ready()
+
+    start = threading.Barrier(len(jobs))
+    failures = []
+    deleted = []
+
+    def submit(report_id, report):
+        start.wait()
+        try:
+            store_analysis(engine, database, report, report_id, hold_until_commit)
+        except DatabaseError as e:
+            failures.append((report_id, str(e)))
+            return
+        if report_id in deleting:
+            try:
+                delete_report(engine, database, report, report_id)
+                deleted.append(report_id)
+            except DatabaseError as e:
+                failures.append((report_id, str(e)))
+
+    threads = [threading.Thread(target=submit, args=job) for job in jobs]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    problems = check(database, engine.radius_km, engine.min_reports)
+    print(f"  {mode:<13} {elapsed:7.2f} s   kept {len(database.analyzed):4d}, deleted {len(deleted):3d}, "
+          f"failed {len(failures):3d}, rebuilds {engine.loads:3d}, "
+          f"hotspots {len(database.hotspots):3d}, links {len(database.links):4d}, "
+          f"lock waits {engine.cell_locks.waits:4d}   {'ok' if not problems else 'FAILED'}")
+    for problem in problems[:3]:
+        print(f"      {problem}")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check hotspot updates under concurrent reports")
+    parser.add_argument('--reports', type=int, default=40, help='Simultaneous reports per area')
+    parser.add_argument('--areas', type=int, default=4, choices=range(1, len(AREAS) + 1), help='Areas hit at once')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Delay per SQL statement')
+    parser.add_argument('--failure-rate', type=float, default=0.1, help='Share of commits that fail')
+    parser.add_argument('--delete-rate', type=float, default=0.2, help='Share of reports deleted once stored')
+    parser.add_argument('--refresh-ms', type=float, default=250.0, help='Background rebuild interval')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for report positions and failures')
+    args = parser.parse_args()
+    # Failed commits and the reloads they cause are expected here
+    logging.getLogger('hotspot_engine').setLevel(logging.CRITICAL)
+
+    print(f"{args.reports} simultaneous reports in each of {args.areas} areas, "
+          f"{args.latency_ms:g} ms per statement, {args.failure_rate:.0%} of commits failing, "
+          f"{args.delete_rate:.0%} deleted, rebuilds every {args.refresh_ms:g} ms, {HOTSPOT_LOCK_STRIPES} lock stripes")
+    settings = (args.reports, args.areas, args.latency_ms / 1000, args.failure_rate, args.delete_rate,
+                args.refresh_ms / 1000, args.seed)
+    ok = run('cell locks', *settings)
+    run('global lock', *settings)
+    # Expected to fail: neighbours build on reports whose commit then fails
+    run('update only', *settings)
+    # Expected to fail: without locks reports race each other to create the hotspot
+    run('no locks', *settings)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+# Image download benchmark for EcoLafaek API
+# Downloads the image for N concurrent reports, the way the analysis pipeline
+# does: with the old per-call ThreadPoolExecutor + bare requests.get, with the
+# shared keep-alive session from image_fetch.py, and with an httpx.AsyncClient
+# for comparison (when httpx is installed). By default images come
+# from a local HTTP server that adds a fixed delay to every new connection (the
+# TCP + TLS handshake to S3) and to every response; --url benchmarks a real
+# object instead.
+
+import argparse
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from image_fetch import (
+    IMAGE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS,
+    IMAGE_DOWNLOAD_TIMEOUT_SECONDS,
+    IMAGE_DOWNLOAD_WORKERS,
+    ImageDownloadError,
+    ImageDownloader,
+)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class ImageServer(ThreadingHTTPServer):
+    """Serves a fixed JPEG-sized body with a delay per connection and per response"""
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, image: bytes, connect_seconds: float, latency_seconds: float, connections):
+        super().__init__(('127.0.0.1', 0), ImageHandler)
+        self.image = image
+        self.connect_seconds = connect_seconds
+        self.latency_seconds = latency_seconds
+        self.connections = connections
+
+    def process_request_thread(self, request, client_address):
+        with self.connections.get_lock():
+            self.connections.value += 1
+        time.sleep(self.connect_seconds)
+        super().process_request_thread(request, client_address)
+
+    def handle_error(self, request, client_address):
+        # The size cap check hangs up mid-body on purpose
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def serve(size: int, connect_seconds: float, latency_seconds: float, connections, port):
+    """Server process, so serving doesn't compete with the client for the GIL"""
+    server = ImageServer(os.urandom(size), connect_seconds, latency_seconds, connections)
+    port.value = server.server_address[1]
+    server.serve_forever()
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.latency_seconds)
+        # /large declares a body over any sensible cap; /unsized streams it without a length
+        body = self.server.image * 64 if self.path in ('/large', '/unsized') else self.server.image
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        if self.path == '/unsized':
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(body)
+            self.close_connection = True
+            return
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def legacy_download(url: str) -> int:
+    """The old pipeline: a fresh thread pool and a bare requests.get per report"""
+    loop = asyncio.get_event_loop()
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        response = await loop.run_in_executor(executor, requests.get, url)
+    return len(response.content)
+
+
+def new_downloader(max_bytes: int) -> ImageDownloader:
+    return ImageDownloader(
+        IMAGE_DOWNLOAD_WORKERS,
+        max_bytes,
+        IMAGE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS,
+        IMAGE_DOWNLOAD_TIMEOUT_SECONDS
+    )
+
+
+async def run_round(download, url: str, reports: int) -> list:
+    """Download url for `reports` reports at once; returns per-report latency in ms"""
+
+    async def one():
+        started = time.perf_counter()
+        await download(url)
+        return (time.perf_counter() - started) * 1000
+
+    return await asyncio.gather(*(one() for _ in range(reports)))
+
+
+def summarize(label: str, timings: list, wall_ms: float, connections=None):
+    ordered = sorted(timings)
+    p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+    opened = f"   connections {connections:4d}" if connections is not None else ""
+    print(f"  {label:<24} p50 {statistics.median(ordered):8.1f} ms   p95 {p95:8.1f} ms   "
+          f"max {ordered[-1]:8.1f} ms   wall {wall_ms:8.1f} ms{opened}")
+
+
+async def benchmark(url: str, reports: int, rounds: int, connections, max_bytes: int):
+    downloader = new_downloader(max_bytes)
+    modes = [
+        ('requests + new pool', legacy_download),
+        ('shared session', downloader.fetch),
+    ]
+    client = None
+    if httpx is not None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(IMAGE_DOWNLOAD_TIMEOUT_SECONDS, connect=IMAGE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=reports, max_keepalive_connections=reports)
+        )
+
+        async def httpx_download(target: str) -> int:
+            response = await client.get(target)
+            return len(response.content)
+
+        modes.append(('httpx.AsyncClient', httpx_download))
+
+    for label, download in modes:
+        print(f"{label}:")
+        for round_number in range(1, rounds + 1):
+            before = connections.value if connections else None
+            started = time.perf_counter()
+            timings = await run_round(download, url, reports)
+            wall_ms = (time.perf_counter() - started) * 1000
+            opened = connections.value - before if connections else None
+            summarize(f"round {round_number}", timings, wall_ms, opened)
+    downloader.close()
+    if client is not None:
+        await client.aclose()
+
+
+async def check_size_cap(base_url: str, image_size: int) -> bool:
+    """Bodies over the cap are refused whether or not they declare a Content-Length"""
+    downloader = new_downloader(image_size * 2)
+    ok = True
+    try:
+        image = await downloader.fetch(f"{base_url}/image.jpg")
+        ok &= len(image.content) == image_size and image.content_type == 'image/jpeg'
+        for path in ('/large', '/unsized'):
+            try:
+                await downloader.fetch(f"{base_url}{path}")
+                ok = False
+            except ImageDownloadError:
+                pass
+    finally:
+        downloader.close()
+    print(f"size cap: {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline image downloads under concurrent reports")
+    parser.add_argument('--reports', type=int, default=50, help='Concurrent reports per round')
+    parser.add_argument('--rounds', type=int, default=3, help='Rounds per mode (later rounds reuse connections)')
+    parser.add_argument('--size-kb', type=int, default=2048, help='Image size served by the local server')
+    parser.add_argument('--connect-ms', type=float, default=40.0, help='Local server delay per new connection')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Local server delay per response')
+    parser.add_argument('--url', help='Benchmark this image URL instead of the local server')
+    args = parser.parse_args()
+
+    if args.url:
+        print(f"{args.reports} concurrent downloads of {args.url}, {args.rounds} rounds")
+        asyncio.run(benchmark(args.url, args.reports, args.rounds, None, 64 * 1024 * 1024))
+        return
+
+    size = args.size_kb * 1024
+    connections = multiprocessing.Value('i', 0)
+    port = multiprocessing.Value('i', 0)
+    server = multiprocessing.Process(
+        target=serve, args=(size, args.connect_ms / 1000, args.latency_ms / 1000, connections, port), daemon=True
+    )
+    server.start()
+    while not port.value:
+        time.sleep(0.01)
+    base_url = f"http://127.0.0.1:{port.value}"
+    print(f"{args.reports} concurrent downloads of {args.size_kb} KB, {args.connect_ms:g} ms per connection, "
+          f"{args.latency_ms:g} ms per response, {args.rounds} rounds")
+    try:
+        asyncio.run(benchmark(f"{base_url}/image.jpg", args.reports, args.rounds, connections, size * 2))
+        ok = asyncio.run(check_size_cap(base_url, size))
+    finally:
+        server.terminate()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+# Image preprocessing benchmark for EcoLafaek API
+# Measures what image_prep.py saves per report:
+#   payload     original vs prepared image bytes, and the base64 that goes into
+#               each Nova call and the Titan embedding
+#   cpu         prepare_image() time per image, inline and on the process pool
+#   event loop  the longest event loop stall while a burst of images is
+#               prepared in a thread (holding the GIL) vs on the process pool
+#   fingerprint dHash distances between each image and re-encoded, resized
+#               and cropped copies of it, and between different images, for
+#               choosing IMAGE_DEDUP_MAX_DISTANCE; and the index search time
+#   --bedrock   end-to-end analysis (preprocessing + Nova) with the original
+#               and the prepared image, and how often the results agree
+# Images come from --labels/--images (see benchmark_waste_analysis.py), or
+# --synthetic N generates 12 MP phone-sized JPEGs, some with EXIF rotation.
+
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from image_prep import (
+    IMAGE_MAX_EDGE,
+    IMAGE_OUTPUT_FORMAT,
+    IMAGE_OUTPUT_QUALITY,
+    IMAGE_PREPROCESS_WORKERS,
+    ImagePreprocessor,
+    hamming_distances,
+    prepare_image,
+)
+from benchmark_waste_analysis import load_image_set, same
+
+# Same default as image_dedup.py, which needs a database connection to import
+IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv('IMAGE_DEDUP_MAX_DISTANCE', '6'))
+
+
+def synthetic_images(count: int, seed: int, directory: str):
+    """Phone-sized JPEGs: smooth gradients with texture, every third one rotated by EXIF"""
+    rng = np.random.default_rng(seed)
+    height, width = 3024, 4032
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    images = []
+    for index in range(count):
+        base = rng.uniform(40, 200, 3)
+        pixels = np.stack([
+            base[channel] + 40 * np.sin(x / rng.uniform(150, 600) + channel) * np.cos(y / rng.uniform(150, 600))
+            for channel in range(3)
+        ], axis=-1)
+        pixels += rng.normal(0, 12, pixels.shape)
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+        exif = Image.Exif()
+        if index % 3 == 0:
+            exif[0x0112] = 6  # Rotate 90 degrees clockwise
+        path = os.path.join(directory, f"synthetic_{index:03d}.jpg")
+        image.save(path, 'JPEG', quality=92, exif=exif.tobytes())
+        images.append((path, None))
+    return images
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(int(len(ordered) * fraction) - 1, 0)]
+
+
+def measure_payload(blobs, settings):
+    print("payload:")
+    original = [len(data) for data in blobs]
+    prepared = [prepare_image(data, *settings) for data in blobs]
+    model = [len(image.data) for image in prepared]
+    embed = [len(image.embed_data) for image in prepared]
+    b64 = lambda size: 4 * ((size + 2) // 3)
+    print(f"  original image   mean {statistics.mean(original) / 1024:8.0f} KB   base64 per model call "
+          f"{statistics.mean(b64(size) for size in original) / 1024:8.0f} KB")
+    print(f"  prepared image   mean {statistics.mean(model) / 1024:8.0f} KB   base64 per model call "
+          f"{statistics.mean(b64(size) for size in model) / 1024:8.0f} KB   "
+          f"({statistics.mean(model) / statistics.mean(original):.1%} of original)")
+    if embed != model:
+        print(f"  Titan JPEG       mean {statistics.mean(embed) / 1024:8.0f} KB")
+    sizes = sorted({(image.width, image.height) for image in prepared})
+    print(f"  prepared sizes   {', '.join(f'{w}x{h}' for w, h in sizes[:6])}")
+    # Two-pass analysis of a waste image sends the image twice to Nova and once to Titan
+    per_report_before = 3 * statistics.mean(b64(size) for size in original)
+    per_report_after = 2 * statistics.mean(b64(size) for size in model) + statistics.mean(b64(size) for size in embed)
+    print(f"  per waste report (2 Nova calls + Titan): {per_report_before / 1024:8.0f} KB -> "
+          f"{per_report_after / 1024:8.0f} KB")
+
+
+def measure_fingerprints(blobs, settings, max_distance):
+    print(f"fingerprint (dHash distance, duplicates at <= {max_distance}):")
+    hashes = [prepare_image(data, *settings).dhash for data in blobs]
+
+    def variant(data, transform):
+        with Image.open(BytesIO(data)) as source:
+            image = transform(ImageOps.exif_transpose(source).convert('RGB'))
+        out = BytesIO()
+        image.save(out, 'JPEG', quality=70)
+        return prepare_image(out.getvalue(), *settings).dhash
+
+    variants = {
+        're-encoded': lambda image: image,
+        'half size': lambda image: image.resize((image.width // 2, image.height // 2)),
+        'cropped 3%': lambda image: image.crop((
+            image.width * 3 // 200, image.height * 3 // 200,
+            image.width - image.width * 3 // 200, image.height - image.height * 3 // 200
+        )),
+    }
+    distance = lambda a, b: bin(a ^ b).count('1')
+    for name, transform in variants.items():
+        distances = [distance(dhash, variant(data, transform)) for data, dhash in zip(blobs, hashes)]
+        matched = sum(d <= max_distance for d in distances)
+        print(f"  {name:<16} max {max(distances):3d}   mean {statistics.mean(distances):5.1f}   "
+              f"matched {matched}/{len(distances)}")
+    if len(hashes) > 1:
+        distances = [distance(a, b) for i, a in enumerate(hashes) for b in hashes[i + 1:]]
+        false = sum(d <= max_distance for d in distances)
+        print(f"  different images min {min(distances):3d}   mean {statistics.mean(distances):5.1f}   "
+              f"matched {false}/{len(distances)}")
+
+    index = np.random.default_rng(0).integers(0, 2 ** 63, 1_000_000, dtype=np.uint64)
+    started = time.perf_counter()
+    for dhash in hashes:
+        np.nonzero(hamming_distances(index, dhash) <= max_distance)
+    print(f"  search 1M fingerprints {(time.perf_counter() - started) * 1000 / len(hashes):6.1f} ms per lookup")
+
+
+async def measure_cpu(blobs, settings, workers):
+    print("cpu:")
+    timings = []
+    for data in blobs:
+        started = time.perf_counter()
+        prepare_image(data, *settings)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"  inline           p50 {statistics.median(timings):7.1f} ms   p95 {percentile(timings, 0.95):7.1f} ms   "
+          f"total {sum(timings):8.0f} ms")
+
+    preprocessor = ImagePreprocessor(True, *settings, workers)
+    preprocessor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(preprocessor.prepare(data) for data in blobs))
+    total = (time.perf_counter() - started) * 1000
+    print(f"  process pool     {workers} workers, {len(blobs)} images at once   total {total:8.0f} ms")
+    preprocessor.close()
+
+
+async def loop_stall(prepare, blobs) -> float:
+    """Longest gap between 5 ms ticks of the event loop while all images are prepared"""
+    worst = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal worst
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            worst = max(worst, now - last - 0.005)
+            last = now
+
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.gather(*(prepare(data) for data in blobs))
+    running = False
+    await tick
+    return worst * 1000
+
+
+async def measure_event_loop(blobs, settings, workers):
+    print("event loop (longest stall while preparing all images):")
+    # Forked before the thread pool below exists, as the API does at startup
+    preprocessor = ImagePreprocessor(True, *settings, workers)
+    preprocessor.start()
+    stall = await loop_stall(lambda data: asyncio.to_thread(prepare_image, data, *settings), blobs)
+    print(f"  threads          {stall:8.1f} ms")
+    stall = await loop_stall(preprocessor.prepare, blobs)
+    print(f"  process pool     {stall:8.1f} ms")
+    preprocessor.close()
+
+
+def measure_bedrock(images, blobs, settings, mode):
+    """Analyze each image as uploaded and as prepared; latency includes preprocessing"""
+    import boto3
+    from waste_analysis import analyze_waste
+
+    model_id = os.getenv('BEDROCK_MODEL_ID', 'amazon.nova-pro-v1:0')
+    client = boto3.client(
+        'bedrock-runtime',
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        region_name=os.getenv('AWS_REGION', 'us-east-1')
+    )
+    location = {'lat': -8.5569, 'lng': 125.5603}
+    runs = {'original': [], 'prepared': []}
+    print(f"bedrock ({mode}, {model_id}):")
+    for (path, expected), data in zip(images, blobs):
+        for variant in ('original', 'prepared'):
+            started = time.perf_counter()
+            try:
+                if variant == 'prepared':
+                    prepared = prepare_image(data, *settings)
+                    payload, image_format = prepared.data, prepared.format
+                else:
+                    payload, image_format = data, 'jpeg'
+                analysis, usage = analyze_waste(
+                    client, model_id, base64.b64encode(payload).decode('utf-8'), location, "",
+                    mode=mode, image_format=image_format
+                )
+            except Exception as e:
+                print(f"  {os.path.basename(path):<30} {variant:<9} failed: {e}")
+                analysis, usage = None, None
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            runs[variant].append((expected, analysis, usage, elapsed_ms))
+            if analysis:
+                print(f"  {os.path.basename(path):<30} {variant:<9} {elapsed_ms:8.0f} ms   "
+                      f"{usage.input_tokens:6d} input tokens   {analysis['waste_type']}")
+
+    for variant, results in runs.items():
+        done = [result for result in results if result[1]]
+        if not done:
+            continue
+        latencies = [result[3] for result in done]
+        line = (f"  {variant:<9} p50 {statistics.median(latencies):7.0f} ms   p95 {percentile(latencies, 0.95):7.0f} ms   "
+                f"input tokens {statistics.mean(result[2].input_tokens for result in done):7.0f}")
+        labelled = [result for result in done if result[0]]
+        if labelled:
+            correct = sum(same(result[1]['waste_type'], result[0]) for result in labelled)
+            line += f"   waste type vs labels {correct}/{len(labelled)}"
+        print(line)
+
+    pairs = [(a[1], b[1]) for a, b in zip(runs['original'], runs['prepared']) if a[1] and b[1]]
+    if pairs:
+        detection = sum((a['waste_type'] == 'Not Garbage') == (b['waste_type'] == 'Not Garbage') for a, b in pairs)
+        typed = sum(same(a['waste_type'], b['waste_type']) for a, b in pairs)
+        severity = statistics.mean(abs(float(a['severity_score']) - float(b['severity_score'])) for a, b in pairs)
+        print(f"  agreement: detection {detection}/{len(pairs)}   waste type {typed}/{len(pairs)}   "
+              f"severity mean abs diff {severity:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure image preprocessing before Bedrock calls")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--labels', help='CSV with image and waste_type columns')
+    source.add_argument('--images', help='Directory of .jpg images')
+    source.add_argument('--synthetic', type=int, help='Generate this many 12 MP JPEGs')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for --synthetic')
+    parser.add_argument('--max-edge', type=int, default=IMAGE_MAX_EDGE)
+    parser.add_argument('--format', default=IMAGE_OUTPUT_FORMAT, choices=('jpeg', 'webp'))
+    parser.add_argument('--quality', type=int, default=IMAGE_OUTPUT_QUALITY)
+    parser.add_argument('--workers', type=int, default=IMAGE_PREPROCESS_WORKERS)
+    parser.add_argument('--max-distance', type=int, default=IMAGE_DEDUP_MAX_DISTANCE, help='dHash duplicate threshold')
+    parser.add_argument('--bedrock', action='store_true', help='Also compare analyses with Bedrock (real calls)')
+    parser.add_argument('--mode', default='two_pass', choices=('two_pass', 'single_pass'), help='Analysis mode for --bedrock')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.synthetic:
+            images = synthetic_images(args.synthetic, args.seed, directory)
+        else:
+            images = load_image_set(args.labels, args.images)
+        if not images:
+            sys.exit("No images found")
+        blobs = []
+        for path, _ in images:
+            with open(path, 'rb') as f:
+                blobs.append(f.read())
+
+    settings = (args.max_edge, args.format, args.quality)
+    print(f"{len(blobs)} images, max edge {args.max_edge}, {args.format} quality {args.quality}, "
+          f"{os.cpu_count()} CPUs")
+    measure_payload(blobs, settings)
+    measure_fingerprints(blobs, settings, args.max_distance)
+    asyncio.run(measure_cpu(blobs, settings, args.workers))
+    asyncio.run(measure_event_loop(blobs, settings, args.workers))
+    if args.bedrock:
+        measure_bedrock(images, blobs, settings, args.mode)
+
+
+if __name__ == '__main__':
+    main()
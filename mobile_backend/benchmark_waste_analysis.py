@@ -0,0 +1,168 @@
+# Waste analysis mode benchmark for EcoLafaek API
+# Runs every image of a labelled set through the two-pass (detection prompt +
+# detail prompt) and single-pass (one combined prompt) analysis, and compares
+# latency, Nova calls and token usage, accuracy against the labels and how
+# often the two modes agree with each other. Calls Bedrock for real, so it
+# needs the same AWS credentials as the API.
+#
+# Labels are a CSV with an image column (path relative to the CSV) and a
+# waste_type column ("Not Garbage" for images without waste):
+#
+#   image,waste_type
+#   beach_01.jpg,Plastic
+#   desk_03.jpg,Not Garbage
+#
+# Without --labels every .jpg in --images is analyzed and only the agreement
+# between modes is reported.
+
+import argparse
+import base64
+import csv
+import json
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import boto3
+
+from waste_analysis import WASTE_ANALYSIS_MODES, analyze_waste
+
+
+def load_image_set(labels_path, images_dir):
+    """[(path, expected waste type or None)]"""
+    if labels_path:
+        base = os.path.dirname(os.path.abspath(labels_path))
+        with open(labels_path, newline='') as f:
+            return [(os.path.join(base, row['image']), row['waste_type'].strip() or None) for row in csv.DictReader(f)]
+    names = sorted(name for name in os.listdir(images_dir) if name.lower().endswith(('.jpg', '.jpeg')))
+    return [(os.path.join(images_dir, name), None) for name in names]
+
+
+def run(client, model_id, images, modes, repeat):
+    """Analyze every image in every mode; alternates the mode order so neither always goes first"""
+    results = {mode: [] for mode in modes}
+    location = {'lat': -8.5569, 'lng': 125.5603}
+    for index, (path, expected) in enumerate(images):
+        with open(path, 'rb') as f:
+            image_base64 = base64.b64encode(f.read()).decode('utf-8')
+        order = modes if index % 2 == 0 else list(reversed(modes))
+        for _ in range(repeat):
+            for mode in order:
+                started = time.perf_counter()
+                try:
+                    analysis, usage = analyze_waste(client, model_id, image_base64, location, "", mode=mode)
+                    error = None
+                except Exception as e:
+                    analysis, usage, error = None, None, str(e)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                results[mode].append({
+                    'image': os.path.basename(path),
+                    'expected': expected,
+                    'latency_ms': elapsed_ms,
+                    'usage': usage.to_dict() if usage else None,
+                    'analysis': analysis,
+                    'error': error
+                })
+                status = error or f"{analysis['waste_type']} (severity {analysis['severity_score']})"
+                print(f"  {os.path.basename(path):<30} {mode:<12} {elapsed_ms:8.0f} ms   {status}")
+    return results
+
+
+def same(a, b) -> bool:
+    return str(a).strip().lower() == str(b).strip().lower()
+
+
+def summarize(mode, runs):
+    done = [run for run in runs if run['analysis']]
+    print(f"{mode}:")
+    if not done:
+        print(f"  all {len(runs)} analyses failed")
+        return
+    latencies = sorted(run['latency_ms'] for run in done)
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    print(f"  analyses {len(done)}/{len(runs)}   latency p50 {statistics.median(latencies):7.0f} ms   "
+          f"p95 {p95:7.0f} ms   mean {statistics.mean(latencies):7.0f} ms")
+    print(f"  per image: calls {statistics.mean(run['usage']['calls'] for run in done):4.2f}   "
+          f"input tokens {statistics.mean(run['usage']['input_tokens'] for run in done):7.0f}   "
+          f"output tokens {statistics.mean(run['usage']['output_tokens'] for run in done):6.0f}")
+
+    labelled = [run for run in done if run['expected']]
+    if labelled:
+        detected = sum(
+            (run['analysis']['waste_type'] != 'Not Garbage') == (not same(run['expected'], 'Not Garbage'))
+            for run in labelled
+        )
+        waste = [run for run in labelled if not same(run['expected'], 'Not Garbage')]
+        typed = sum(same(run['analysis']['waste_type'], run['expected']) for run in waste)
+        print(f"  labels: detection {detected}/{len(labelled)} ({detected / len(labelled):.0%})"
+              + (f"   waste type {typed}/{len(waste)} ({typed / len(waste):.0%})" if waste else ""))
+
+
+def compare(modes, results):
+    """Agreement between the first two modes on the images both analyzed"""
+    first, second = modes[:2]
+    pairs = [
+        (a['analysis'], b['analysis'])
+        for a, b in zip(results[first], results[second]) if a['analysis'] and b['analysis']
+    ]
+    if not pairs:
+        return
+    detection = sum((a['waste_type'] == 'Not Garbage') == (b['waste_type'] == 'Not Garbage') for a, b in pairs)
+    both_waste = [(a, b) for a, b in pairs if a['waste_type'] != 'Not Garbage' and b['waste_type'] != 'Not Garbage']
+    print(f"{first} vs {second} ({len(pairs)} images):")
+    print(f"  detection agrees {detection}/{len(pairs)} ({detection / len(pairs):.0%})")
+    if both_waste:
+        typed = sum(same(a['waste_type'], b['waste_type']) for a, b in both_waste)
+        priority = sum(same(a['priority_level'], b['priority_level']) for a, b in both_waste)
+        severity = statistics.mean(
+            abs(float(a['severity_score']) - float(b['severity_score'])) for a, b in both_waste
+        )
+        print(f"  on waste images: waste type agrees {typed}/{len(both_waste)} ({typed / len(both_waste):.0%})   "
+              f"priority agrees {priority}/{len(both_waste)} ({priority / len(both_waste):.0%})   "
+              f"severity mean abs diff {severity:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two-pass and single-pass waste image analysis")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--labels', help='CSV with image and waste_type columns')
+    source.add_argument('--images', help='Directory of .jpg images (no labels)')
+    parser.add_argument('--modes', nargs='+', default=list(WASTE_ANALYSIS_MODES), choices=WASTE_ANALYSIS_MODES)
+    parser.add_argument('--repeat', type=int, default=1, help='Analyses per image and mode')
+    parser.add_argument('--output', help='Write every analysis to this JSON file')
+    args = parser.parse_args()
+
+    images = load_image_set(args.labels, args.images)
+    if not images:
+        sys.exit("No images found")
+
+    model_id = os.getenv('BEDROCK_MODEL_ID', 'amazon.nova-pro-v1:0')
+    client = boto3.client(
+        'bedrock-runtime',
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        region_name=os.getenv('AWS_REGION', 'us-east-1')
+    )
+
+    print(f"{len(images)} images, modes {', '.join(args.modes)}, model {model_id}")
+    results = run(client, model_id, images, args.modes, args.repeat)
+
+    print()
+    for mode in args.modes:
+        summarize(mode, results[mode])
+    if len(args.modes) > 1:
+        compare(args.modes, results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+# Short-lived local cache of uploaded images for EcoLafaek API
+# submit_report uploads the photo to S3 and the background analysis needs the
+# same bytes moments later. The upload path puts them here, keyed by the S3
+# URL, so analysis reads them locally and only downloads from S3 on a miss (an
+# expired or evicted entry, or a restart). Entries live in memory up to a byte
+# budget, then spill to files in a per-process directory under BLOB_CACHE_DIR
+# with their own budget; both tiers evict least recently used entries first and
+# drop anything past the TTL. File IO happens outside the cache lock, and
+# callers on the event loop go through asyncio.to_thread.
+
+import os
+import time
+import atexit
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BLOB_CACHE_MEMORY_BYTES = int(os.getenv('BLOB_CACHE_MEMORY_BYTES', str(64 * 1024 * 1024)))
+BLOB_CACHE_DISK_BYTES = int(os.getenv('BLOB_CACHE_DISK_BYTES', str(512 * 1024 * 1024)))
+BLOB_CACHE_TTL_SECONDS = float(os.getenv('BLOB_CACHE_TTL_SECONDS', '900'))
+BLOB_CACHE_DIR = os.getenv('BLOB_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ecolafaek-blobs'))
+
+SPILL_SUFFIX = '.blob'
+
+
+class BlobCache:
+    """Bytes by key in memory with a disk spill, bounded by size and TTL"""
+
+    def __init__(self, memory_bytes: int, disk_bytes: int, ttl_seconds: float, spill_root: str):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.spill_dir = self._make_spill_dir(spill_root)
+        # The indexes and counters only; files are read, written and removed outside it
+        self._lock = threading.Lock()
+        # key -> (expires_at, data) and key -> (expires_at, path, size), least recently used first
+        self._memory: 'OrderedDict[str, Tuple[float, bytes]]' = OrderedDict()
+        self._disk: 'OrderedDict[str, Tuple[float, str, int]]' = OrderedDict()
+        # Entries evicted from memory whose file is still being written; still served from here
+        self._spilling: Dict[str, Tuple[float, bytes]] = {}
+        self._memory_used = 0
+        self._disk_used = 0
+        self._spill_count = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.spills = 0
+        self.evictions = 0
+
+    def _make_spill_dir(self, spill_root: str) -> Optional[str]:
+        # A directory of this process's own, since spilled files are only
+        # reachable through its in-memory index and other workers may share the root
+        try:
+            os.makedirs(spill_root, exist_ok=True)
+            spill_dir = tempfile.mkdtemp(prefix=f'{os.getpid()}-', dir=spill_root)
+        except OSError as e:
+            logger.warning(f"Could not create a blob spill directory in {spill_root}: {e}")
+            self.disk_bytes = 0
+            return None
+        atexit.register(shutil.rmtree, spill_dir, True)
+        return spill_dir
+
+    def put(self, key: str, data: bytes):
+        """Cache data under key, replacing any previous entry. Writes spill files, so not on the event loop."""
+        if len(data) > max(self.memory_bytes, self.disk_bytes):
+            return
+        with self._lock:
+            stale = self._remove(key)
+            self._memory[key] = (time.monotonic() + self.ttl_seconds, data)
+            self._memory_used += len(data)
+            spill = self._shrink_memory()
+        self._unlink_all(stale)
+        for spill_key, entry in spill:
+            self._spill(spill_key, entry)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Cached bytes for key, or None if missing or expired. Reads spill files, so not on the event loop."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            entry = self._spilling.get(key)
+            if entry is not None and entry[0] > now:
+                self.memory_hits += 1
+                return entry[1]
+            spilled = self._disk.get(key)
+            if spilled is None or spilled[0] <= now:
+                stale = self._remove(key)
+                self.misses += 1
+                spilled = None
+        if spilled is None:
+            self._unlink_all(stale)
+            return None
+
+        try:
+            with open(spilled[1], 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            # Evicted or replaced by another thread since the lookup, or a real error
+            data = None
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Could not read spilled blob {spilled[1]}: {e}")
+        with self._lock:
+            current = self._disk.get(key) is spilled
+            if data is None:
+                stale = self._remove(key) if current else []
+                self.misses += 1
+            else:
+                if current:
+                    self._disk.move_to_end(key)
+                self.disk_hits += 1
+        if data is None:
+            self._unlink_all(stale)
+        return data
+
+    def discard(self, key: str):
+        """Drop the entry for key once it is no longer needed"""
+        with self._lock:
+            stale = self._remove(key)
+        self._unlink_all(stale)
+
+    def _remove(self, key: str) -> List[str]:
+        """Drop key from the indexes; returns the files to remove once the lock is released"""
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_used -= len(entry[1])
+        self._spilling.pop(key, None)
+        spilled = self._disk.pop(key, None)
+        if spilled is not None:
+            self._disk_used -= spilled[2]
+            return [spilled[1]]
+        return []
+
+    def _shrink_memory(self) -> List[Tuple[str, Tuple[float, bytes]]]:
+        """Evict from memory down to budget; returns the live entries to write out"""
+        now = time.monotonic()
+        spill = []
+        while self._memory_used > self.memory_bytes and self._memory:
+            key, entry = self._memory.popitem(last=False)
+            self._memory_used -= len(entry[1])
+            if entry[0] > now and self.spill_dir and len(entry[1]) <= self.disk_bytes:
+                self._spilling[key] = entry
+                spill.append((key, entry))
+            else:
+                self.evictions += 1
+        return spill
+
+    def _spill(self, key: str, entry: Tuple[float, bytes]):
+        expires_at, data = entry
+        with self._lock:
+            self._spill_count += 1
+            # Unique per write, so a key spilled twice never shares a file
+            name = f"{hashlib.sha256(key.encode()).hexdigest()}-{self._spill_count}{SPILL_SUFFIX}"
+        path = os.path.join(self.spill_dir, name)
+        try:
+            with open(path, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            logger.warning(f"Could not spill blob to {path}: {e}")
+            with self._lock:
+                if self._spilling.get(key) is entry:
+                    del self._spilling[key]
+                self.evictions += 1
+            self._unlink(path)
+            return
+
+        stale = []
+        with self._lock:
+            if self._spilling.get(key) is not entry:
+                # Replaced or discarded while the file was written
+                stale.append(path)
+            else:
+                del self._spilling[key]
+                self._disk[key] = (expires_at, path, len(data))
+                self._disk_used += len(data)
+                self.spills += 1
+
+                now = time.monotonic()
+                while self._disk_used > self.disk_bytes and self._disk:
+                    _, (_, spilled_path, size) = self._disk.popitem(last=False)
+                    self._disk_used -= size
+                    stale.append(spilled_path)
+                    self.evictions += 1
+                # Drop expired files from the cold end while we are here
+                while self._disk:
+                    spilled_expires_at, spilled_path, size = next(iter(self._disk.values()))
+                    if spilled_expires_at > now:
+                        break
+                    self._disk.popitem(last=False)
+                    self._disk_used -= size
+                    stale.append(spilled_path)
+                    self.evictions += 1
+        self._unlink_all(stale)
+
+    @classmethod
+    def _unlink_all(cls, paths: List[str]):
+        for path in paths:
+            cls._unlink(path)
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_used,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_used,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+                'spills': self.spills,
+                'evictions': self.evictions,
+                'ttl_seconds': self.ttl_seconds
+            }
+
+
+image_blobs = BlobCache(BLOB_CACHE_MEMORY_BYTES, BLOB_CACHE_DISK_BYTES, BLOB_CACHE_TTL_SECONDS, BLOB_CACHE_DIR)
@@ -0,0 +1,240 @@
+# Bulk data export for EcoLafaek API
+# Streams reports (joined with their analysis and waste type) or hotspots as
+# GeoJSON or NDJSON. Rows are read from an unbuffered cursor with fetchmany() on
+# a DB executor thread and handed to the response through a small bounded queue,
+# so memory stays flat however large the export is.
+
+import os
+import json
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from db import db_session, run_read_db
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '500'))
+EXPORT_QUEUE_CHUNKS = int(os.getenv('EXPORT_QUEUE_CHUNKS', '8'))
+EXPORT_MAX_CONCURRENT = int(os.getenv('EXPORT_MAX_CONCURRENT', '2'))
+# Exports hold one read connection for their whole duration
+EXPORT_HOLD_WARNING_SECONDS = float(os.getenv('EXPORT_HOLD_WARNING_SECONDS', '600'))
+
+EXPORT_FORMATS = {
+    'geojson': 'application/geo+json',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Columns per dataset; user-identifying fields (user_id, device_info, image_url) are never exported
+EXPORT_QUERIES = {
+    'reports': {
+        'select': """
+            SELECT r.report_id, r.latitude, r.longitude, r.report_date, r.status,
+                   r.description, r.address_text, r.geohash,
+                   a.analyzed_date, a.confidence_score, a.estimated_volume,
+                   a.severity_score, a.priority_level, w.name AS waste_type
+            FROM reports r
+            LEFT JOIN analysis_results a ON r.report_id = a.report_id
+            LEFT JOIN waste_types w ON a.waste_type_id = w.waste_type_id
+        """,
+        # Each report once, with its latest analysis (and filtered by that analysis's waste type)
+        'conditions': [
+            "NOT EXISTS (SELECT 1 FROM analysis_results newer "
+            "WHERE newer.report_id = r.report_id AND newer.analysis_id > a.analysis_id)"
+        ],
+        'date_column': 'r.report_date',
+        'status_column': 'r.status',
+        'waste_type_column': 'w.name',
+        'order_by': 'r.report_id',
+        'coordinates': ('latitude', 'longitude'),
+    },
+    'hotspots': {
+        'select': """
+            SELECT h.hotspot_id, h.name, h.center_latitude, h.center_longitude, h.geohash,
+                   h.radius_meters, h.first_reported, h.last_reported, h.total_reports,
+                   h.average_severity, h.status, l.name AS location_name
+            FROM hotspots h
+            LEFT JOIN locations l ON h.location_id = l.location_id
+        """,
+        'conditions': [],
+        'date_column': 'h.last_reported',
+        'status_column': 'h.status',
+        'waste_type_column': None,
+        'order_by': 'h.hotspot_id',
+        'coordinates': ('center_latitude', 'center_longitude'),
+    },
+}
+
+
+# Limits how many read connections long-running exports can hold at once
+export_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+
+
+class ExportCancelled(Exception):
+    """The client went away before the export finished"""
+
+
+def build_export_query(dataset: str, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                       status: Optional[str] = None, waste_type: Optional[str] = None) -> Tuple[str, List[Any]]:
+    """
+    SQL and parameters for an export.
+
+    Args:
+        dataset: 'reports' or 'hotspots'
+        date_from: Earliest report date (hotspots: last reported date), inclusive
+        date_to: Latest report date (hotspots: last reported date), inclusive
+        status: Report or hotspot status
+        waste_type: Waste type name (reports only)
+
+    Raises:
+        ValueError: Unknown dataset or a filter the dataset doesn't support
+    """
+    spec = EXPORT_QUERIES.get(dataset)
+    if spec is None:
+        raise ValueError(f"Unknown dataset '{dataset}', expected one of {', '.join(EXPORT_QUERIES)}")
+
+    conditions = list(spec['conditions'])
+    params: List[Any] = []
+    if date_from:
+        conditions.append(f"{spec['date_column']} >= %s")
+        params.append(date_from)
+    if date_to:
+        # Whole days: everything before the start of the following day
+        conditions.append(f"{spec['date_column']} < DATE_ADD(%s, INTERVAL 1 DAY)")
+        params.append(date_to)
+    if status:
+        conditions.append(f"{spec['status_column']} = %s")
+        params.append(status)
+    if waste_type:
+        if not spec['waste_type_column']:
+            raise ValueError(f"{dataset} cannot be filtered by waste type")
+        conditions.append(f"{spec['waste_type_column']} = %s")
+        params.append(waste_type)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"{spec['select']} {where} ORDER BY {spec['order_by']}", params
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=_json_value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _feature(row: Dict[str, Any], coordinates: Tuple[str, str]) -> Dict[str, Any]:
+    lat_column, lon_column = coordinates
+    properties = {key: value for key, value in row.items() if key not in coordinates}
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [float(row[lon_column]), float(row[lat_column])]},
+        'properties': properties,
+    }
+
+
+def write_export(emit, dataset: str, export_format: str, query: str, params: List[Any]) -> int:
+    """
+    Run the export query and pass the serialized output to emit() one batch at a
+    time (runs on a DB executor thread). Returns the number of rows written.
+    """
+    coordinates = EXPORT_QUERIES[dataset]['coordinates']
+    geojson = export_format == 'geojson'
+    rows_written = 0
+
+    with db_session(read_only=True, label=f"export: {dataset}",
+                    hold_warning_seconds=EXPORT_HOLD_WARNING_SECONDS) as (connection, cursor):
+        cursor.execute(query, params)
+        if geojson:
+            emit('{"type":"FeatureCollection","features":[\n'.encode())
+        try:
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                if geojson:
+                    separator = '' if rows_written == 0 else ',\n'
+                    chunk = separator + ',\n'.join(_dumps(_feature(row, coordinates)) for row in rows)
+                else:
+                    chunk = ''.join(_dumps(row) + '\n' for row in rows)
+                rows_written += len(rows)
+                emit(chunk.encode())
+        except ExportCancelled:
+            # The result set must be read to the end before the connection can be reused
+            while cursor.fetchmany(EXPORT_FETCH_SIZE):
+                pass
+            raise
+        if geojson:
+            emit('\n]}\n'.encode())
+
+    return rows_written
+
+
+async def stream_export(dataset: str, export_format: str, query: str, params: List[Any]) -> AsyncIterator[bytes]:
+    """
+    Bridge write_export() on a DB executor thread to an async byte stream for StreamingResponse.
+    The caller acquires an export_slots slot first; it is released once the producer has
+    given its connection back, which after a client disconnect is only when the rest
+    of the result set has been drained, not when the stream closes.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    done = object()
+
+    def emit(chunk):
+        # Blocks while the queue is full (the client reads slower than the database)
+        future = asyncio.run_coroutine_threadsafe(queue.put(chunk), loop)
+        while True:
+            if cancelled.is_set():
+                future.cancel()
+                raise ExportCancelled()
+            try:
+                future.result(timeout=1)
+                return
+            except concurrent.futures.TimeoutError:
+                continue
+
+    def produce():
+        try:
+            return write_export(emit, dataset, export_format, query, params)
+        finally:
+            if not cancelled.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(done), loop)
+
+    producer = asyncio.ensure_future(run_read_db(produce))
+    producer.add_done_callback(lambda _: export_slots.release())
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is done:
+                break
+            yield chunk
+        rows = await producer
+        logger.info(f"Exported {rows} {dataset} as {export_format}")
+    except ExportCancelled:
+        pass
+    except Exception as e:
+        logger.error(f"Export of {dataset} failed: {e}")
+        raise
+    finally:
+        cancelled.set()
+        if not producer.done():
+            # Let the producer finish draining on its thread; only log its outcome
+            producer.add_done_callback(_log_cancelled_export)
+
+
+def _log_cancelled_export(producer: asyncio.Future):
+    error = producer.exception() if not producer.cancelled() else None
+    if error is not None and not isinstance(error, ExportCancelled):
+        logger.error(f"Export failed after the client disconnected: {error}")
+    else:
+        logger.info("Export cancelled by the client")
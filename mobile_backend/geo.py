@@ -0,0 +1,297 @@
+# Geospatial helpers for EcoLafaek API
+# Great-circle distance and bounding-box math, scalar and vectorised over NumPy
+# arrays, plus the SQL radius filters. Radius filters pair an indexable
+# latitude/longitude bounding box with the exact great-circle check, so the
+# (latitude, longitude) indexes narrow the rows the distance is evaluated on
+
+import math
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Coordinates are stored as DECIMAL(10,8) / DECIMAL(11,8)
+_COORDINATE_QUANTUM = Decimal('0.00000001')
+
+# reports.geohash and hotspots.geohash hold a precision-9 geohash (~5 m cells).
+# Its prefixes are the coarser cells: 5 characters ~ 5 km, 6 ~ 1 km, 7 ~ 150 m
+GEOHASH_PRECISION = 9
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_GEOHASH_DECODE = {char: index for index, char in enumerate(_GEOHASH_BASE32)}
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometers"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    half_dphi = math.radians(lat2 - lat1) / 2
+    half_dlambda = math.radians(lon2 - lon1) / 2
+    a = math.sin(half_dphi) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(half_dlambda) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_km_array(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """
+    Element-wise great-circle distances in kilometers.
+    Arguments are anything NumPy can broadcast together (scalars, arrays, columns).
+    """
+    phi1 = np.radians(np.asarray(lats1, dtype=np.float64))
+    phi2 = np.radians(np.asarray(lats2, dtype=np.float64))
+    half_dphi = (phi2 - phi1) / 2
+    half_dlambda = np.radians(np.asarray(lons2, dtype=np.float64) - np.asarray(lons1, dtype=np.float64)) / 2
+    a = np.sin(half_dphi) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(half_dlambda) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def pairwise_distances_km(lats, lons, other_lats=None, other_lons=None) -> np.ndarray:
+    """
+    Distance matrix in kilometers: entry [i, j] is the distance from point i to
+    other point j (or to point j of the same set when no others are given)
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if other_lats is None:
+        other_lats, other_lons = lats, lons
+    return haversine_km_array(
+        lats[:, np.newaxis], lons[:, np.newaxis],
+        np.asarray(other_lats, dtype=np.float64)[np.newaxis, :],
+        np.asarray(other_lons, dtype=np.float64)[np.newaxis, :]
+    )
+
+
+def within_radius(lats, lons, lat: float, lon: float, radius_km: float) -> np.ndarray:
+    """Boolean mask of the points strictly within radius_km of (lat, lon)"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    mask = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+    # Only the points inside the box need the trigonometry
+    candidates = np.flatnonzero(mask)
+    mask[candidates] = haversine_km_array(lat, lon, lats[candidates], lons[candidates]) < radius_km
+    return mask
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """
+    Smallest latitude/longitude box containing every point within radius_km of (lat, lon).
+
+    Returns:
+        (min_lat, max_lat, min_lon, max_lon). When the circle reaches a pole or
+        crosses the antimeridian the longitude range is widened to [-180, 180]
+        so the box stays a single BETWEEN pair; the exact distance check still
+        applies.
+    """
+    angular_radius = radius_km / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angular_radius)
+    min_lat = lat - delta_lat
+    max_lat = lat + delta_lat
+
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+
+    ratio = math.sin(angular_radius) / math.cos(math.radians(lat))
+    if ratio >= 1:
+        return min_lat, max_lat, -180.0, 180.0
+
+    delta_lon = math.degrees(math.asin(ratio))
+    min_lon = lon - delta_lon
+    max_lon = lon + delta_lon
+    if min_lon < -180 or max_lon > 180:
+        return min_lat, max_lat, -180.0, 180.0
+
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def distance_sql(lat_column: str = 'latitude', lon_column: str = 'longitude') -> str:
+    """
+    SQL great-circle distance in kilometers from a point to the row's coordinates.
+    Takes the parameters (lat, lon, lat) - see RadiusFilter.distance_params.
+    """
+    # LEAST() guards acos() against rounding just above 1, which yields NULL
+    # (and drops the row) when the point and the row coincide
+    return (
+        f"6371 * acos(LEAST(1.0, "
+        f"cos(radians(%s)) * cos(radians({lat_column})) * "
+        f"cos(radians({lon_column}) - radians(%s)) + "
+        f"sin(radians(%s)) * sin(radians({lat_column}))))"
+    )
+
+
+class RadiusFilter:
+    """
+    SQL fragments selecting rows within radius_km of a point.
+
+    where_sql ANDs a BETWEEN box on the coordinate columns, answered from the
+    (latitude, longitude) index, with the exact distance check. The SQL text only
+    depends on the column names, so it is stable for the prepared statement cache.
+    """
+
+    def __init__(self, lat: float, lon: float, radius_km: float,
+                 lat_column: str = 'latitude', lon_column: str = 'longitude'):
+        # Coordinates read back from the DECIMAL columns arrive as Decimal
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.radius_km = radius_km
+        self.lat_column = lat_column
+        self.lon_column = lon_column
+        self.box = bounding_box(self.lat, self.lon, radius_km)
+
+    @property
+    def box_sql(self) -> str:
+        return f"{self.lat_column} BETWEEN %s AND %s AND {self.lon_column} BETWEEN %s AND %s"
+
+    @property
+    def box_params(self) -> Tuple[Decimal, Decimal, Decimal, Decimal]:
+        # Bounds are rounded outwards to the column scale and sent as DECIMAL so
+        # the comparison stays an index range rather than a floating-point cast
+        min_lat, max_lat, min_lon, max_lon = self.box
+        return (
+            Decimal(min_lat).quantize(_COORDINATE_QUANTUM, rounding=ROUND_FLOOR),
+            Decimal(max_lat).quantize(_COORDINATE_QUANTUM, rounding=ROUND_CEILING),
+            Decimal(min_lon).quantize(_COORDINATE_QUANTUM, rounding=ROUND_FLOOR),
+            Decimal(max_lon).quantize(_COORDINATE_QUANTUM, rounding=ROUND_CEILING),
+        )
+
+    @property
+    def distance_sql(self) -> str:
+        return distance_sql(self.lat_column, self.lon_column)
+
+    @property
+    def distance_params(self) -> Tuple[float, float, float]:
+        return (self.lat, self.lon, self.lat)
+
+    @property
+    def where_sql(self) -> str:
+        return f"{self.box_sql} AND {self.distance_sql} < %s"
+
+    @property
+    def where_params(self) -> tuple:
+        return self.box_params + self.distance_params + (self.radius_km,)
+
+
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Geohash of a point, precision characters long"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Bits alternate between longitude and latitude, longitude first
+    while len(chars) < precision:
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(cell: str) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in cell:
+        bits = _GEOHASH_DECODE[char]
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            mid = (bounds[0] + bounds[1]) / 2
+            if (bits >> shift) & 1:
+                bounds[0] = mid
+            else:
+                bounds[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def geohash_neighbourhood(cell: str) -> List[str]:
+    """The cell followed by its 8 neighbours (fewer distinct cells next to a pole)"""
+    min_lat, max_lat, min_lon, max_lon = geohash_bounds(cell)
+    height = max_lat - min_lat
+    width = max_lon - min_lon
+    center_lat = (min_lat + max_lat) / 2
+    center_lon = (min_lon + max_lon) / 2
+
+    cells = [cell]
+    for dlat in (-1, 0, 1):
+        for dlon in (-1, 0, 1):
+            if dlat == 0 and dlon == 0:
+                continue
+            lat = min(max(center_lat + dlat * height, -90.0), 90.0)
+            lon = (center_lon + dlon * width + 180.0) % 360.0 - 180.0
+            cells.append(geohash_encode(lat, lon, len(cell)))
+    return cells
+
+
+def geohash_precision_for_radius(lat: float, radius_km: float) -> int:
+    """
+    Longest geohash prefix whose 3x3 neighbourhood around a point is guaranteed to
+    contain every point within radius_km of it (each cell must be at least
+    radius_km tall and wide at this latitude)
+    """
+    # Radii beyond a 2-character cell (~600 km) fall back to the 1-character grid
+    for precision in range(GEOHASH_PRECISION, 1, -1):
+        lon_bits = (5 * precision + 1) // 2
+        lat_bits = 5 * precision // 2
+        height_km = 180.0 / (1 << lat_bits) * math.pi * EARTH_RADIUS_KM / 180
+        # Use the cell's edge furthest from the equator, where it is narrowest
+        edge_lat = min(abs(lat) + 180.0 / (1 << lat_bits), 90.0)
+        width_km = 360.0 / (1 << lon_bits) * math.pi * EARTH_RADIUS_KM / 180 * math.cos(math.radians(edge_lat))
+        if min(height_km, width_km) >= radius_km:
+            return precision
+    return 1
+
+
+class NearestPointIndex:
+    """
+    In-memory nearest-neighbour index over a fixed set of points.
+
+    Points are kept in NumPy arrays sorted by latitude. A query binary-searches
+    the latitude band of its bounding box, drops candidates outside the longitude
+    range and computes the Haversine distance for the rest in one vectorised pass.
+    Rebuild the index to change the points.
+    """
+
+    def __init__(self, ids: Sequence, lats: Sequence[float], lons: Sequence[float]):
+        lats = np.asarray(lats, dtype=np.float64)
+        order = np.argsort(lats, kind='stable')
+        self.ids = np.asarray(ids)[order]
+        self.lats = lats[order]
+        self.lons = np.asarray(lons, dtype=np.float64)[order]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nearest(self, lat: float, lon: float, max_km: float) -> Optional[Tuple[object, float]]:
+        """The (id, distance_km) of the closest point within max_km, or None"""
+        lat = float(lat)
+        lon = float(lon)
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, max_km)
+        start = int(np.searchsorted(self.lats, min_lat, side='left'))
+        stop = int(np.searchsorted(self.lats, max_lat, side='right'))
+        if start >= stop:
+            return None
+
+        lats = self.lats[start:stop]
+        lons = self.lons[start:stop]
+        in_box = (lons >= min_lon) & (lons <= max_lon)
+        if not in_box.any():
+            return None
+        candidates = np.flatnonzero(in_box)
+        distances = haversine_km_array(lat, lon, lats[candidates], lons[candidates])
+
+        best = int(np.argmin(distances))
+        if distances[best] >= max_km:
+            return None
+        return self.ids[start + candidates[best]].item(), float(distances[best])
@@ -0,0 +1,1060 @@
+# Incremental hotspot clustering for EcoLafaek API
+# Hotspots are DBSCAN clusters of analyzed reports: a report with at least
+# HOTSPOT_MIN_REPORTS reports (itself included) within HOTSPOT_RADIUS_KM is a core
+# report, core reports within the radius of each other share a cluster, and other
+# reports within the radius of a core report join its cluster as border reports.
+# Clusters are kept in memory as a union-find over a geohash grid, so each new
+# report costs a few neighbourhood lookups and near-constant union work, and
+# clusters that become connected through it are merged. Cluster aggregates
+# (centroid, severity sum and count, waste type histogram) are carried on the
+# union-find roots, so hotspot rows are rewritten without re-scanning their reports.
+
+import os
+import json
+import math
+import time
+import logging
+import threading
+import zlib
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from geo import EARTH_RADIUS_KM, geohash_encode, geohash_neighbourhood, geohash_precision_for_radius, haversine_km
+
+logger = logging.getLogger(__name__)
+
+HOTSPOT_RADIUS_KM = float(os.getenv('HOTSPOT_RADIUS_KM', '0.5'))
+HOTSPOT_MIN_REPORTS = int(os.getenv('HOTSPOT_MIN_REPORTS', '3'))
+# The engine is rebuilt from the database in the background after this long (catches writes from other processes)
+HOTSPOT_ENGINE_TTL_SECONDS = float(os.getenv('HOTSPOT_ENGINE_TTL_SECONDS', '3600'))
+# How long an update waits for a rebuild when there are no usable clusters before giving up
+HOTSPOT_ENGINE_LOAD_TIMEOUT_SECONDS = float(os.getenv('HOTSPOT_ENGINE_LOAD_TIMEOUT_SECONDS', '120'))
+HOTSPOT_ENGINE_LOAD_BATCH = 5000
+# Rows per multi-row INSERT into hotspot_reports
+HOTSPOT_LINK_BATCH = 1000
+# Candidate pairs examined at once by cluster_points() (bounds its memory use)
+CLUSTER_PAIR_BUDGET = 4_000_000
+# Enough stripes that unrelated areas rarely share one (a neighbourhood takes 9)
+HOTSPOT_LOCK_STRIPES = int(os.getenv('HOTSPOT_LOCK_STRIPES', '4096'))
+# Lock cells are sized for this latitude; they are narrower than intended beyond it
+HOTSPOT_LOCK_MAX_LATITUDE = 60.0
+
+
+class ClusterChange:
+    """What adding one point did to the clustering"""
+
+    def __init__(self, point_id, neighbours: int):
+        self.point_id = point_id
+        # Points within the radius, the new point excluded
+        self.neighbours = neighbours
+        # Root of the point's cluster, None while it is noise
+        self.root = None
+        # Points that moved from an unlabelled set into a labelled cluster
+        self.joined: List[Any] = []
+        # (kept label, absorbed label) for labelled clusters that were merged
+        self.merged: List[tuple] = []
+
+
+class DensityClusters:
+    """
+    Incremental DBSCAN over points on the sphere. Points are added one at a
+    time; a removal rebuilds only the clusters around the removed point.
+    """
+
+    def __init__(self, radius_km: float, min_points: int):
+        self.radius_km = radius_km
+        self.min_points = min_points
+        self._precision = None
+        self._max_abs_lat = 0.0
+        self._cells: Dict[str, List[Any]] = defaultdict(list)
+        self._points: Dict[Any, tuple] = {}
+        # point_id -> (severity, waste_type), to add points back after a removal
+        self._attributes: Dict[Any, tuple] = {}
+        self._counts: Dict[Any, int] = {}
+        self._core = set()
+        # Union-find over all points; noise points are singletons
+        self._parent: Dict[Any, Any] = {}
+        self._members: Dict[Any, List[Any]] = {}
+        # Per root: [sum of latitudes, sum of longitudes, severity sum, severity count]
+        self._sums: Dict[Any, List[float]] = {}
+        self._waste_types: Dict[Any, Counter] = {}
+        self._has_core = set()
+        self._labels: Dict[Any, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, point_id) -> bool:
+        return point_id in self._points
+
+    def _cell(self, lat: float, lon: float) -> str:
+        return geohash_encode(lat, lon, self._precision)
+
+    def _reindex(self, abs_lat: float):
+        # Cells must stay at least one radius wide at the furthest latitude seen
+        self._max_abs_lat = abs_lat
+        precision = geohash_precision_for_radius(abs_lat, self.radius_km)
+        if precision == self._precision:
+            return
+        self._precision = precision
+        self._cells = defaultdict(list)
+        for point_id, (lat, lon) in self._points.items():
+            self._cells[self._cell(lat, lon)].append(point_id)
+
+    def _neighbours(self, lat: float, lon: float, exclude=None) -> List[Any]:
+        found = []
+        for cell in set(geohash_neighbourhood(self._cell(lat, lon))):
+            for point_id in self._cells.get(cell, ()):
+                if point_id == exclude:
+                    continue
+                other_lat, other_lon = self._points[point_id]
+                if haversine_km(lat, lon, other_lat, other_lon) <= self.radius_km:
+                    found.append(point_id)
+        return found
+
+    def find(self, point_id):
+        root = point_id
+        while self._parent[root] != root:
+            root = self._parent[root]
+        # Path compression
+        while self._parent[point_id] != root:
+            self._parent[point_id], point_id = root, self._parent[point_id]
+        return root
+
+    def _union(self, a, b, change: ClusterChange):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return
+        # Union by size: the smaller member list is moved
+        if len(self._members[root_a]) < len(self._members[root_b]):
+            root_a, root_b = root_b, root_a
+        label_a, label_b = self._labels.pop(root_a, None), self._labels.pop(root_b, None)
+        if label_a is not None and label_b is not None:
+            change.merged.append((label_a, label_b))
+        elif label_a is not None:
+            change.joined.extend(self._members[root_b])
+        elif label_b is not None:
+            change.joined.extend(self._members[root_a])
+        label = label_a if label_a is not None else label_b
+
+        self._parent[root_b] = root_a
+        self._members[root_a].extend(self._members.pop(root_b))
+        sums_a, sums_b = self._sums[root_a], self._sums.pop(root_b)
+        for i, value in enumerate(sums_b):
+            sums_a[i] += value
+        waste_types_a, waste_types_b = self._waste_types[root_a], self._waste_types.pop(root_b)
+        if len(waste_types_a) < len(waste_types_b):
+            waste_types_a, waste_types_b = waste_types_b, waste_types_a
+            self._waste_types[root_a] = waste_types_a
+        waste_types_a.update(waste_types_b)
+        if root_b in self._has_core:
+            self._has_core.discard(root_b)
+            self._has_core.add(root_a)
+        if label is not None:
+            self._labels[root_a] = label
+
+    def add(self, point_id, lat: float, lon: float, severity: Optional[float] = None,
+            waste_type: Optional[str] = None) -> ClusterChange:
+        """Add a point, updating core points, cluster membership, merges and aggregates"""
+        if point_id in self._points:
+            change = ClusterChange(point_id, self._counts[point_id] - 1)
+            change.root = self.cluster_of(point_id)
+            return change
+
+        if self._precision is None or abs(lat) > self._max_abs_lat:
+            self._reindex(abs(lat))
+        neighbours = self._neighbours(lat, lon)
+        change = ClusterChange(point_id, len(neighbours))
+
+        self._points[point_id] = (lat, lon)
+        self._attributes[point_id] = (severity, waste_type)
+        self._cells[self._cell(lat, lon)].append(point_id)
+        self._parent[point_id] = point_id
+        self._members[point_id] = [point_id]
+        self._sums[point_id] = [lat, lon, severity or 0.0, 0 if severity is None else 1]
+        self._waste_types[point_id] = Counter([waste_type] if waste_type else [])
+        self._counts[point_id] = len(neighbours) + 1
+
+        # Only the new point and its neighbours can become core
+        new_core = [point_id] if self._counts[point_id] >= self.min_points else []
+        for neighbour in neighbours:
+            self._counts[neighbour] += 1
+            if self._counts[neighbour] == self.min_points:
+                new_core.append(neighbour)
+
+        for core in new_core:
+            self._core.add(core)
+            self._has_core.add(self.find(core))
+        for core in new_core:
+            if core == point_id:
+                core_neighbours = neighbours
+            else:
+                core_neighbours = self._neighbours(*self._points[core], exclude=core)
+            for neighbour in core_neighbours:
+                # Core neighbours connect clusters; noise neighbours become border points
+                if neighbour in self._core or self.find(neighbour) not in self._has_core:
+                    self._union(core, neighbour, change)
+
+        if point_id not in self._core and self.find(point_id) not in self._has_core:
+            for neighbour in neighbours:
+                if neighbour in self._core:
+                    self._union(neighbour, point_id, change)
+                    break
+
+        change.root = self.cluster_of(point_id)
+        return change
+
+    def remove(self, point_id):
+        """
+        Remove a point. Its neighbours can lose core status and their clusters
+        can split, so the clusters it touches (its own and its neighbours') are
+        taken apart and their other points added back; the rest are untouched.
+        Each of their labels goes to the new cluster holding most of its old members.
+        """
+        if point_id not in self._points:
+            return
+        lat, lon = self._points[point_id]
+        roots = {self.find(point_id)} | {self.find(neighbour) for neighbour in self._neighbours(lat, lon, exclude=point_id)}
+
+        labelled, taken = [], []
+        for root in roots:
+            members = self._members.pop(root)
+            label = self._labels.pop(root, None)
+            if label is not None:
+                labelled.append((label, [member for member in members if member != point_id]))
+            taken.extend(members)
+            del self._sums[root]
+            del self._waste_types[root]
+            self._has_core.discard(root)
+        points = {}
+        for member in taken:
+            member_lat, member_lon = points[member] = self._points.pop(member)
+            self._cells[self._cell(member_lat, member_lon)].remove(member)
+            del self._parent[member]
+            del self._counts[member]
+            self._core.discard(member)
+        attributes = {member: self._attributes.pop(member) for member in taken}
+        # Points left in place no longer count the ones taken out as neighbours
+        for member_lat, member_lon in points.values():
+            for neighbour in self._neighbours(member_lat, member_lon):
+                self._counts[neighbour] -= 1
+
+        for member in sorted(member for member in taken if member != point_id):
+            self.add(member, *points[member], *attributes[member])
+        # Larger old clusters pick first
+        for label, members in sorted(labelled, key=lambda item: -len(item[1])):
+            votes = Counter(self.cluster_of(member) for member in members)
+            votes.pop(None, None)
+            for root, _ in votes.most_common():
+                if root not in self._labels:
+                    self._labels[root] = label
+                    break
+
+    def is_core(self, point_id) -> bool:
+        return point_id in self._core
+
+    def cluster_of(self, point_id):
+        """Root of the point's cluster, or None for noise"""
+        root = self.find(point_id)
+        return root if root in self._has_core else None
+
+    def clusters(self) -> List[Any]:
+        return list(self._has_core)
+
+    def members(self, root) -> List[Any]:
+        return self._members[root]
+
+    def size(self, root) -> int:
+        return len(self._members[root])
+
+    def centroid(self, root) -> tuple:
+        sum_lat, sum_lon = self._sums[root][:2]
+        count = len(self._members[root])
+        return sum_lat / count, sum_lon / count
+
+    def severity(self, root) -> tuple:
+        """(sum, count) of the severities recorded for the cluster's points"""
+        return self._sums[root][2], self._sums[root][3]
+
+    def waste_types(self, root) -> Dict[str, int]:
+        return dict(self._waste_types[root])
+
+    def label(self, root):
+        return self._labels.get(root)
+
+    def set_label(self, root, label):
+        if label is None:
+            self._labels.pop(root, None)
+        else:
+            self._labels[root] = label
+
+    def move_label(self, root, label):
+        """Give a cluster a label, taking it from whichever cluster had it"""
+        for other in [other for other, other_label in self._labels.items() if other_label == label]:
+            del self._labels[other]
+        self._labels[root] = label
+
+
+def _grid_cells(lats: np.ndarray, lons: np.ndarray, radius_km: float) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Row and column of each point on a lat/lon grid whose cells are at least radius_km on each side"""
+    cell_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    # Columns are sized for the latitude where they are narrowest
+    edge_lat = min(float(np.max(np.abs(lats))) + cell_lat, 89.999)
+    cell_lon = cell_lat / math.cos(math.radians(edge_lat))
+    columns = max(1, int(360.0 // cell_lon))
+    rows = np.floor((lats + 90.0) / cell_lat).astype(np.int64)
+    cols = np.floor((lons + 180.0) / 360.0 * columns).astype(np.int64) % columns
+    return rows, cols, columns
+
+
+def _neighbour_pairs(rows: np.ndarray, cols: np.ndarray, columns: int):
+    """
+    Yield (i, j) index arrays with i < j for every pair of points in the same or
+    adjacent grid cells, in batches of about CLUSTER_PAIR_BUDGET pairs.
+    Points must be sorted by cell (row * columns + col).
+    """
+    keys = rows * columns + cols
+    cell_keys, cell_starts, cell_sizes = np.unique(keys, return_index=True, return_counts=True)
+    col_offsets = (-1, 0, 1) if columns >= 3 else tuple(range(columns))
+
+    starts, sizes = [], []
+    for row_offset in (-1, 0, 1):
+        for col_offset in col_offsets:
+            neighbour_keys = (rows + row_offset) * columns + (cols + col_offset) % columns
+            position = np.minimum(np.searchsorted(cell_keys, neighbour_keys), len(cell_keys) - 1)
+            found = cell_keys[position] == neighbour_keys
+            start = cell_starts[position]
+            size = np.where(found, cell_sizes[position], 0)
+            # Only points after i in sort order, so each pair is produced once
+            skip = np.clip(np.arange(len(keys)) + 1 - start, 0, size)
+            starts.append(start + skip)
+            sizes.append(size - skip)
+    starts = np.stack(starts, axis=1)
+    sizes = np.stack(sizes, axis=1)
+
+    per_point = np.cumsum(sizes.sum(axis=1))
+    first = 0
+    while first < len(keys):
+        done = per_point[first - 1] if first else 0
+        last = max(first + 1, int(np.searchsorted(per_point, done + CLUSTER_PAIR_BUDGET, side='right')))
+        chunk_sizes = sizes[first:last].ravel()
+        total = int(chunk_sizes.sum())
+        if total:
+            i = np.repeat(np.repeat(np.arange(first, last), starts.shape[1]), chunk_sizes)
+            j = np.repeat(starts[first:last].ravel() - (np.cumsum(chunk_sizes) - chunk_sizes), chunk_sizes)
+            j += np.arange(total)
+            yield i, j
+        first = last
+
+
+def _flatten(parent: np.ndarray):
+    """Point every element straight at its root (pointer jumping)"""
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return
+        parent[:] = grandparent
+
+
+def _union_pairs(parent: np.ndarray, i: np.ndarray, j: np.ndarray):
+    """Merge the sets of each pair, always hooking the larger root under the smaller"""
+    while len(i):
+        _flatten(parent)
+        root_i, root_j = parent[i], parent[j]
+        pending = root_i != root_j
+        i, j = i[pending], j[pending]
+        root_i, root_j = root_i[pending], root_j[pending]
+        np.minimum.at(parent, np.maximum(root_i, root_j), np.minimum(root_i, root_j))
+
+
+def cluster_points(lats, lons, radius_km: float, min_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    DBSCAN over whole arrays of points, with the same rules as DensityClusters.
+    Returns (labels, core): labels numbers clusters from 0 with -1 for noise,
+    core marks the core points. Border points within reach of two clusters
+    join either one.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    count = len(lats)
+    if count == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+
+    rows, cols, columns = _grid_cells(lats, lons, radius_km)
+    order = np.lexsort((cols, rows))
+    rows, cols = rows[order], cols[order]
+    # Unit vectors: the great-circle distance is within the radius when the chord is
+    phi = np.radians(lats[order])
+    lam = np.radians(lons[order])
+    x, y, z = np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)
+    limit = (2 * math.sin(radius_km / EARTH_RADIUS_KM / 2)) ** 2
+
+    def within(i, j):
+        chord = (x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2 + (z[i] - z[j]) ** 2
+        keep = chord <= limit
+        return i[keep], j[keep]
+
+    # Pass 1: neighbour counts (the point itself included)
+    counts = np.ones(count, dtype=np.int64)
+    for i, j in _neighbour_pairs(rows, cols, columns):
+        i, j = within(i, j)
+        counts += np.bincount(i, minlength=count) + np.bincount(j, minlength=count)
+    core = counts >= min_points
+
+    # Pass 2: connect core points, remember one core neighbour of each other point
+    parent = np.arange(count)
+    border_of = np.full(count, -1, dtype=np.int64)
+    for i, j in _neighbour_pairs(rows, cols, columns):
+        i, j = within(i, j)
+        core_i, core_j = core[i], core[j]
+        both = core_i & core_j
+        _union_pairs(parent, i[both], j[both])
+        border_of[j[core_i & ~core_j]] = i[core_i & ~core_j]
+        border_of[i[core_j & ~core_i]] = j[core_j & ~core_i]
+
+    _flatten(parent)
+    roots = parent
+    sorted_labels = np.full(count, -1, dtype=np.int64)
+    cluster_roots, sorted_labels[core] = np.unique(roots[core], return_inverse=True)
+    border = ~core & (border_of >= 0)
+    sorted_labels[border] = sorted_labels[border_of[border]]
+
+    labels = np.empty(count, dtype=np.int64)
+    labels[order] = sorted_labels
+    core_mask = np.empty(count, dtype=bool)
+    core_mask[order] = core
+    return labels, core_mask
+
+
+def link_reports(cursor, hotspot_id, report_ids) -> int:
+    """
+    Link reports to a hotspot with multi-row INSERTs; links that already exist
+    are left alone by the (hotspot_id, report_id) unique key, anything else
+    (a missing hotspot or report) raises. Returns the number of links actually added.
+    """
+    added = 0
+    for offset in range(0, len(report_ids), HOTSPOT_LINK_BATCH):
+        batch = report_ids[offset:offset + HOTSPOT_LINK_BATCH]
+        placeholders = ", ".join(["(%s, %s)"] * len(batch))
+        cursor.execute(
+            f"INSERT INTO hotspot_reports (hotspot_id, report_id) VALUES {placeholders} "
+            "ON DUPLICATE KEY UPDATE hotspot_id = hotspot_id",
+            [value for report_id in batch for value in (hotspot_id, report_id)]
+        )
+        added += cursor.rowcount
+    return added
+
+
+def move_links(cursor, kept_id, absorbed_id):
+    """Move an absorbed hotspot's links to the hotspot it was merged into"""
+    # Reports linked to both would break the unique key; their absorbed link just goes
+    cursor.execute(
+        """
+        DELETE absorbed FROM hotspot_reports absorbed
+        JOIN hotspot_reports kept ON kept.report_id = absorbed.report_id AND kept.hotspot_id = %s
+        WHERE absorbed.hotspot_id = %s
+        """,
+        (kept_id, absorbed_id)
+    )
+    cursor.execute(
+        "UPDATE hotspot_reports SET hotspot_id = %s WHERE hotspot_id = %s",
+        (kept_id, absorbed_id)
+    )
+
+
+def unlink_report(cursor, report_id):
+    """
+    Take a report out of every hotspot it belongs to before it is deleted:
+    hotspots left below HOTSPOT_MIN_REPORTS are removed, the rest have the
+    report's severity and waste type subtracted from their aggregates.
+    """
+    cursor.execute(
+        """
+        SELECT a.severity_score, w.name AS waste_type
+        FROM analysis_results a
+        LEFT JOIN waste_types w ON a.waste_type_id = w.waste_type_id
+        WHERE a.report_id = %s
+        ORDER BY a.analysis_id DESC
+        LIMIT 1
+        """,
+        (report_id,)
+    )
+    analysis = cursor.fetchone() or {'severity_score': None, 'waste_type': None}
+    severity = analysis['severity_score']
+    # JSON path of the report's waste type in the histogram
+    waste_type_path = f"$.{json.dumps(analysis['waste_type'])}" if analysis['waste_type'] else None
+
+    cursor.execute(
+        """
+        SELECT h.hotspot_id, h.total_reports
+        FROM hotspots h
+        JOIN hotspot_reports hr ON h.hotspot_id = hr.hotspot_id
+        WHERE hr.report_id = %s
+        FOR UPDATE
+        """,
+        (report_id,)
+    )
+    for hotspot in cursor.fetchall():
+        hotspot_id = hotspot['hotspot_id']
+        new_count = hotspot['total_reports'] - 1
+
+        if new_count < HOTSPOT_MIN_REPORTS:
+            logger.info(f"Deleting hotspot {hotspot_id} - report count below threshold ({new_count})")
+            cursor.execute("DELETE FROM hotspot_reports WHERE hotspot_id = %s", (hotspot_id,))
+            cursor.execute("DELETE FROM hotspots WHERE hotspot_id = %s", (hotspot_id,))
+            continue
+
+        logger.info(f"Updating hotspot {hotspot_id} - new count: {new_count}")
+        assignments = ["total_reports = %s"]
+        params: List[Any] = [new_count]
+        if severity is not None:
+            # Assigned in this order so each expression still sees the old sum and count;
+            # rows without aggregates yet (severity_count 0) keep their stored average
+            assignments += [
+                "average_severity = CASE WHEN severity_count > 1 THEN (severity_sum - %s) / (severity_count - 1) "
+                "WHEN severity_count = 1 THEN NULL ELSE average_severity END",
+                "severity_sum = IF(severity_count > 0, severity_sum - %s, severity_sum)",
+                "severity_count = GREATEST(severity_count - 1, 0)",
+            ]
+            params += [severity, severity]
+        if waste_type_path:
+            assignments.append(
+                "waste_type_counts = JSON_SET(waste_type_counts, %s, "
+                "GREATEST(COALESCE(JSON_EXTRACT(waste_type_counts, %s), 0) - 1, 0))"
+            )
+            params += [waste_type_path, waste_type_path]
+        cursor.execute(
+            f"UPDATE hotspots SET {', '.join(assignments)} WHERE hotspot_id = %s",
+            (*params, hotspot_id)
+        )
+
+
+class StripedLock:
+    """A fixed pool of locks; a key always maps to the same one"""
+
+    def __init__(self, stripes: int):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self.waits = 0
+
+    @contextmanager
+    def hold(self, keys):
+        # Acquired in index order so overlapping key sets can't deadlock
+        indexes = sorted({zlib.crc32(str(key).encode()) % len(self._locks) for key in keys})
+        acquired = []
+        try:
+            for index in indexes:
+                lock = self._locks[index]
+                if not lock.acquire(blocking=False):
+                    self.waits += 1
+                    lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+
+class HotspotEngine:
+    """
+    Keeps the hotspots and hotspot_reports tables in line with DensityClusters.
+    The clusters are built from the database by a background thread on its own
+    read connection: at start(), after HOTSPOT_ENGINE_TTL_SECONDS, and whenever
+    they may be out of step with the tables. Only the last case holds up updates.
+    """
+
+    def __init__(self, radius_km: float, min_reports: int, ttl_seconds: float):
+        self.radius_km = radius_km
+        self.min_reports = min_reports
+        self.ttl_seconds = ttl_seconds
+        self._clusters: Optional[DensityClusters] = None
+        self._loaded_at = 0.0
+        # Set when the clusters may be ahead of the database; updates wait for a rebuild
+        self._stale = False
+        # Guards the in-memory clustering; held only while it changes, never across SQL
+        self._lock = threading.Lock()
+        # Notified when a rebuild is swapped in or fails
+        self._loaded = threading.Condition(self._lock)
+        # Cells at least twice the radius wide: anything one update changes lies within
+        # one cell of it, so updates that can meet share a stripe of their 3x3 neighbourhoods
+        self.lock_precision = geohash_precision_for_radius(HOTSPOT_LOCK_MAX_LATITUDE, 2 * radius_km)
+        self.cell_locks = StripedLock(HOTSPOT_LOCK_STRIPES)
+        # Per thread: the stripes held by transaction(), and reports it added to the clusters
+        self._local = threading.local()
+        # Reports added to the clusters but not committed yet:
+        # report_id -> (lat, lon, severity, waste_type)
+        self._inflight: Dict[Any, tuple] = {}
+        # Opens the read-only (connection, cursor) session rebuilds use; set by start()
+        self._read_session: Optional[Callable] = None
+        self._refreshing = False
+        # Bumped when the clusters turn out to disagree with the tables,
+        # so a rebuild that began before that is done again
+        self._generation = 0
+        # While a rebuild runs: ('add', report_id, point) and ('remove', report_id)
+        # since it began, replayed onto the rebuilt clusters before they are swapped in
+        self._journal: Optional[List[tuple]] = None
+        self.loads = 0
+        self.load_failures = 0
+        self.updates = 0
+        self.merges = 0
+        self.recreated = 0
+
+    def start(self, read_session: Callable):
+        """Build the clusters in the background; read_session() opens a read-only (connection, cursor) session"""
+        with self._lock:
+            self._read_session = read_session
+            self._refresh()
+
+    def refresh(self):
+        """Rebuild the clusters in the background; updates carry on with the current ones meanwhile"""
+        with self._lock:
+            self._refresh()
+
+    def invalidate(self):
+        """The clusters disagree with the tables: updates wait for a rebuild started from now"""
+        with self._lock:
+            self._stale = True
+            self._generation += 1
+            self._refresh()
+
+    def wait_until_ready(self, timeout: float = HOTSPOT_ENGINE_LOAD_TIMEOUT_SECONDS) -> bool:
+        """Wait for usable clusters, so a caller can do it before taking a connection"""
+        with self._lock:
+            return self._loaded.wait_for(
+                lambda: (self._clusters is not None and not self._stale) or not self._refreshing, timeout
+            ) and self._clusters is not None and not self._stale
+
+    def _refresh(self):
+        # Called with _lock held
+        if self._refreshing or self._read_session is None:
+            return
+        self._refreshing = True
+        # Reports not committed yet are invisible to the rebuild
+        self._journal = [('add', report_id, point) for report_id, point in self._inflight.items()]
+        threading.Thread(target=self._rebuild, name='hotspot-engine-load', daemon=True).start()
+
+    def _rebuild(self):
+        while True:
+            with self._lock:
+                generation = self._generation
+            try:
+                with self._read_session() as (connection, cursor):
+                    clusters = self._load(cursor)
+            except Exception as e:
+                logger.error(f"Hotspot engine load failed: {e}")
+                with self._lock:
+                    self.load_failures += 1
+                    self._refreshing = False
+                    self._journal = None
+                    self._loaded.notify_all()
+                return
+
+            with self._lock:
+                if generation != self._generation:
+                    self._journal = [('add', report_id, point) for report_id, point in self._inflight.items()]
+                    continue
+                # Bring the rebuilt clusters up to date with what happened while loading
+                added = []
+                for op in self._journal:
+                    if op[0] == 'add':
+                        clusters.add(op[1], *op[2])
+                        added.append(op[1])
+                    else:
+                        clusters.remove(op[1])
+                # Hotspots those reports were given may not be committed yet either
+                live = self._clusters
+                if live is not None:
+                    for report_id in added:
+                        old_root = live.cluster_of(report_id) if report_id in live else None
+                        label = live.label(old_root) if old_root is not None else None
+                        root = clusters.cluster_of(report_id) if report_id in clusters else None
+                        if label is not None and root is not None:
+                            clusters.move_label(root, label)
+                self._clusters = clusters
+                self._loaded_at = time.monotonic()
+                self._stale = False
+                self._refreshing = False
+                self._journal = None
+                self.loads += 1
+                self._loaded.notify_all()
+                return
+
+    def _load(self, cursor) -> DensityClusters:
+        started = time.perf_counter()
+        clusters = DensityClusters(self.radius_km, self.min_reports)
+        # Each report with its latest analysis
+        cursor.execute(
+            """
+            SELECT r.report_id, r.latitude, r.longitude, a.severity_score, w.name AS waste_type
+            FROM reports r
+            LEFT JOIN (
+                SELECT report_id, MAX(analysis_id) AS analysis_id
+                FROM analysis_results
+                GROUP BY report_id
+            ) latest ON latest.report_id = r.report_id
+            LEFT JOIN analysis_results a ON a.analysis_id = latest.analysis_id
+            LEFT JOIN waste_types w ON a.waste_type_id = w.waste_type_id
+            WHERE r.status = 'analyzed'
+            ORDER BY r.report_id
+            """
+        )
+        while True:
+            rows = cursor.fetchmany(HOTSPOT_ENGINE_LOAD_BATCH)
+            if not rows:
+                break
+            for row in rows:
+                severity = row['severity_score']
+                clusters.add(row['report_id'], float(row['latitude']), float(row['longitude']),
+                             float(severity) if severity is not None else None, row['waste_type'])
+
+        # Each cluster keeps the hotspot most of its reports are already linked to
+        cursor.execute("SELECT report_id, hotspot_id FROM hotspot_reports")
+        links = defaultdict(list)
+        for row in cursor.fetchall():
+            links[row['report_id']].append(row['hotspot_id'])
+        claimed = set()
+        for root in clusters.clusters():
+            votes = Counter(
+                hotspot_id
+                for report_id in clusters.members(root)
+                for hotspot_id in links.get(report_id, ())
+            )
+            for hotspot_id, _ in votes.most_common():
+                if hotspot_id not in claimed:
+                    clusters.set_label(root, hotspot_id)
+                    claimed.add(hotspot_id)
+                    break
+
+        logger.info(f"Loaded {len(clusters)} reports into the hotspot engine: "
+                    f"{len(clusters.clusters())} clusters in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return clusters
+
+    def _current(self) -> DensityClusters:
+        """The clusters, waiting for a rebuild if there are none or they are stale; call with _lock held"""
+        if self._clusters is not None and time.monotonic() - self._loaded_at >= self.ttl_seconds:
+            self._refresh()
+        if self._read_session is None:
+            raise RuntimeError("The hotspot engine was not started")
+        deadline = time.monotonic() + HOTSPOT_ENGINE_LOAD_TIMEOUT_SECONDS
+        failures = self.load_failures
+        while self._clusters is None or self._stale:
+            if self.load_failures != failures:
+                raise RuntimeError("The hotspot engine could not be loaded")
+            self._refresh()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Timed out waiting for the hotspot engine to load")
+            self._loaded.wait(remaining)
+        return self._clusters
+
+    def _lock_keys(self, lat: float, lon: float) -> List[str]:
+        """Geocells whose stripes serialize an update at (lat, lon) with every update that can touch the same hotspot"""
+        return geohash_neighbourhood(geohash_encode(lat, lon, self.lock_precision))
+
+    @contextmanager
+    def transaction(self, report):
+        """
+        Hold a report's cell stripes for a whole database transaction. Wrap
+        everything from its first statement to the commit, so that no update
+        nearby works from clusters holding this report before its rows are
+        committed. If the block raises after update() added the report, the
+        clusters are ahead of the database and are rebuilt.
+        """
+        keys = self._lock_keys(float(report['latitude']), float(report['longitude']))
+        with self._cells(keys, held=False):
+            self._local.keys = keys
+            self._local.added = []
+            try:
+                yield
+            except BaseException:
+                added = self._local.added
+                if added:
+                    logger.warning(f"Transaction for reports {added} failed; reloading the hotspot engine")
+                    with self._lock:
+                        # The rebuild's snapshot never had them; only the journal must forget them
+                        if self._journal is not None:
+                            self._journal = [op for op in self._journal if op[1] not in added]
+                        for report_id in added:
+                            self._inflight.pop(report_id, None)
+                        self._stale = True
+                        self._refresh()
+                raise
+            finally:
+                with self._lock:
+                    for report_id in self._local.added:
+                        self._inflight.pop(report_id, None)
+                self._local.keys = None
+                self._local.added = []
+
+    @contextmanager
+    def _cells(self, keys: List[str], held: bool):
+        """
+        The cell stripes for keys, unless the thread's transaction() already holds
+        them. A reload requested while they were held starts once they are released.
+        """
+        if held:
+            yield
+            return
+        try:
+            with self.cell_locks.hold(keys):
+                yield
+        finally:
+            if getattr(self._local, 'reload', False):
+                self._local.reload = False
+                self.invalidate()
+
+    def remove_report(self, report_id):
+        """Take a deleted report out of the clusters; call inside transaction(), once the delete is committed"""
+        with self._lock:
+            if self._clusters is not None:
+                self._clusters.remove(report_id)
+            if self._journal is not None:
+                self._journal.append(('remove', report_id))
+
+    @staticmethod
+    def _lock_hotspot(cursor, hotspot_id) -> bool:
+        """
+        Lock a hotspot row until the caller commits, returning False if it no longer
+        exists. Writers of one hotspot queue here, so each snapshots the cluster
+        after the previous writer's changes and a row never goes back to an older one.
+        """
+        cursor.execute("SELECT hotspot_id FROM hotspots WHERE hotspot_id = %s FOR UPDATE", (hotspot_id,))
+        return cursor.fetchone() is not None
+
+    def _snapshot(self, report_id) -> Dict[str, Any]:
+        """Column values for the hotspot row of the report's cluster"""
+        with self._lock:
+            clusters = self._current()
+            root = clusters.find(report_id)
+            center_lat, center_lon = clusters.centroid(root)
+            severity_sum, severity_count = clusters.severity(root)
+            return {
+                'center_latitude': center_lat,
+                'center_longitude': center_lon,
+                'geohash': geohash_encode(center_lat, center_lon),
+                'total_reports': clusters.size(root),
+                'average_severity': round(severity_sum / severity_count, 2) if severity_count else None,
+                'severity_sum': severity_sum,
+                'severity_count': severity_count,
+                'waste_type_counts': json.dumps(clusters.waste_types(root))
+            }
+
+    def _write_hotspot(self, cursor, hotspot_id, report_id) -> int:
+        """Rewrite a locked hotspot row from its cluster's current aggregates"""
+        row = self._snapshot(report_id)
+        cursor.execute(
+            """
+            UPDATE hotspots
+            SET center_latitude = %s, center_longitude = %s, geohash = %s,
+                last_reported = %s, total_reports = %s, average_severity = %s,
+                severity_sum = %s, severity_count = %s, waste_type_counts = %s
+            WHERE hotspot_id = %s
+            """,
+            (row['center_latitude'], row['center_longitude'], row['geohash'],
+             datetime.now().date(), row['total_reports'], row['average_severity'],
+             row['severity_sum'], row['severity_count'], row['waste_type_counts'], hotspot_id)
+        )
+        return row['total_reports']
+
+    def _set_label(self, report_id, hotspot_id):
+        with self._lock:
+            clusters = self._current()
+            root = clusters.cluster_of(report_id)
+            if root is not None:
+                if hotspot_id is None:
+                    clusters.set_label(root, None)
+                else:
+                    clusters.move_label(root, hotspot_id)
+            return list(clusters.members(root)) if root is not None else [report_id]
+
+    def update(self, cursor, report, report_id, analysis_result) -> Dict[str, Any]:
+        """
+        Add an analyzed report to the clustering and write the hotspot changes it
+        causes. The writes join the caller's transaction; the caller commits.
+
+        Updates are serialized per geocell (striped locks over the report's 3x3
+        cell neighbourhood), so reports in one area can't both miss a new
+        hotspot and create duplicates, while other areas proceed in parallel.
+        Callers run it inside transaction(), which keeps the stripes until the
+        commit; outside one it takes them for its own writes only.
+        The in-memory clustering itself is only locked while it is changed.
+        """
+        lat, lon = float(report['latitude']), float(report['longitude'])
+        keys = self._lock_keys(lat, lon)
+        held = getattr(self._local, 'keys', None)
+        if held is not None and held != keys:
+            raise RuntimeError(f"Report {report_id} updated inside another report's hotspot transaction")
+        with self._cells(keys, bool(held)):
+            with self._lock:
+                clusters = self._current()
+                severity = analysis_result.get('severity_score')
+                point = (lat, lon, float(severity) if severity is not None else None,
+                         analysis_result.get('waste_type'))
+                added = report_id not in clusters
+                change = clusters.add(report_id, *point)
+                logger.info(f"Found {change.neighbours} nearby reports for report {report_id}")
+                if added:
+                    self._inflight[report_id] = point
+                    if self._journal is not None:
+                        self._journal.append(('add', report_id, point))
+                    if held:
+                        self._local.added.append(report_id)
+                if change.root is not None:
+                    hotspot_id = clusters.label(change.root)
+                    new_links = list(clusters.members(change.root)) if hotspot_id is None else change.joined
+
+            try:
+                if change.root is None:
+                    return {
+                        "hotspot_created": None,
+                        "total_reports": change.neighbours + 1,
+                        "action": "insufficient_reports"
+                    }
+                return self._write(cursor, report, report_id, change, hotspot_id, new_links)
+            finally:
+                if added and not held:
+                    # Without transaction() the report counts as committed from here
+                    with self._lock:
+                        self._inflight.pop(report_id, None)
+
+    def _write(self, cursor, report, report_id, change: ClusterChange, hotspot_id, new_links) -> Dict[str, Any]:
+        """Write the hotspot changes of an added report that is in a cluster"""
+        try:
+            if hotspot_id is not None and not self._lock_hotspot(cursor, hotspot_id):
+                # Deleted outside the engine (admin panel, recluster_hotspots.py --apply):
+                # recreate it from the clusters in hand. Other labels may be stale too, so
+                # reload, but only once the cell locks are released; waiting for a rebuild
+                # here would hold them and this transaction open for its whole duration
+                logger.warning(f"Hotspot {hotspot_id} no longer exists, recreating it for report {report_id}")
+                self.recreated += 1
+                new_links = self._set_label(report_id, None)
+                hotspot_id = None
+                self._local.reload = True
+
+            # Clusters joined through this report are folded into the surviving hotspot
+            # (a chain of merges all ends in it); with no survivor they are dropped
+            for absorbed_id in dict.fromkeys(absorbed_id for _, absorbed_id in change.merged):
+                if hotspot_id is not None:
+                    move_links(cursor, hotspot_id, absorbed_id)
+                else:
+                    cursor.execute("DELETE FROM hotspot_reports WHERE hotspot_id = %s", (absorbed_id,))
+                cursor.execute("DELETE FROM hotspots WHERE hotspot_id = %s", (absorbed_id,))
+                self.merges += 1
+                logger.info(f"Merged hotspot {absorbed_id} into hotspot {hotspot_id or 'new hotspot'}")
+
+            if hotspot_id is None:
+                action = "created"
+                today = datetime.now().date()
+                row = self._snapshot(report_id)
+                total_reports = row['total_reports']
+                cursor.execute(
+                    """
+                    INSERT INTO hotspots (
+                        name, center_latitude, center_longitude, geohash, radius_meters,
+                        location_id, first_reported, last_reported, total_reports,
+                        average_severity, severity_sum, severity_count, waste_type_counts, status
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    (
+                        f"Hotspot near {report.get('address_text', 'Unknown')}",
+                        row['center_latitude'],
+                        row['center_longitude'],
+                        row['geohash'],
+                        int(self.radius_km * 1000),
+                        report.get('location_id'),
+                        today,
+                        today,
+                        total_reports,
+                        row['average_severity'],
+                        row['severity_sum'],
+                        row['severity_count'],
+                        row['waste_type_counts'],
+                        'active'
+                    )
+                )
+                hotspot_id = cursor.lastrowid
+                self._set_label(report_id, hotspot_id)
+                logger.info(f"Created new hotspot {hotspot_id}")
+            else:
+                action = "merged" if change.merged else "updated"
+                total_reports = self._write_hotspot(cursor, hotspot_id, report_id)
+                logger.info(f"Updated existing hotspot {hotspot_id}")
+
+            links_added = link_reports(cursor, hotspot_id, new_links) if new_links else 0
+            if links_added:
+                logger.info(f"Associated {links_added} reports with hotspot {hotspot_id}")
+            if links_added != len(new_links):
+                # Reports the clusters saw as unlinked already were: they are out of step with the tables
+                logger.warning(f"Expected {len(new_links)} new links to hotspot {hotspot_id}, "
+                               f"added {links_added}; reloading the hotspot engine")
+                self.invalidate()
+
+            self.updates += 1
+            return {
+                "hotspot_created": hotspot_id,
+                "total_reports": total_reports,
+                "links_added": links_added,
+                "action": action
+            }
+        except Exception:
+            # The in-memory clusters may now be ahead of the database
+            self.invalidate()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        clusters = self._clusters
+        return {
+            'ready': clusters is not None and not self._stale,
+            'reports': len(clusters) if clusters is not None else 0,
+            'clusters': len(clusters.clusters()) if clusters is not None else 0,
+            'refreshing': self._refreshing,
+            'loads': self.loads,
+            'load_failures': self.load_failures,
+            'updates': self.updates,
+            'merges': self.merges,
+            'recreated': self.recreated,
+            'lock_waits': self.cell_locks.waits,
+            'age_seconds': round(time.monotonic() - self._loaded_at, 1) if clusters is not None else None
+        }
+
+
+hotspot_engine = HotspotEngine(HOTSPOT_RADIUS_KM, HOTSPOT_MIN_REPORTS, HOTSPOT_ENGINE_TTL_SECONDS)
+
+
+def update_hotspots(cursor, connection, report, report_id, analysis_result):
+    """
+    Cluster a newly analyzed report into hotspots (creating, growing or merging
+    them). This function works for both waste and non-waste reports.
+
+    The writes join the caller's transaction; the caller commits. They sit
+    behind a savepoint, so a failed update leaves none of them behind and the
+    rest of the transaction can still commit.
+
+    Args:
+        cursor: Database cursor
+        connection: Database connection
+        report: Report data dictionary
+        report_id: ID of the current report
+        analysis_result: Analysis results dictionary
+
+    Returns:
+        Dictionary with hotspot creation results
+    """
+    cursor.execute("SAVEPOINT hotspot_update")
+    try:
+        result = hotspot_engine.update(cursor, report, report_id, analysis_result)
+    except Exception as e:
+        logger.error(f"Error in hotspot detection: {e}")
+        # Undo any merge or link written before the failure; update() has
+        # already marked the clusters stale
+        cursor.execute("ROLLBACK TO SAVEPOINT hotspot_update")
+        return {
+            "hotspot_created": None,
+            "error": str(e),
+            "action": "error"
+        }
+    cursor.execute("RELEASE SAVEPOINT hotspot_update")
+    return result
@@ -0,0 +1,256 @@
+# Duplicate photo detection for EcoLafaek API
+# People resubmit the same photo, or several near-identical burst shots, and
+# each one used to cost the Nova analysis and a Titan image embedding. Every
+# analyzed upload is fingerprinted (see image_prep.py) into the
+# image_fingerprints table: the SHA-256 of the uploaded bytes catches exact
+# copies through an indexed lookup, and a 64-bit difference hash catches
+# re-encoded, resized or slightly different shots. The difference hashes are
+# held in memory (loaded lazily from the table, so the index survives
+# restarts) and searched by Hamming distance with numpy. A match within
+# IMAGE_DEDUP_MAX_DISTANCE bits reuses the earlier report's stored analysis and
+# image embedding.
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from db import db_session
+from image_prep import hamming_distances
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DEDUP_ENABLED = os.getenv('IMAGE_DEDUP_ENABLED', 'true').lower() == 'true'
+IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv('IMAGE_DEDUP_MAX_DISTANCE', '6'))
+IMAGE_DEDUP_LOAD_BATCH = int(os.getenv('IMAGE_DEDUP_LOAD_BATCH', '10000'))
+
+# Near matches tried in order of distance before giving up on a lookup
+MAX_CANDIDATES = 3
+
+
+class DuplicateImage:
+    """An earlier report's analysis and image embedding, reusable for a new upload of the same photo"""
+
+    def __init__(self, report_id: int, match: str, distance: int,
+                 analysis: Dict[str, Any], image_embedding: Optional[List[float]]):
+        self.report_id = report_id
+        self.match = match  # 'exact' or 'near'
+        self.distance = distance
+        self.analysis = analysis
+        self.image_embedding = image_embedding
+
+
+def _parse_embedding(value) -> Optional[List[float]]:
+    # VECTOR columns come back as their text form, '[0.1,0.2,...]'
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode('utf-8')
+    try:
+        embedding = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    return embedding if isinstance(embedding, list) and embedding else None
+
+
+def _stored_analysis(cursor, report_id: int) -> Optional[Dict[str, Any]]:
+    """The analysis stored for a report, in the shape analyze_waste returns, with its image embedding"""
+    cursor.execute(
+        """
+        SELECT w.name AS waste_type, a.confidence_score, a.estimated_volume, a.severity_score,
+               a.priority_level, a.analysis_notes, a.full_description, a.image_embedding,
+               r.description
+        FROM analysis_results a
+        JOIN reports r ON a.report_id = r.report_id
+        JOIN waste_types w ON a.waste_type_id = w.waste_type_id
+        WHERE a.report_id = %s
+        ORDER BY a.analysis_id DESC
+        LIMIT 1
+        """,
+        (report_id,)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return None
+    analysis = {
+        "waste_type": row['waste_type'],
+        "severity_score": row['severity_score'],
+        "priority_level": row['priority_level'],
+        "estimated_volume": str(row['estimated_volume'] if row['estimated_volume'] is not None else 0),
+        "analysis_notes": row['analysis_notes'] or "",
+        "waste_detection_confidence": float(row['confidence_score']) if row['confidence_score'] is not None else 90.0,
+        "short_description": row['description'] or "",
+        "full_description": row['full_description'] or ""
+    }
+    return {"analysis": analysis, "image_embedding": _parse_embedding(row['image_embedding'])}
+
+
+def record_fingerprint(cursor, report_id: int, sha256: str, dhash: Optional[int]):
+    """Store a report's fingerprint in the caller's transaction"""
+    cursor.execute(
+        """
+        INSERT INTO image_fingerprints (report_id, sha256, dhash)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE sha256 = VALUES(sha256), dhash = VALUES(dhash)
+        """,
+        (report_id, sha256, dhash)
+    )
+
+
+class FingerprintIndex:
+    """Exact and Hamming-distance lookups of upload fingerprints, backed by the image_fingerprints table"""
+
+    def __init__(self, enabled: bool, max_distance: int, load_batch: int):
+        self.enabled = enabled
+        self.max_distance = max_distance
+        self.load_batch = load_batch
+        # Parallel arrays of report ids and difference hashes, plus rows
+        # added since they were built; only changed under _lock, never across SQL
+        self._report_ids = np.empty(0, dtype=np.int64)
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._pending: List[tuple] = []
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.loads = 0
+        self.lookups = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.total_ms = 0.0
+
+    def _load(self):
+        with self._load_lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            report_ids, hashes = [], []
+            with db_session(dictionary=False, read_only=True, label='image fingerprint load') as (connection, cursor):
+                cursor.execute("SELECT report_id, dhash FROM image_fingerprints WHERE dhash IS NOT NULL")
+                while True:
+                    rows = cursor.fetchmany(self.load_batch)
+                    if not rows:
+                        break
+                    for report_id, dhash in rows:
+                        report_ids.append(report_id)
+                        hashes.append(int(dhash))
+            with self._lock:
+                # Rows added while loading may be in both; a repeated id only costs a comparison
+                self._report_ids = np.array(report_ids, dtype=np.int64)
+                self._hashes = np.array(hashes, dtype=np.uint64)
+                self._loaded = True
+            self.loads += 1
+            logger.info(f"Loaded {len(report_ids)} image fingerprints in "
+                        f"{(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def _arrays(self):
+        with self._lock:
+            if self._pending:
+                ids, hashes = zip(*self._pending)
+                self._report_ids = np.concatenate([self._report_ids, np.array(ids, dtype=np.int64)])
+                self._hashes = np.concatenate([self._hashes, np.array(hashes, dtype=np.uint64)])
+                self._pending = []
+            return self._report_ids, self._hashes
+
+    def _near(self, dhash: int, exclude_report_id: int) -> List[tuple]:
+        """[(distance, report_id)] within max_distance, closest (then newest) first"""
+        report_ids, hashes = self._arrays()
+        if not len(hashes):
+            return []
+        distances = hamming_distances(hashes, dhash)
+        found = np.nonzero(distances <= self.max_distance)[0]
+        candidates = sorted(
+            {(int(distances[i]), -int(report_ids[i])) for i in found if report_ids[i] != exclude_report_id}
+        )
+        return [(distance, -negative_id) for distance, negative_id in candidates[:MAX_CANDIDATES]]
+
+    def find(self, report_id: int, sha256: str, dhash: Optional[int]) -> Optional[DuplicateImage]:
+        """
+        An earlier report with the same or a near-identical photo and a stored analysis.
+        Runs on the read executor.
+        """
+        if not self.enabled:
+            return None
+        if dhash is not None and not self._loaded:
+            self._load()
+
+        started = time.perf_counter()
+        duplicate = None
+        with db_session(read_only=True, label='image fingerprint lookup') as (connection, cursor):
+            cursor.execute(
+                """
+                SELECT report_id FROM image_fingerprints
+                WHERE sha256 = %s AND report_id != %s
+                ORDER BY report_id DESC
+                LIMIT 1
+                """,
+                (sha256, report_id)
+            )
+            row = cursor.fetchone()
+            candidates = [('exact', 0, row['report_id'])] if row else []
+            if dhash is not None:
+                candidates += [('near', distance, match_id) for distance, match_id in self._near(dhash, report_id)
+                               if not row or match_id != row['report_id']]
+
+            for match, distance, match_id in candidates:
+                stored = _stored_analysis(cursor, match_id)
+                if stored is None:
+                    # The report was deleted, or never finished its analysis
+                    self.forget(match_id)
+                    self.stale += 1
+                    continue
+                duplicate = DuplicateImage(match_id, match, distance, stored['analysis'], stored['image_embedding'])
+                break
+
+        with self._lock:
+            self.lookups += 1
+            self.total_ms += (time.perf_counter() - started) * 1000
+            if duplicate is None:
+                self.misses += 1
+            elif duplicate.match == 'exact':
+                self.exact_hits += 1
+            else:
+                self.near_hits += 1
+        return duplicate
+
+    def add(self, report_id: int, dhash: Optional[int]):
+        """Make a committed fingerprint searchable"""
+        if dhash is None:
+            return
+        with self._lock:
+            self._pending.append((report_id, dhash))
+
+    def forget(self, report_id: int):
+        """Drop a report's fingerprint from memory (its row goes with the report)"""
+        with self._lock:
+            self._pending = [entry for entry in self._pending if entry[0] != report_id]
+            keep = self._report_ids != report_id
+            if not keep.all():
+                self._report_ids = self._report_ids[keep]
+                self._hashes = self._hashes[keep]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            return {
+                'enabled': self.enabled,
+                'loaded': self._loaded,
+                'fingerprints': len(self._report_ids) + len(self._pending),
+                'loads': self.loads,
+                'lookups': self.lookups,
+                'exact_hits': self.exact_hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'hit_rate': round(hits / self.lookups, 4) if self.lookups else None,
+                'avg_ms': round(self.total_ms / self.lookups, 2) if self.lookups else None,
+                'max_distance': self.max_distance
+            }
+
+
+image_fingerprints = FingerprintIndex(IMAGE_DEDUP_ENABLED, IMAGE_DEDUP_MAX_DISTANCE, IMAGE_DEDUP_LOAD_BATCH)
@@ -0,0 +1,133 @@
+# Image downloads for the EcoLafaek analysis pipeline
+# One shared requests.Session keeps TLS connections to S3 alive between
+# reports, and downloads run on a dedicated bounded executor, so a download
+# costs one request instead of a new thread pool, a TCP connect and a TLS
+# handshake. Bodies are streamed with a byte cap and every download has connect,
+# read and total timeouts.
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DOWNLOAD_WORKERS = int(os.getenv('IMAGE_DOWNLOAD_WORKERS', '32'))
+IMAGE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS = float(os.getenv('IMAGE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS', '5'))
+IMAGE_DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv('IMAGE_DOWNLOAD_TIMEOUT_SECONDS', '30'))
+IMAGE_DOWNLOAD_MAX_BYTES = int(os.getenv('IMAGE_DOWNLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+IMAGE_DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class ImageDownloadError(Exception):
+    """The image could not be downloaded (bad status, too large, timeout or network error)"""
+
+
+class DownloadedImage:
+    """Body and content type of a downloaded image"""
+
+    def __init__(self, content: bytes, content_type: str):
+        self.content = content
+        self.content_type = content_type
+
+
+class ImageDownloader:
+    """Keep-alive image downloads on a dedicated executor, with timeouts and a size cap"""
+
+    def __init__(self, workers: int, max_bytes: int, connect_timeout: float, timeout: float):
+        self.max_bytes = max_bytes
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        # One pooled connection per worker, per host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-download')
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.downloads = 0
+        self.failures = 0
+        self.bytes_downloaded = 0
+        self.total_ms = 0.0
+
+    def download(self, url: str) -> DownloadedImage:
+        """
+        Download an image (blocking; use fetch() from async code).
+
+        Raises:
+            ImageDownloadError: Non-200 status, body over max_bytes, timeout or network error
+        """
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        try:
+            with self.session.get(url, stream=True, timeout=(self.connect_timeout, self.timeout)) as response:
+                if response.status_code != 200:
+                    raise ImageDownloadError(f"HTTP {response.status_code} from {url}")
+
+                declared = response.headers.get('Content-Length')
+                if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                    raise ImageDownloadError(f"Image is {int(declared)} bytes, limit is {self.max_bytes}")
+
+                body = bytearray()
+                for chunk in response.iter_content(IMAGE_DOWNLOAD_CHUNK_BYTES):
+                    body += chunk
+                    if len(body) > self.max_bytes:
+                        raise ImageDownloadError(f"Image exceeds the {self.max_bytes} byte limit")
+                    # The read timeout applies per chunk, this bounds the whole body
+                    if time.monotonic() > deadline:
+                        raise ImageDownloadError(f"Download of {url} took longer than {self.timeout:.0f}s")
+
+                image = DownloadedImage(bytes(body), response.headers.get('Content-Type', 'Unknown'))
+        except ImageDownloadError:
+            self._record(started, 0, failed=True)
+            raise
+        except requests.RequestException as e:
+            self._record(started, 0, failed=True)
+            raise ImageDownloadError(f"Download of {url} failed: {type(e).__name__}: {e}") from e
+
+        self._record(started, len(image.content))
+        return image
+
+    async def fetch(self, url: str) -> DownloadedImage:
+        """Download an image on the download executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.download, url)
+
+    def _record(self, started: float, size: int, failed: bool = False):
+        with self._lock:
+            if failed:
+                self.failures += 1
+            else:
+                self.downloads += 1
+                self.bytes_downloaded += size
+                self.total_ms += (time.perf_counter() - started) * 1000
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'downloads': self.downloads,
+                'failures': self.failures,
+                'bytes_downloaded': self.bytes_downloaded,
+                'avg_ms': round(self.total_ms / self.downloads, 2) if self.downloads else None,
+                'max_bytes': self.max_bytes,
+                'workers': self.workers
+            }
+
+
+image_downloader = ImageDownloader(
+    IMAGE_DOWNLOAD_WORKERS,
+    IMAGE_DOWNLOAD_MAX_BYTES,
+    IMAGE_DOWNLOAD_CONNECT_TIMEOUT_SECONDS,
+    IMAGE_DOWNLOAD_TIMEOUT_SECONDS
+)
@@ -0,0 +1,240 @@
+# Image preprocessing for the EcoLafaek analysis pipeline
+# Phone photos arrive at full resolution (often 12 MP and several MB), and the
+# same bytes were base64-encoded into every Nova call and the Titan embedding.
+# prepare_image() decodes once (JPEGs are decoded at a reduced DCT scale when
+# that is still large enough), applies the EXIF orientation, downscales to
+# IMAGE_MAX_EDGE and re-encodes at IMAGE_OUTPUT_QUALITY. The CPU work runs in a
+# small process pool so it neither holds the GIL nor blocks the event loop. The
+# pool is forked once at startup, before the server starts any threads.
+# The same pass fingerprints the upload (SHA-256 of the bytes and a 64-bit
+# difference hash of the oriented pixels) for image_dedup.py.
+
+import os
+import time
+import hashlib
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Any, Dict, Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PREPROCESS_ENABLED = os.getenv('IMAGE_PREPROCESS_ENABLED', 'true').lower() == 'true'
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '1280'))
+IMAGE_OUTPUT_FORMAT = os.getenv('IMAGE_OUTPUT_FORMAT', 'jpeg').lower()
+IMAGE_OUTPUT_QUALITY = int(os.getenv('IMAGE_OUTPUT_QUALITY', '85'))
+IMAGE_PREPROCESS_WORKERS = int(os.getenv('IMAGE_PREPROCESS_WORKERS', '2'))
+
+ORIENTATION_TAG = 0x0112
+DHASH_SIZE = 8
+
+# Nova accepts both; Titan image embeddings only take JPEG or PNG
+IMAGE_OUTPUT_FORMATS = ('jpeg', 'webp')
+if IMAGE_OUTPUT_FORMAT not in IMAGE_OUTPUT_FORMATS:
+    logger.warning(f"Unknown IMAGE_OUTPUT_FORMAT '{IMAGE_OUTPUT_FORMAT}', using jpeg")
+    IMAGE_OUTPUT_FORMAT = 'jpeg'
+
+
+class PreparedImage:
+    """Re-encoded image for the model calls, plus a JPEG for Titan embeddings and the upload's fingerprint"""
+
+    def __init__(self, data: bytes, image_format: str, width: int, height: int,
+                 original_bytes: int, embed_data: Optional[bytes] = None,
+                 sha256: Optional[str] = None, dhash: Optional[int] = None):
+        self.data = data
+        self.format = image_format
+        self.width = width
+        self.height = height
+        self.original_bytes = original_bytes
+        # Same bytes unless the model format isn't one Titan accepts
+        self.embed_data = embed_data if embed_data is not None else data
+        # Hex digest of the uploaded bytes, and the perceptual hash (None if never decoded)
+        self.sha256 = sha256 if sha256 is not None else hashlib.sha256(data).hexdigest()
+        self.dhash = dhash
+
+
+def difference_hash(image: Image.Image) -> int:
+    """64-bit dHash: whether each pixel of a 9x8 grayscale thumbnail is brighter than its right neighbour"""
+    small = image.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(DHASH_SIZE):
+        offset = row * (DHASH_SIZE + 1)
+        for column in range(DHASH_SIZE):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def hamming_distances(hashes: np.ndarray, dhash: int) -> np.ndarray:
+    """Differing bits between each 64-bit hash in a uint64 array and dhash"""
+    x = hashes ^ np.uint64(dhash)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    # NumPy 1.x: count bits in parallel within each word (SWAR popcount)
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def _encode(image: Image.Image, image_format: str, quality: int) -> bytes:
+    out = BytesIO()
+    if image_format == 'webp':
+        image.save(out, 'WEBP', quality=quality, method=4)
+    else:
+        image.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+def prepare_image(data: bytes, max_edge: int, image_format: str, quality: int) -> PreparedImage:
+    """
+    Decode, orient, downscale and re-encode an image (runs in a worker process).
+
+    Raises:
+        OSError: Pillow could not decode the image
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    with Image.open(BytesIO(data)) as source:
+        source_format = source.format
+        width, height = source.size
+        rotated = source.getexif().get(ORIENTATION_TAG, 1) != 1
+        oversized = max(width, height) > max_edge
+
+        # Already small, upright and JPEG: re-encoding would only lose quality
+        if source_format == 'JPEG' and image_format == 'jpeg' and not rotated and not oversized:
+            # The hash only needs a few pixels; decode at the smallest DCT scale
+            source.draft('L', (DHASH_SIZE * 8, DHASH_SIZE * 8))
+            return PreparedImage(data, 'jpeg', width, height, len(data),
+                                 sha256=sha256, dhash=difference_hash(source))
+
+        # Let the JPEG decoder skip detail the resize would throw away; the
+        # square request keeps both sides >= max_edge whatever the orientation
+        if source_format == 'JPEG':
+            source.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(source)
+
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        encoded = _encode(image, image_format, quality)
+        embed_data = _encode(image, 'jpeg', quality) if image_format != 'jpeg' else None
+        return PreparedImage(encoded, image_format, image.width, image.height, len(data), embed_data,
+                             sha256=sha256, dhash=difference_hash(image))
+
+
+class ImagePreprocessor:
+    """prepare_image() on a process pool started by start(), falling back to the original bytes"""
+
+    def __init__(self, enabled: bool, max_edge: int, image_format: str, quality: int, workers: int):
+        self.enabled = enabled
+        self.max_edge = max_edge
+        self.image_format = image_format
+        self.quality = quality
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.images = 0
+        self.failures = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_ms = 0.0
+
+    def start(self):
+        """
+        Fork the worker processes. Call it while the process has only one thread:
+        a child forked from a threaded process inherits every lock some other
+        thread held at that moment, still held, and can hang on it.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pool is not None:
+                return
+            # fork, not spawn or forkserver: those workers re-import the main
+            # module, which for `python -m app` is the whole API
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('fork')
+            )
+        # The workers are forked on the first submit
+        self._pool.submit(int).result()
+
+    async def prepare(self, data: bytes) -> PreparedImage:
+        """Prepared image for the model calls; the original bytes if disabled, not running or undecodable"""
+        if not self.enabled:
+            return PreparedImage(data, 'jpeg', 0, 0, len(data))
+        pool = self._pool
+        if pool is None:
+            # Not started, or the workers died; forking a new pool now that the
+            # server runs threads isn't safe, so images go as they are until a restart
+            with self._lock:
+                self.skipped += 1
+            return PreparedImage(data, 'jpeg', 0, 0, len(data))
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            prepared = await loop.run_in_executor(
+                pool, prepare_image, data, self.max_edge, self.image_format, self.quality
+            )
+        except Exception as e:
+            logger.warning(f"Image preprocessing failed, sending the original ({len(data)} bytes): {e}")
+            if isinstance(e, BrokenProcessPool):
+                logger.error("An image preprocessing worker died; sending original images until the next restart")
+                self.close()
+            with self._lock:
+                self.failures += 1
+            return PreparedImage(data, 'jpeg', 0, 0, len(data))
+
+        with self._lock:
+            self.images += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(prepared.data)
+            self.total_ms += (time.perf_counter() - started) * 1000
+        return prepared
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'running': self._pool is not None,
+                'images': self.images,
+                'failures': self.failures,
+                'skipped': self.skipped,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'size_ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+                'avg_ms': round(self.total_ms / self.images, 2) if self.images else None,
+                'max_edge': self.max_edge,
+                'format': self.image_format,
+                'quality': self.quality,
+                'workers': self.workers
+            }
+
+
+image_preprocessor = ImagePreprocessor(
+    IMAGE_PREPROCESS_ENABLED,
+    IMAGE_MAX_EDGE,
+    IMAGE_OUTPUT_FORMAT,
+    IMAGE_OUTPUT_QUALITY,
+    IMAGE_PREPROCESS_WORKERS
+)
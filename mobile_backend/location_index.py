@@ -0,0 +1,115 @@
+# In-memory nearest-location index for EcoLafaek API
+# The locations table is small and rarely changes, so it is held in a
+# NearestPointIndex and reloaded in the background when its contents change or
+# the TTL expires. Report submission resolves location_id without a DB round trip.
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from db import db_session
+from geo import NearestPointIndex
+
+logger = logging.getLogger(__name__)
+
+LOCATION_INDEX_TTL_SECONDS = float(os.getenv('LOCATION_INDEX_TTL_SECONDS', '3600'))
+LOCATION_INDEX_CHECK_SECONDS = float(os.getenv('LOCATION_INDEX_CHECK_SECONDS', '60'))
+
+
+class LocationIndex:
+    """Nearest-location lookups over an in-memory copy of the locations table"""
+
+    def __init__(self, ttl_seconds: float, check_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.check_seconds = check_seconds
+        self._index: Optional[NearestPointIndex] = None
+        self._fingerprint = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.loads = 0
+        self.lookups = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    @staticmethod
+    def _read_fingerprint(cursor):
+        # Changes to any id or coordinate change the checksum
+        cursor.execute(
+            """
+            SELECT COUNT(*), MAX(location_id),
+                   BIT_XOR(CRC32(CONCAT_WS(',', location_id, latitude, longitude)))
+            FROM locations
+            """
+        )
+        row = cursor.fetchone()
+        return tuple(row) if row else None
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload the index if the table changed or the TTL expired, returning whether it reloaded"""
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at >= self.ttl_seconds
+            with db_session(dictionary=False, read_only=True, label='location index refresh') as (connection, cursor):
+                fingerprint = self._read_fingerprint(cursor)
+                if not (force or expired or fingerprint != self._fingerprint):
+                    return False
+
+                cursor.execute(
+                    """
+                    SELECT location_id, latitude, longitude
+                    FROM locations
+                    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                    """
+                )
+                rows = cursor.fetchall()
+
+            self._index = NearestPointIndex(
+                [row[0] for row in rows],
+                [float(row[1]) for row in rows],
+                [float(row[2]) for row in rows]
+            )
+            self._fingerprint = fingerprint
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+            logger.info(f"Loaded {len(rows)} locations into the nearest-location index")
+            return True
+
+    def nearest(self, lat: float, lon: float, max_km: float) -> Optional[int]:
+        """location_id of the closest location within max_km, or None (requires ready)"""
+        index = self._index
+        if index is None:
+            raise RuntimeError("Location index has not been loaded")
+        self.lookups += 1
+        match = index.nearest(lat, lon, max_km)
+        return match[0] if match else None
+
+    def _watch(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Location index refresh failed: {e}")
+            time.sleep(self.check_seconds)
+
+    def start(self):
+        """Load the index and keep it current from a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name='location-index', daemon=True)
+            self._thread.start()
+
+    def stats(self) -> Dict[str, Any]:
+        index = self._index
+        return {
+            'ready': index is not None,
+            'locations': len(index) if index is not None else 0,
+            'loads': self.loads,
+            'lookups': self.lookups,
+            'age_seconds': round(time.monotonic() - self._loaded_at, 1) if index is not None else None
+        }
+
+
+location_index = LocationIndex(LOCATION_INDEX_TTL_SECONDS, LOCATION_INDEX_CHECK_SECONDS)
@@ -0,0 +1,214 @@
+# Viewport map clustering for EcoLafaek API
+# Reports are aggregated on the geohash grid, with a cell size that follows the
+# map zoom (about a quarter of a map tile). Coarse grids cover the whole table
+# and are cached per precision, so country-wide views never touch the database
+# while the cache is warm. Fine grids are aggregated live for the viewport only,
+# and at street zoom individual reports are returned instead of clusters.
+
+import os
+import time
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import db_session
+from geo import geohash_bounds
+
+logger = logging.getLogger(__name__)
+
+MAP_CLUSTER_CACHE_TTL_SECONDS = float(os.getenv('MAP_CLUSTER_CACHE_TTL_SECONDS', '60'))
+MAP_CLUSTER_CACHE_MAX_PRECISION = int(os.getenv('MAP_CLUSTER_CACHE_MAX_PRECISION', '6'))
+MAP_POINTS_MIN_ZOOM = int(os.getenv('MAP_POINTS_MIN_ZOOM', '16'))
+MAP_MAX_POINTS = int(os.getenv('MAP_MAX_POINTS', '2000'))
+MAP_MAX_HOTSPOTS = int(os.getenv('MAP_MAX_HOTSPOTS', '500'))
+
+
+class Viewport:
+    """Map bounds in degrees (west-to-east, no antimeridian crossing)"""
+
+    def __init__(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+        if not (-90 <= min_lat < max_lat <= 90 and -180 <= min_lon < max_lon <= 180):
+            raise ValueError("Viewport needs min_lat < max_lat within [-90, 90] and min_lon < max_lon within [-180, 180]")
+        self.min_lat = min_lat
+        self.min_lon = min_lon
+        self.max_lat = max_lat
+        self.max_lon = max_lon
+
+    def contains(self, lat: float, lon: float) -> bool:
+        return self.min_lat <= lat <= self.max_lat and self.min_lon <= lon <= self.max_lon
+
+    def box_sql(self, lat_column: str, lon_column: str) -> Tuple[str, tuple]:
+        """BETWEEN filter for the (latitude, longitude) index, with its parameters"""
+        return (
+            f"{lat_column} BETWEEN %s AND %s AND {lon_column} BETWEEN %s AND %s",
+            (self.min_lat, self.max_lat, self.min_lon, self.max_lon)
+        )
+
+
+def precision_for_zoom(zoom: int) -> int:
+    """Geohash precision whose cells are roughly a quarter of a web map tile at zoom"""
+    # A tile spans 360 / 2^zoom degrees of longitude and a precision p cell
+    # 360 / 2^ceil(5p / 2), so a quarter tile is ceil(5p / 2) = zoom + 2
+    return max(1, min(8, round((zoom + 2) * 2 / 5)))
+
+
+def _aggregate(cursor, precision: int, viewport: Optional[Viewport] = None) -> List[Dict[str, Any]]:
+    """Report clusters for every geohash cell of the given precision (optionally inside a viewport)"""
+    # Each report once, with its latest analysis; a re-analyzed report has several
+    where = ("r.geohash IS NOT NULL AND NOT EXISTS (SELECT 1 FROM analysis_results newer "
+             "WHERE newer.report_id = r.report_id AND newer.analysis_id > a.analysis_id)")
+    params: tuple = (precision,)
+    if viewport is not None:
+        box_sql, box_params = viewport.box_sql('r.latitude', 'r.longitude')
+        where += f" AND {box_sql}"
+        params += box_params
+
+    cursor.execute(
+        f"""
+        SELECT LEFT(r.geohash, %s) AS cell, w.name AS waste_type, COUNT(*) AS count,
+               SUM(r.latitude) AS sum_latitude, SUM(r.longitude) AS sum_longitude
+        FROM reports r
+        LEFT JOIN analysis_results a ON r.report_id = a.report_id
+        LEFT JOIN waste_types w ON a.waste_type_id = w.waste_type_id
+        WHERE {where}
+        GROUP BY cell, waste_type
+        """,
+        params
+    )
+
+    cells: Dict[str, Dict[str, Any]] = defaultdict(lambda: {'count': 0, 'sum_lat': 0.0, 'sum_lon': 0.0, 'types': {}})
+    for row in cursor.fetchall():
+        cell = cells[row['cell']]
+        cell['count'] += row['count']
+        cell['sum_lat'] += float(row['sum_latitude'])
+        cell['sum_lon'] += float(row['sum_longitude'])
+        if row['waste_type']:
+            cell['types'][row['waste_type']] = row['count']
+
+    clusters = []
+    for cell_id, cell in cells.items():
+        min_lat, max_lat, min_lon, max_lon = geohash_bounds(cell_id)
+        dominant = max(cell['types'].items(), key=lambda item: item[1]) if cell['types'] else (None, 0)
+        clusters.append({
+            'cell': cell_id,
+            'count': cell['count'],
+            'latitude': round(cell['sum_lat'] / cell['count'], 6),
+            'longitude': round(cell['sum_lon'] / cell['count'], 6),
+            'dominant_waste_type': dominant[0],
+            'dominant_waste_type_count': dominant[1],
+            'bounds': [min_lat, min_lon, max_lat, max_lon]
+        })
+    return clusters
+
+
+class GridClusterCache:
+    """Whole-table cluster grids per geohash precision, rebuilt after a TTL"""
+
+    def __init__(self, ttl_seconds: float, max_precision: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_precision = max_precision
+        self._grids: Dict[int, Tuple[float, List[Dict[str, Any]]]] = {}
+        self._locks: Dict[int, threading.Lock] = defaultdict(threading.Lock)
+        self.hits = 0
+        self.misses = 0
+
+    def clusters(self, cursor, precision: int) -> List[Dict[str, Any]]:
+        grid = self._grids.get(precision)
+        if grid and time.monotonic() - grid[0] < self.ttl_seconds:
+            self.hits += 1
+            return grid[1]
+
+        # One request rebuilds a grid; concurrent ones wait for it
+        with self._locks[precision]:
+            grid = self._grids.get(precision)
+            if grid and time.monotonic() - grid[0] < self.ttl_seconds:
+                self.hits += 1
+                return grid[1]
+            self.misses += 1
+            started = time.perf_counter()
+            clusters = _aggregate(cursor, precision)
+            self._grids[precision] = (time.monotonic(), clusters)
+            logger.info(f"Built map grid at precision {precision}: {len(clusters)} cells "
+                        f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+            return clusters
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'grids': {precision: len(grid[1]) for precision, grid in self._grids.items()}
+        }
+
+
+grid_cache = GridClusterCache(MAP_CLUSTER_CACHE_TTL_SECONDS, MAP_CLUSTER_CACHE_MAX_PRECISION)
+
+
+def fetch_map_view(viewport: Viewport, zoom: int) -> Dict[str, Any]:
+    """Clusters (or individual reports at high zoom) and hotspots inside a viewport"""
+    with db_session(read_only=True, stale_ok=True) as (connection, cursor):
+        if zoom >= MAP_POINTS_MIN_ZOOM:
+            box_sql, box_params = viewport.box_sql('r.latitude', 'r.longitude')
+            cursor.execute(
+                f"""
+                SELECT r.report_id, r.latitude, r.longitude, r.status, r.report_date,
+                       a.severity_score, w.name AS waste_type
+                FROM reports r
+                LEFT JOIN analysis_results a ON r.report_id = a.report_id
+                LEFT JOIN waste_types w ON a.waste_type_id = w.waste_type_id
+                WHERE {box_sql}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM analysis_results newer
+                      WHERE newer.report_id = r.report_id AND newer.analysis_id > a.analysis_id
+                  )
+                LIMIT %s
+                """,
+                box_params + (MAP_MAX_POINTS + 1,)
+            )
+            points = cursor.fetchall()
+            result = {
+                'mode': 'points',
+                'points': points[:MAP_MAX_POINTS],
+                'truncated': len(points) > MAP_MAX_POINTS
+            }
+            for point in result['points']:
+                point['latitude'] = float(point['latitude'])
+                point['longitude'] = float(point['longitude'])
+                if point['report_date']:
+                    point['report_date'] = point['report_date'].strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            precision = precision_for_zoom(zoom)
+            if precision <= grid_cache.max_precision:
+                clusters = [
+                    cluster for cluster in grid_cache.clusters(cursor, precision)
+                    if viewport.contains(cluster['latitude'], cluster['longitude'])
+                ]
+            else:
+                clusters = _aggregate(cursor, precision, viewport)
+            result = {
+                'mode': 'clusters',
+                'precision': precision,
+                'clusters': clusters,
+                'total_reports': sum(cluster['count'] for cluster in clusters)
+            }
+
+        box_sql, box_params = viewport.box_sql('center_latitude', 'center_longitude')
+        cursor.execute(
+            f"""
+            SELECT hotspot_id, name, center_latitude, center_longitude, radius_meters,
+                   total_reports, average_severity, status
+            FROM hotspots
+            WHERE {box_sql}
+            ORDER BY total_reports DESC
+            LIMIT %s
+            """,
+            box_params + (MAP_MAX_HOTSPOTS,)
+        )
+        hotspots = cursor.fetchall()
+        for hotspot in hotspots:
+            hotspot['center_latitude'] = float(hotspot['center_latitude'])
+            hotspot['center_longitude'] = float(hotspot['center_longitude'])
+            if hotspot['average_severity'] is not None:
+                hotspot['average_severity'] = float(hotspot['average_severity'])
+        result['hotspots'] = hotspots
+        return result
@@ -0,0 +1,447 @@
+# Offline hotspot re-clustering for EcoLafaek API
+# Rebuilds hotspots from scratch: loads every analyzed report into NumPy arrays,
+# clusters them in bulk with the same DBSCAN rules as the API's incremental
+# engine, and diffs the result against the hotspots and hotspot_reports tables.
+# Dry run by default; --apply writes the diff. --synthetic N clusters N generated
+# reports instead of the database (timing, and --verify against the engine).
+
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from hotspot_engine import (
+    DensityClusters, HOTSPOT_MIN_REPORTS, HOTSPOT_RADIUS_KM, cluster_points
+)
+from geo import geohash_encode, haversine_km_array
+
+# Timor-Leste, where real reports are clustered
+LAT_RANGE = (-9.50, -8.10)
+LON_RANGE = (124.00, 127.35)
+
+# Rows per statement when applying the diff
+APPLY_BATCH = 1000
+
+
+class Reports:
+    """Analyzed reports as parallel arrays, sorted by report_id"""
+
+    def __init__(self, report_ids, lats, lons, severities, waste_type_ids, report_dates):
+        self.report_ids = np.asarray(report_ids, dtype=np.int64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        # NaN where the report has no severity, -1 where it has no waste type
+        self.severities = np.asarray(severities, dtype=np.float64)
+        self.waste_type_ids = np.asarray(waste_type_ids, dtype=np.int64)
+        self.report_dates = np.asarray(report_dates, dtype='datetime64[D]')
+
+    def __len__(self) -> int:
+        return len(self.report_ids)
+
+
+def load_reports(cursor) -> Reports:
+    cursor.execute(
+        """
+        SELECT r.report_id, r.latitude, r.longitude, a.severity_score, a.waste_type_id, DATE(r.report_date)
+        FROM reports r
+        LEFT JOIN (
+            SELECT report_id, MAX(analysis_id) AS analysis_id
+            FROM analysis_results
+            GROUP BY report_id
+        ) latest ON latest.report_id = r.report_id
+        LEFT JOIN analysis_results a ON a.analysis_id = latest.analysis_id
+        WHERE r.status = 'analyzed'
+        ORDER BY r.report_id
+        """
+    )
+    columns = [[], [], [], [], [], []]
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        for row in rows:
+            columns[0].append(row[0])
+            columns[1].append(float(row[1]))
+            columns[2].append(float(row[2]))
+            columns[3].append(float(row[3]) if row[3] is not None else np.nan)
+            columns[4].append(row[4] if row[4] is not None else -1)
+            columns[5].append(row[5])
+
+    return Reports(*columns)
+
+
+def synthetic_reports(count: int, seed: int) -> Reports:
+    """Reports in a few thousand dense blobs over Timor-Leste, plus 30% scattered noise"""
+    rng = np.random.default_rng(seed)
+    blobs = max(1, count // 500)
+    blob_lats = rng.uniform(*LAT_RANGE, blobs)
+    blob_lons = rng.uniform(*LON_RANGE, blobs)
+    blob_spread = rng.uniform(0.002, 0.02, blobs)
+
+    clustered = int(count * 0.7)
+    blob = rng.integers(0, blobs, clustered)
+    lats = np.concatenate([blob_lats[blob] + rng.normal(0, 1, clustered) * blob_spread[blob],
+                           rng.uniform(*LAT_RANGE, count - clustered)])
+    lons = np.concatenate([blob_lons[blob] + rng.normal(0, 1, clustered) * blob_spread[blob],
+                           rng.uniform(*LON_RANGE, count - clustered)])
+    severities = rng.integers(1, 11, count).astype(np.float64)
+    waste_type_ids = rng.integers(1, 9, count)
+    report_dates = np.datetime64('2024-01-01') + rng.integers(0, 700, count)
+    return Reports(np.arange(1, count + 1), lats, lons, severities, waste_type_ids, report_dates)
+
+
+def cluster_summaries(reports: Reports, labels: np.ndarray, radius_km: float) -> Dict[str, Any]:
+    """Per-cluster aggregates, indexed by cluster label"""
+    clusters = int(labels.max()) + 1 if len(labels) else 0
+    member = labels >= 0
+    label = labels[member]
+    lats, lons = reports.lats[member], reports.lons[member]
+
+    sizes = np.bincount(label, minlength=clusters)
+    center_lats = np.bincount(label, weights=lats, minlength=clusters) / np.maximum(sizes, 1)
+    center_lons = np.bincount(label, weights=lons, minlength=clusters) / np.maximum(sizes, 1)
+
+    # Radius: the member furthest from the centroid, never less than the clustering radius
+    distances = haversine_km_array(center_lats[label], center_lons[label], lats, lons)
+    radius_km_per_cluster = np.full(clusters, radius_km)
+    np.maximum.at(radius_km_per_cluster, label, distances)
+
+    severities = reports.severities[member]
+    rated = ~np.isnan(severities)
+    severity_sums = np.bincount(label[rated], weights=severities[rated], minlength=clusters)
+    severity_counts = np.bincount(label[rated], minlength=clusters)
+
+    report_dates = reports.report_dates[member].astype(np.int64)
+    first_reported = np.full(clusters, np.iinfo(np.int64).max)
+    last_reported = np.full(clusters, np.iinfo(np.int64).min)
+    np.minimum.at(first_reported, label, report_dates)
+    np.maximum.at(last_reported, label, report_dates)
+
+    # Waste type histogram as (cluster, waste type id, count) triples
+    waste_type_ids = reports.waste_type_ids[member]
+    typed = waste_type_ids >= 0
+    type_base = int(waste_type_ids.max(initial=0)) + 1
+    pair_keys, pair_counts = np.unique(label[typed] * type_base + waste_type_ids[typed], return_counts=True)
+
+    return {
+        'sizes': sizes,
+        'center_lats': center_lats,
+        'center_lons': center_lons,
+        'radius_meters': np.ceil(radius_km_per_cluster * 1000).astype(np.int64),
+        'severity_sums': severity_sums,
+        'severity_counts': severity_counts,
+        'first_reported': first_reported.astype('datetime64[D]'),
+        'last_reported': last_reported.astype('datetime64[D]'),
+        'waste_types': (pair_keys // type_base, pair_keys % type_base, pair_counts),
+        # Lowest report_id of each cluster, used to name new hotspots
+        'first_report': reports.report_ids[member][np.unique(label, return_index=True)[1]],
+    }
+
+
+def match_hotspots(reports: Reports, labels: np.ndarray, link_hotspots: np.ndarray,
+                   link_reports: np.ndarray, clusters: int) -> np.ndarray:
+    """
+    Existing hotspot_id for each cluster (0 for a new one): clusters claim the
+    hotspot most of their reports are linked to, biggest overlaps first
+    """
+    cluster_hotspot = np.zeros(clusters, dtype=np.int64)
+    if not len(link_reports) or not clusters:
+        return cluster_hotspot
+
+    position = np.minimum(np.searchsorted(reports.report_ids, link_reports), len(reports) - 1)
+    link_labels = np.where(reports.report_ids[position] == link_reports, labels[position], -1)
+    clustered = link_labels >= 0
+    hotspot_base = int(link_hotspots.max()) + 1
+    pair_keys, overlaps = np.unique(link_labels[clustered] * hotspot_base + link_hotspots[clustered],
+                                    return_counts=True)
+    claimed = set()
+    for index in np.argsort(-overlaps, kind='stable'):
+        label, hotspot_id = divmod(int(pair_keys[index]), hotspot_base)
+        if cluster_hotspot[label] == 0 and hotspot_id not in claimed:
+            cluster_hotspot[label] = hotspot_id
+            claimed.add(hotspot_id)
+    return cluster_hotspot
+
+
+def build_diff(reports: Reports, labels: np.ndarray, summaries: Dict[str, Any],
+               hotspots: Dict[int, Dict[str, Any]], links: np.ndarray) -> Dict[str, Any]:
+    """
+    Changes that turn the current tables into the clustering: hotspots to
+    create, update and delete, and hotspot_reports rows to add and remove.
+    links holds (id, hotspot_id, report_id) rows.
+    """
+    clusters = len(summaries['sizes'])
+    link_ids, link_hotspots, link_reports = links[:, 0], links[:, 1], links[:, 2]
+    cluster_hotspot = match_hotspots(reports, labels, link_hotspots, link_reports, clusters)
+
+    # Wanted links of matched clusters, compared with the existing ones by (hotspot, report) key
+    member = labels >= 0
+    wanted_hotspots = cluster_hotspot[labels[member]]
+    wanted_reports = reports.report_ids[member]
+    key_base = int(max(reports.report_ids.max(initial=0), link_reports.max(initial=0))) + 1
+    existing_keys = link_hotspots * key_base + link_reports
+    matched = wanted_hotspots > 0
+    wanted_keys = wanted_hotspots[matched] * key_base + wanted_reports[matched]
+
+    remove_links = link_ids[~np.isin(existing_keys, wanted_keys)]
+    add_mask = ~np.isin(wanted_keys, existing_keys)
+    add_links = np.stack([wanted_hotspots[matched][add_mask], wanted_reports[matched][add_mask]], axis=1)
+
+    histogram_labels, histogram_types, histogram_counts = summaries['waste_types']
+    histograms: List[Dict[int, int]] = [{} for _ in range(clusters)]
+    for label, waste_type_id, count in zip(histogram_labels.tolist(), histogram_types.tolist(),
+                                           histogram_counts.tolist()):
+        histograms[label][waste_type_id] = count
+
+    # Report ids of each cluster, for the links of new hotspots
+    by_label = np.argsort(labels[member], kind='stable')
+    cluster_reports = np.split(wanted_reports[by_label], np.cumsum(summaries['sizes'])[:-1])
+
+    created, updated = [], []
+    for label in range(clusters):
+        severity_count = int(summaries['severity_counts'][label])
+        severity_sum = round(float(summaries['severity_sums'][label]), 2)
+        center_lat = round(float(summaries['center_lats'][label]), 8)
+        center_lon = round(float(summaries['center_lons'][label]), 8)
+        row = {
+            'center_latitude': center_lat,
+            'center_longitude': center_lon,
+            'geohash': geohash_encode(center_lat, center_lon),
+            'radius_meters': int(summaries['radius_meters'][label]),
+            'first_reported': str(summaries['first_reported'][label]),
+            'last_reported': str(summaries['last_reported'][label]),
+            'total_reports': int(summaries['sizes'][label]),
+            'average_severity': round(severity_sum / severity_count, 2) if severity_count else None,
+            'severity_sum': severity_sum,
+            'severity_count': severity_count,
+            'waste_type_ids': histograms[label],
+        }
+        hotspot_id = int(cluster_hotspot[label])
+        if hotspot_id:
+            before = hotspots.get(hotspot_id, {})
+            row['hotspot_id'] = hotspot_id
+            row['previous_total_reports'] = before.get('total_reports')
+            updated.append(row)
+        else:
+            row['first_report_id'] = int(summaries['first_report'][label])
+            row['report_ids'] = cluster_reports[label].tolist()
+            created.append(row)
+
+    kept = set(cluster_hotspot[cluster_hotspot > 0].tolist())
+    return {
+        'created': created,
+        'updated': updated,
+        'deleted': sorted(hotspot_id for hotspot_id in hotspots if hotspot_id not in kept),
+        'add_links': add_links,
+        'remove_links': remove_links,
+    }
+
+
+def load_current(cursor):
+    cursor.execute("SELECT hotspot_id, total_reports FROM hotspots")
+    hotspots = {row[0]: {'total_reports': row[1]} for row in cursor.fetchall()}
+    cursor.execute("SELECT id, hotspot_id, report_id FROM hotspot_reports")
+    links = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3)
+    cursor.execute("SELECT waste_type_id, name FROM waste_types")
+    waste_types = dict(cursor.fetchall())
+    return hotspots, links, waste_types
+
+
+def _batches(values, size: int = APPLY_BATCH):
+    for offset in range(0, len(values), size):
+        yield values[offset:offset + size]
+
+
+def _hotspot_values(row: Dict[str, Any], waste_types: Dict[int, str]) -> tuple:
+    waste_type_counts = {waste_types.get(waste_type_id, str(waste_type_id)): count
+                         for waste_type_id, count in row['waste_type_ids'].items()}
+    return (
+        row['center_latitude'], row['center_longitude'], row['geohash'], row['radius_meters'],
+        row['first_reported'], row['last_reported'], row['total_reports'], row['average_severity'],
+        row['severity_sum'], row['severity_count'], json.dumps(waste_type_counts)
+    )
+
+
+def apply_diff(connection, diff: Dict[str, Any], waste_types: Dict[int, str]):
+    """Write the diff in batches, committing after each step"""
+    cursor = connection.cursor()
+    try:
+        for batch in _batches(diff['remove_links'].tolist()):
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"DELETE FROM hotspot_reports WHERE id IN ({placeholders})", batch)
+        connection.commit()
+        print(f"  removed {len(diff['remove_links']):,} links")
+
+        for batch in _batches(diff['deleted']):
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"DELETE FROM hotspot_reports WHERE hotspot_id IN ({placeholders})", batch)
+            cursor.execute(f"DELETE FROM hotspots WHERE hotspot_id IN ({placeholders})", batch)
+        connection.commit()
+        print(f"  deleted {len(diff['deleted']):,} hotspots")
+
+        for batch in _batches(diff['updated']):
+            cursor.executemany(
+                """
+                UPDATE hotspots
+                SET center_latitude = %s, center_longitude = %s, geohash = %s, radius_meters = %s,
+                    first_reported = %s, last_reported = %s, total_reports = %s, average_severity = %s,
+                    severity_sum = %s, severity_count = %s, waste_type_counts = %s
+                WHERE hotspot_id = %s
+                """,
+                [_hotspot_values(row, waste_types) + (row['hotspot_id'],) for row in batch]
+            )
+            connection.commit()
+        print(f"  updated {len(diff['updated']):,} hotspots")
+
+        add_links = diff['add_links'].tolist()
+        for batch in _batches(diff['created']):
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                f"SELECT report_id, address_text, location_id FROM reports WHERE report_id IN ({placeholders})",
+                [row['first_report_id'] for row in batch]
+            )
+            first_reports = {row[0]: row[1:] for row in cursor.fetchall()}
+            for row in batch:
+                address_text, location_id = first_reports.get(row['first_report_id'], (None, None))
+                cursor.execute(
+                    """
+                    INSERT INTO hotspots (
+                        name, center_latitude, center_longitude, geohash, radius_meters,
+                        first_reported, last_reported, total_reports, average_severity,
+                        severity_sum, severity_count, waste_type_counts, location_id, status
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    (f"Hotspot near {address_text or 'Unknown'}",)
+                    + _hotspot_values(row, waste_types) + (location_id, 'active')
+                )
+                add_links.extend([cursor.lastrowid, report_id] for report_id in row['report_ids'])
+            connection.commit()
+        print(f"  created {len(diff['created']):,} hotspots")
+
+        for batch in _batches(add_links):
+            placeholders = ", ".join(["(%s, %s)"] * len(batch))
+            cursor.execute(
+                f"INSERT IGNORE INTO hotspot_reports (hotspot_id, report_id) VALUES {placeholders}",
+                [value for pair in batch for value in pair]
+            )
+            connection.commit()
+        print(f"  added {len(add_links):,} links")
+    finally:
+        cursor.close()
+
+
+def print_diff(diff: Dict[str, Any]):
+    changed = sum(1 for row in diff['updated'] if row['previous_total_reports'] != row['total_reports'])
+    print(f"Hotspots: {len(diff['created']):,} to create, {len(diff['updated']):,} kept "
+          f"({changed:,} with a new report count), {len(diff['deleted']):,} to delete")
+    print(f"Links: {len(diff['add_links']):,} to add (plus those of new hotspots), "
+          f"{len(diff['remove_links']):,} to remove")
+
+
+def write_diff(path: str, diff: Dict[str, Any]):
+    with open(path, 'w') as f:
+        json.dump({
+            'created': [
+                dict({key: value for key, value in row.items() if key != 'report_ids'},
+                     reports=len(row['report_ids']))
+                for row in diff['created']
+            ],
+            'updated': diff['updated'],
+            'deleted': diff['deleted'],
+            'add_links': diff['add_links'].tolist(),
+            'remove_links': diff['remove_links'].tolist(),
+        }, f, indent=1)
+    print(f"Diff written to {path}")
+
+
+def verify(reports: Reports, labels: np.ndarray, core: np.ndarray, radius_km: float, min_points: int) -> bool:
+    """Compare the bulk clustering with the incremental engine on the same points"""
+    engine = DensityClusters(radius_km, min_points)
+    for index in range(len(reports)):
+        engine.add(index, float(reports.lats[index]), float(reports.lons[index]))
+    engine_core = np.array([engine.is_core(index) for index in range(len(reports))], dtype=bool)
+    if not np.array_equal(core, engine_core):
+        return False
+    # Core points must be grouped identically; border points may join either neighbouring cluster
+    pairs = {(int(labels[index]), engine.cluster_of(index)) for index in np.flatnonzero(core)}
+    clustered = sum(1 for index in range(len(reports)) if engine.cluster_of(index) is not None)
+    return (len(pairs) == len({label for label, _ in pairs}) == len({root for _, root in pairs})
+            and clustered == int((labels >= 0).sum()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild hotspots from all analyzed reports")
+    parser.add_argument('--radius-km', type=float, default=HOTSPOT_RADIUS_KM, help='Clustering radius')
+    parser.add_argument('--min-reports', type=int, default=HOTSPOT_MIN_REPORTS,
+                        help='Reports within the radius (itself included) that make a core report')
+    parser.add_argument('--apply', action='store_true', help='Write the changes (default is a dry run)')
+    parser.add_argument('--output', help='Write the full diff as JSON to this file')
+    parser.add_argument('--synthetic', type=int, help='Cluster this many generated reports instead of the database')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for --synthetic')
+    parser.add_argument('--verify', action='store_true',
+                        help='With --synthetic, check the result against the incremental engine (small N)')
+    args = parser.parse_args()
+
+    connection = None
+    if args.synthetic:
+        reports = synthetic_reports(args.synthetic, args.seed)
+        print(f"Generated {len(reports):,} synthetic reports")
+    else:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+
+        import mysql.connector
+        from db import DB_CONFIG
+
+        print(f"Target: {DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}")
+        connection = mysql.connector.connect(**DB_CONFIG)
+        started = time.perf_counter()
+        cursor = connection.cursor()
+        reports = load_reports(cursor)
+        hotspots, links, waste_types = load_current(cursor)
+        cursor.close()
+        print(f"Loaded {len(reports):,} analyzed reports, {len(hotspots):,} hotspots and "
+              f"{len(links):,} links in {time.perf_counter() - started:.1f}s")
+
+    try:
+        started = time.perf_counter()
+        labels, core = cluster_points(reports.lats, reports.lons, args.radius_km, args.min_reports)
+        clusters = int(labels.max()) + 1 if len(labels) else 0
+        print(f"Clustered in {time.perf_counter() - started:.2f}s: {clusters:,} hotspots, "
+              f"{int(core.sum()):,} core and {int((labels >= 0).sum() - core.sum()):,} border reports, "
+              f"{int((labels < 0).sum()):,} unclustered")
+
+        if args.synthetic:
+            if args.verify:
+                ok = verify(reports, labels, core, args.radius_km, args.min_reports)
+                print(f"Incremental engine comparison: {'ok' if ok else 'FAILED'}")
+                if not ok:
+                    sys.exit(1)
+            return
+
+        started = time.perf_counter()
+        summaries = cluster_summaries(reports, labels, args.radius_km)
+        diff = build_diff(reports, labels, summaries, hotspots, links)
+        print(f"Diff computed in {time.perf_counter() - started:.2f}s")
+        print_diff(diff)
+        if args.output:
+            write_diff(args.output, diff)
+
+        if args.apply:
+            started = time.perf_counter()
+            apply_diff(connection, diff, waste_types)
+            print(f"Applied in {time.perf_counter() - started:.1f}s. Running API servers pick the new "
+                  f"hotspots up when their hotspot engine reloads (HOTSPOT_ENGINE_TTL_SECONDS)")
+        else:
+            print("Dry run, nothing written (use --apply)")
+    finally:
+        if connection is not None:
+            connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,7 @@ DATABASE SCHEMA (Read-Only Access):
 - user_id (INT): User who submitted the report
 - latitude (DECIMAL): Report location latitude
 - longitude (DECIMAL): Report location longitude
+- geohash (VARCHAR): Geohash cell of the location, indexed. Prefixes are coarser areas: LEFT(geohash, 5) ~ 5 km, LEFT(geohash, 6) ~ 1 km
 - report_date (DATETIME): When report was submitted
 - description (TEXT): Report description
 - status (ENUM): submitted, analyzing, analyzed, resolved, rejected
@@ -29,8 +30,10 @@ DATABASE SCHEMA (Read-Only Access):
 - name (VARCHAR): Hotspot name
 - center_latitude (DECIMAL): Center point latitude
 - center_longitude (DECIMAL): Center point longitude
+- geohash (VARCHAR): Geohash cell of the center point (same format as reports.geohash)
 - total_reports (INT): Number of reports in hotspot
 - average_severity (DECIMAL): Average severity score
+- waste_type_counts (JSON): Reports per waste type name, e.g. {"Plastic": 12, "Organic": 3}
 - status (ENUM): active, monitoring, resolved
 - first_reported (DATE): First report date
 - last_reported (DATE): Most recent report date
@@ -71,13 +74,14 @@ FROM hotspots h
 LEFT JOIN hotspot_reports hr ON h.hotspot_id = hr.hotspot_id
 GROUP BY h.hotspot_id
 
--- Count reports by area/location (use address_text):
+-- Count reports by area (~5 km geohash cells; MAX(address_text) names each area):
 SELECT
-  SUBSTRING_INDEX(address_text, ',', 1) as area,
+  LEFT(geohash, 5) as area_cell,
+  MAX(address_text) as example_address,
   COUNT(*) as report_count
 FROM reports
-WHERE address_text IS NOT NULL
-GROUP BY area
+WHERE geohash IS NOT NULL
+GROUP BY area_cell
 ORDER BY report_count DESC
 LIMIT 10
 
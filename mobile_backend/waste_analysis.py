@@ -0,0 +1,351 @@
+# Waste image analysis with Amazon Nova for EcoLafaek API
+# Two modes:
+#   two_pass     a detection prompt, then (for waste) a separate detail prompt;
+#                two invoke_model calls that each upload the image
+#   single_pass  one prompt that returns detection and detail fields in a single
+#                JSON answer; one call per image
+# Both return the same analysis dict, so the rest of the pipeline doesn't care
+# which one ran. benchmark_waste_analysis.py compares them on a labelled set.
+
+import os
+import json
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WASTE_ANALYSIS_MODES = ('two_pass', 'single_pass')
+WASTE_ANALYSIS_MODE = os.getenv('WASTE_ANALYSIS_MODE', 'two_pass')
+if WASTE_ANALYSIS_MODE not in WASTE_ANALYSIS_MODES:
+    logger.warning(f"Unknown WASTE_ANALYSIS_MODE '{WASTE_ANALYSIS_MODE}', using two_pass")
+    WASTE_ANALYSIS_MODE = 'two_pass'
+
+
+class AnalysisFailed(Exception):
+    """The model returned no usable answer"""
+
+
+class ModelUsage:
+    """Calls, tokens and time spent in invoke_model for one analysis"""
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latency_ms = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'latency_ms': round(self.latency_ms, 1)
+        }
+
+
+DETECTION_CRITERIA = """
+        Only classify as waste/garbage if:
+        1. The items are clearly disposed of improperly in an outdoor environment (on streets, in water bodies, forests, etc.)
+        2. The items are trash/waste accumulated in trash cans, landfills, or garbage dumps
+        3. The items are clearly abandoned, broken, or dumped illegally
+
+        Do NOT classify as waste/garbage if:
+        1. The items are in normal use in their intended environment (e.g., electronics on a desk)
+        2. The items appear to be organized, clean, and in use
+        3. The items are products being displayed or used normally
+        4. The image shows an indoor setting with normal household/office items
+        5. The items are properly stored or displayed
+"""
+
+SEVERITY_FACTORS = """
+        Consider these factors for severity and priority:
+        - Quantity/volume of waste
+        - Hazard level of materials
+        - Proximity to water sources or sensitive areas
+        - Access to residential areas
+        - Biodegradability and longevity of waste
+"""
+
+
+def detection_prompt(location: Dict[str, Any], description: str) -> str:
+    return f"""
+        Carefully examine this image and determine if it shows improper waste disposal, garbage, trash, or discarded materials in the environment.
+
+        Location: Latitude {location.get('lat')}, Longitude {location.get('lng')}
+        User Description: {description}
+{DETECTION_CRITERIA}
+        Return your answer as a JSON object with the following structure:
+        {{
+          "contains_waste": true/false,
+          "confidence": 0-100,
+          "reasoning": "brief explanation",
+          "short_description": "concise description (max 8 words)",
+          "full_description": "detailed description of what you see in the image (2-3 sentences)"
+        }}
+        """
+
+
+DETAIL_PROMPT = f"""
+        Analyze the waste/garbage in this image.
+
+        Please determine:
+        1. The main type of waste visible (e.g., Plastic, Paper, Glass, Metal, Organic, Electronic, Construction, Mixed)
+        2. Severity assessment (scale 1-10, where 10 is most severe)
+        3. Priority level (low, medium, high, critical)
+        4. Environmental impact assessment
+        5. Estimated volume
+        6. Any safety concerns
+        7. Full description of the waste scenario (2-3 sentences, detailed)
+{SEVERITY_FACTORS}
+        Structure your response as a JSON object with the following fields:
+        - waste_type: Main type of waste
+        - severity_score: Numeric score from 1-10
+        - priority_level: "low", "medium", "high", or "critical"
+        - environmental_impact: Brief description of environmental impact
+        - estimated_volume: Estimated volume in cubic meters
+        - safety_concerns: Any safety concerns identified
+        - analysis_notes: Detailed analysis and recommendations
+        - full_description: Detailed description of the waste scenario (2-3 sentences)
+
+        Keep your analysis focused, practical, and action-oriented.
+        """
+
+
+def combined_prompt(location: Dict[str, Any], description: str) -> str:
+    return f"""
+        Carefully examine this image. First determine if it shows improper waste disposal, garbage, trash, or discarded materials in the environment, then, only if it does, analyze the waste.
+
+        Location: Latitude {location.get('lat')}, Longitude {location.get('lng')}
+        User Description: {description}
+{DETECTION_CRITERIA}
+        If the image contains waste, also determine:
+        1. The main type of waste visible (e.g., Plastic, Paper, Glass, Metal, Organic, Electronic, Construction, Mixed)
+        2. Severity assessment (scale 1-10, where 10 is most severe)
+        3. Priority level (low, medium, high, critical)
+        4. Environmental impact assessment
+        5. Estimated volume
+        6. Any safety concerns
+{SEVERITY_FACTORS}
+        Return your answer as a single JSON object with the following structure:
+        {{
+          "contains_waste": true/false,
+          "confidence": 0-100,
+          "reasoning": "brief explanation",
+          "short_description": "concise description (max 8 words)",
+          "full_description": "detailed description of what you see in the image (2-3 sentences)",
+          "waste_type": "main type of waste, or null if no waste",
+          "severity_score": "numeric score from 1-10, or null if no waste",
+          "priority_level": "low, medium, high or critical, or null if no waste",
+          "environmental_impact": "brief description of environmental impact, or null if no waste",
+          "estimated_volume": "estimated volume in cubic meters, or null if no waste",
+          "safety_concerns": "any safety concerns identified, or null if no waste",
+          "analysis_notes": "detailed analysis and recommendations, or null if no waste"
+        }}
+
+        Keep your analysis focused, practical, and action-oriented.
+        """
+
+
+def invoke_nova(client, model_id: str, prompt: str, image_base64: str, image_format: str, max_new_tokens: int,
+                usage: ModelUsage) -> Optional[str]:
+    """Send one prompt with the image to Nova; returns the answer text (None if empty)"""
+    started = time.perf_counter()
+    response = client.invoke_model(
+        modelId=model_id,
+        contentType="application/json",
+        accept="application/json",
+        body=json.dumps({
+            "inferenceConfig": {
+                "max_new_tokens": max_new_tokens,
+                "temperature": 0.1,
+                "top_p": 0.9
+            },
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "text": prompt
+                        },
+                        {
+                            "image": {
+                                "format": image_format,
+                                "source": {
+                                    "bytes": image_base64
+                                }
+                            }
+                        }
+                    ]
+                }
+            ]
+        })
+    )
+
+    # Parse response
+    result = json.loads(response['body'].read())
+    usage.calls += 1
+    usage.latency_ms += (time.perf_counter() - started) * 1000
+    usage.input_tokens += result.get('usage', {}).get('inputTokens', 0)
+    usage.output_tokens += result.get('usage', {}).get('outputTokens', 0)
+
+    # Extract text from Nova Pro response format
+    if 'output' in result and 'message' in result['output']:
+        message = result['output']['message']
+        if 'content' in message and len(message['content']) > 0:
+            return message['content'][0].get('text', '')
+        logger.error("No content found in Bedrock response message")
+        return None
+    logger.error(f"Unexpected Bedrock response format: {result}")
+    return None
+
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    The JSON object in a model answer, or None if the answer has no JSON at all.
+    An object that doesn't parse (a truncated or malformed answer) raises AnalysisFailed
+    rather than falling back to the defaults, which would store a made-up analysis.
+    """
+    start = text.find('{')
+    if start < 0:
+        return None
+    # Up to the last closing brace; a truncated answer has none
+    end = text.rfind('}')
+    try:
+        return json.loads(text[start:end + 1] if end > start else text[start:])
+    except json.JSONDecodeError as e:
+        logger.warning(f"Unparseable JSON in model answer: {e}")
+        raise AnalysisFailed(f"Model returned malformed JSON: {e}") from e
+
+
+def _descriptions(waste_check: Dict[str, Any]) -> Tuple[str, str]:
+    """Short description capped at 8 words and a full description with a fallback"""
+    short_description = waste_check.get("short_description") or ""
+    if len(short_description.split()) > 8:
+        short_description = " ".join(short_description.split()[:8])
+
+    full_description = waste_check.get("full_description") or ""
+    if not full_description:
+        full_description = f"{waste_check.get('reasoning', 'No details available.')} {short_description}"
+    return short_description, full_description
+
+
+def _not_garbage(waste_check: Dict[str, Any], short_description: str, full_description: str) -> Dict[str, Any]:
+    return {
+        "waste_type": "Not Garbage",
+        "severity_score": 1,
+        "priority_level": "low",
+        "environmental_impact": "None - not waste material",
+        "estimated_volume": "0",
+        "safety_concerns": "None",
+        "analysis_notes": f"This image does not appear to contain waste material. {waste_check.get('reasoning', '')}",
+        "waste_detection_confidence": waste_check.get("confidence", 90),
+        "short_description": short_description or "Not garbage",
+        "full_description": full_description
+    }
+
+
+def _waste_analysis(details: Optional[Dict[str, Any]], waste_check: Dict[str, Any],
+                    short_description: str, full_description: str) -> Dict[str, Any]:
+    """Detail fields with the defaults used when the model's answer can't be parsed"""
+    analysis_result = {
+        "waste_type": "Mixed",
+        "severity_score": 5,
+        "priority_level": "medium",
+        "environmental_impact": "Unable to determine from image",
+        "estimated_volume": "Unknown",
+        "safety_concerns": "Unable to determine from image",
+        "analysis_notes": "Analysis completed with limited details",
+        "full_description": full_description
+    }
+    if details:
+        analysis_result.update({key: value for key, value in details.items() if value is not None})
+
+    # Add the waste detection confidence and short description
+    analysis_result["waste_detection_confidence"] = waste_check.get("confidence", 100)
+    analysis_result["short_description"] = short_description or f"{analysis_result['waste_type']} waste, {analysis_result['priority_level']} priority"
+
+    # Ensure full_description exists in the result
+    if not analysis_result.get("full_description"):
+        analysis_result["full_description"] = full_description
+    return analysis_result
+
+
+def analyze_two_pass(client, model_id: str, image_base64: str, image_format: str, location: Dict[str, Any],
+                     description: str, usage: ModelUsage) -> Dict[str, Any]:
+    """Detection prompt, then the detail prompt for images that contain waste"""
+    initial_response = invoke_nova(
+        client, model_id, detection_prompt(location, description), image_base64, image_format, 1000, usage
+    )
+    if not initial_response:
+        raise AnalysisFailed("Failed to analyze image")
+
+    waste_check = extract_json(initial_response) or {
+        "contains_waste": False,
+        "confidence": 75,
+        "reasoning": "Failed to parse response",
+        "short_description": "Unable to determine content",
+        "full_description": "Unable to generate a detailed description."
+    }
+    short_description, full_description = _descriptions(waste_check)
+
+    # If the image doesn't contain waste, return minimal analysis
+    if not waste_check.get("contains_waste", False):
+        return _not_garbage(waste_check, short_description, full_description)
+
+    detailed_response = invoke_nova(client, model_id, DETAIL_PROMPT, image_base64, image_format, 1500, usage)
+    if not detailed_response:
+        raise AnalysisFailed("Failed to analyze waste details")
+
+    return _waste_analysis(extract_json(detailed_response), waste_check, short_description, full_description)
+
+
+def analyze_single_pass(client, model_id: str, image_base64: str, image_format: str, location: Dict[str, Any],
+                        description: str, usage: ModelUsage) -> Dict[str, Any]:
+    """One prompt answering detection and detail fields together"""
+    response = invoke_nova(
+        client, model_id, combined_prompt(location, description), image_base64, image_format, 1500, usage
+    )
+    if not response:
+        raise AnalysisFailed("Failed to analyze image")
+
+    answer = extract_json(response) or {
+        "contains_waste": False,
+        "confidence": 75,
+        "reasoning": "Failed to parse response",
+        "short_description": "Unable to determine content",
+        "full_description": "Unable to generate a detailed description."
+    }
+    short_description, full_description = _descriptions(answer)
+
+    if not answer.get("contains_waste", False):
+        return _not_garbage(answer, short_description, full_description)
+
+    details = {
+        key: answer.get(key) for key in (
+            "waste_type", "severity_score", "priority_level", "environmental_impact",
+            "estimated_volume", "safety_concerns", "analysis_notes"
+        )
+    }
+    return _waste_analysis(details, answer, short_description, full_description)
+
+
+def analyze_waste(client, model_id: str, image_base64: str, location: Dict[str, Any], description: str,
+                  mode: Optional[str] = None, image_format: str = 'jpeg') -> Tuple[Dict[str, Any], ModelUsage]:
+    """
+    Analyze a waste image in the given mode (default WASTE_ANALYSIS_MODE).
+    image_format is the encoding of image_base64 ('jpeg' or 'webp').
+
+    Returns:
+        Tuple of (analysis dict, ModelUsage)
+
+    Raises:
+        AnalysisFailed: The model returned no answer, or a malformed JSON answer
+    """
+    mode = mode or WASTE_ANALYSIS_MODE
+    if mode not in WASTE_ANALYSIS_MODES:
+        raise ValueError(f"Unknown analysis mode '{mode}', expected one of {', '.join(WASTE_ANALYSIS_MODES)}")
+
+    usage = ModelUsage()
+    analyze = analyze_single_pass if mode == 'single_pass' else analyze_two_pass
+    return analyze(client, model_id, image_base64, image_format, location, description, usage), usage